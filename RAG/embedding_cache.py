@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from backend.file_lock import file_lock
+
+'''
+Content-addressed cache for text embeddings.
+
+Vectors are keyed by sha1(text) inside a per-model directory:
+
+    <root>/<model>/vectors.f32   float32 matrix, memory-mapped, one row per text
+    <root>/<model>/index.json    {"dim": ..., "rows": {sha1: row}}
+
+Recently used vectors are also kept in an in-memory LRU. All texts missing
+from both are encoded with a single `encode(list_of_texts)` call.
+
+Several processes can share a root. Appends hold an exclusive flock on
+<root>/<model>/index.lock while they re-read index.json, write their rows
+after the ones already on disk and replace the index, so no process
+overwrites rows another one added.
+'''
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, encode: Callable[[List[str]], np.ndarray], root: Optional[str] = None, max_memory_entries: int = 20_000):
+        self.model_name = model_name
+        self.encode = encode
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.encode_calls = 0
+
+        self._memory: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._rows: Dict[str, int] = {}
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+        self.path = None
+        if root:
+            slug = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in model_name)
+            self.path = os.path.join(root, slug)
+            os.makedirs(self.path, exist_ok=True)
+            self._load()
+
+    @property
+    def _index_file(self) -> str:
+        return os.path.join(self.path, 'index.json')
+
+    @property
+    def _lock_file(self) -> str:
+        return os.path.join(self.path, 'index.lock')
+
+    @property
+    def _vectors_file(self) -> str:
+        return os.path.join(self.path, 'vectors.f32')
+
+    def _load(self):
+        if not os.path.exists(self._index_file):
+            return
+
+        with open(self._index_file) as f:
+            index = json.load(f)
+
+        self._dim = index['dim']
+        self._rows = index['rows']
+
+        # the vectors file only ever grows, a mapping that covers every row stays valid
+        if self._vectors is None or len(self._rows) > self._vectors.shape[0]:
+            self._vectors = None
+            self._map(len(self._rows))
+
+    def _map(self, rows: int):
+        # capacity grows by doubling so appends do not remap on every batch
+        capacity = max(rows, 1)
+        size = os.path.getsize(self._vectors_file) if os.path.exists(self._vectors_file) else 0
+        if size < capacity * self._dim * 4:
+            capacity = max(capacity, 2 * size // (self._dim * 4), 1024)
+            with open(self._vectors_file, 'ab') as f:
+                f.truncate(capacity * self._dim * 4)
+        else:
+            capacity = size // (self._dim * 4)
+
+        self._vectors = np.memmap(self._vectors_file, dtype=np.float32, mode='r+', shape=(capacity, self._dim))
+
+    def _persist(self, keys: List[str], vectors: np.ndarray):
+        with file_lock(self._lock_file):
+            # other processes may have appended since this one last read the index
+            self._load()
+
+            fresh = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not fresh:
+                return
+
+            keys = [keys[i] for i in fresh]
+            vectors = vectors[fresh]
+            start = len(self._rows)
+
+            if self._vectors is None or start + len(keys) > self._vectors.shape[0]:
+                self._vectors = None
+                self._map(start + len(keys))
+
+            self._vectors[start:start + len(keys)] = vectors
+            self._vectors.flush()
+
+            for i, key in enumerate(keys):
+                self._rows[key] = start + i
+
+            # vectors are flushed first, so a crash here only loses the newest rows
+            tmp = f'{self._index_file}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'model': self.model_name, 'dim': self._dim, 'rows': self._rows}, f)
+            os.replace(tmp, self._index_file)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> np.ndarray:
+        '''Embeddings for `texts` as a (len(texts), dim) float32 matrix, in order.'''
+        keys = [text_key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    found[key] = vector
+                elif key in self._rows:
+                    self.disk_hits += 1
+                    found[key] = np.array(self._vectors[self._rows[key]])
+                    self._remember(key, found[key])
+                else:
+                    missing[key] = text
+
+        if missing:
+            encoded = np.asarray(self.encode(list(missing.values())), dtype=np.float32)
+
+            with self._lock:
+                self.misses += len(missing)
+                self.encode_calls += 1
+                self._dim = self._dim or encoded.shape[1]
+
+                new_keys = [key for key in missing if key not in self._rows]
+                if self.path and new_keys:
+                    positions = {key: i for i, key in enumerate(missing)}
+                    self._persist(new_keys, encoded[[positions[key] for key in new_keys]])
+
+                for key, vector in zip(missing, encoded):
+                    found[key] = vector
+                    self._remember(key, vector)
+
+        if not keys:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+
+        return np.vstack([found[key] for key in keys])
+
+    def get(self, text: str) -> np.ndarray:
+        return self.get_many([text])[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'encode_calls': self.encode_calls,
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self._rows),
+            }
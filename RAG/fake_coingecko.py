@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+'''
+Local stand-in for the CoinGecko v3 API, replaying recorded responses.
+
+    python RAG/fake_coingecko.py --port 8768 --latency 0.2 --synthetic 500
+    COINGECKO_API_URL=http://127.0.0.1:8768/api/v3 python test_portfolio.py
+
+Serves /coins/markets and /coins/{id} from fixtures/coingecko.json, plus
+`synthetic` generated coins (coin-0, coin-1, ...) for universe-sized runs.
+With `rate_limit` set, more than that many requests within one second get a
+429 with Retry-After, like the public API. `GET /__stats` returns counters.
+'''
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'coingecko.json')
+
+SYNTHETIC_CATEGORIES = ['Layer 1 (L1)', 'Decentralized Finance (DeFi)', 'Gaming (GameFi)', 'Meme', 'Ethereum Ecosystem', 'Solana Ecosystem']
+
+
+def synthetic_coin(i: int) -> Dict:
+    price = round(0.01 * (i % 997 + 1), 4)
+    return {
+        'id': f'coin-{i}', 'symbol': f'c{i}', 'name': f'Coin {i}',
+        'categories': [SYNTHETIC_CATEGORIES[i % len(SYNTHETIC_CATEGORIES)], SYNTHETIC_CATEGORIES[(i * 7) % len(SYNTHETIC_CATEGORIES)]],
+        'description': {'en': f'Coin {i} is a synthetic token.'},
+        'links': {'homepage': [f'https://coin-{i}.example', ''], 'blockchain_site': ['']},
+        'genesis_date': None, 'market_cap_rank': 100 + i,
+        'market_data': {
+            'current_price': {'usd': price}, 'total_volume': {'usd': 1000.0 * i},
+            'market_cap': {'usd': 100000.0 * i}, 'circulating_supply': 1e6 + i,
+            'price_change_24h': 0.001 * i, 'price_change_percentage_24h': 0.1,
+        },
+    }
+
+
+def market_row(coin: Dict) -> Dict:
+    m = coin['market_data']
+    return {
+        'id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name'],
+        'current_price': m['current_price']['usd'], 'market_cap': m['market_cap']['usd'],
+        'market_cap_rank': coin.get('market_cap_rank'), 'total_volume': m['total_volume']['usd'],
+        'price_change_24h': m['price_change_24h'], 'price_change_percentage_24h': m['price_change_percentage_24h'],
+        'circulating_supply': m['circulating_supply'],
+    }
+
+
+class FakeCoinGeckoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixture: str = FIXTURE, synthetic: int = 0, latency: float = 0.0, rate_limit: int = 0):
+        super().__init__(address, FakeCoinGeckoHandler)
+        with open(fixture) as f:
+            recorded = json.load(f)
+
+        self.markets = {row['id']: row for row in recorded['markets']}
+        self.coins = dict(recorded['coins'])
+        for i in range(synthetic):
+            coin = synthetic_coin(i)
+            self.coins[coin['id']] = coin
+            self.markets[coin['id']] = market_row(coin)
+
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests = {'markets': 0, 'coins': 0, 'rate_limited': 0}
+        self.window = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/v3'
+
+    def start(self) -> 'FakeCoinGeckoServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeCoinGeckoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        path = parts.path.rstrip('/')
+
+        if path == '/__stats':
+            with self.server.lock:
+                return self._reply(200, dict(self.server.requests))
+
+        if self._rate_limited():
+            return self._reply(429, {'status': {'error_code': 429, 'error_message': "You've exceeded the Rate Limit."}}, {'Retry-After': '1'})
+
+        time.sleep(self.server.latency)
+
+        if path == '/api/v3/coins/markets':
+            return self._reply(200, self.markets(query))
+
+        if path.startswith('/api/v3/coins/'):
+            return self.coin(path.rsplit('/', 1)[1])
+
+        self._reply(404, {'error': 'Not found'})
+
+    def _rate_limited(self) -> bool:
+        server = self.server
+        with server.lock:
+            if not server.rate_limit:
+                return False
+
+            now = time.monotonic()
+            server.window = [t for t in server.window if now - t < 1.0]
+            if len(server.window) >= server.rate_limit:
+                server.requests['rate_limited'] += 1
+                return True
+
+            server.window.append(now)
+            return False
+
+    def markets(self, query: Dict) -> List[Dict]:
+        with self.server.lock:
+            self.server.requests['markets'] += 1
+
+        ids = [i for i in query.get('ids', '').split(',') if i]
+        per_page = int(query.get('per_page', 100))
+        page = int(query.get('page', 1))
+
+        rows = [self.server.markets[i] for i in ids if i in self.server.markets]
+        rows.sort(key=lambda row: row.get('market_cap_rank') or float('inf'))
+
+        return rows[(page - 1) * per_page:page * per_page]
+
+    def coin(self, coin_id: str):
+        with self.server.lock:
+            self.server.requests['coins'] += 1
+
+        if coin_id not in self.server.coins:
+            return self._reply(404, {'error': 'coin not found'})
+
+        self._reply(200, self.server.coins[coin_id])
+
+    def _reply(self, status: int, payload, headers: Dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(host: str = '127.0.0.1', port: int = 0, **kwargs) -> FakeCoinGeckoServer:
+    return FakeCoinGeckoServer((host, port), **kwargs).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake CoinGecko API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8768)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--synthetic', type=int, default=0)
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second before 429s')
+    args = parser.parse_args()
+
+    server = FakeCoinGeckoServer(
+        (args.host, args.port),
+        synthetic=args.synthetic,
+        latency=args.latency,
+        rate_limit=args.rate_limit
+    )
+    print(f'Fake CoinGecko listening on {server.url}')
+    server.serve_forever()
@@ -1,28 +1,107 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
 
 from entities.Token import Token
+from entities.Portfolio import Portfolio
+from RAG.token_store import TokenStore, MARKET_FIELDS
+from RAG.sector_classifier import get_classifier
+
+# point at RAG/fake_coingecko.py to run offline
+COINGECKO_API = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
+
+# public API allowance; the bucket holds COINGECKO_BURST calls and refills at this rate
+COINGECKO_CALLS_PER_MINUTE = float(os.getenv("COINGECKO_CALLS_PER_MINUTE", 30))
+COINGECKO_BURST = int(os.getenv("COINGECKO_BURST", 5))
+COINGECKO_CONCURRENCY = int(os.getenv("COINGECKO_CONCURRENCY", 4))
+COINGECKO_TIMEOUT = float(os.getenv("COINGECKO_TIMEOUT", 15))
+
+# snapshot of token data reused across runs, see RAG/token_store.py
+TOKEN_STORE_PATH = os.getenv("TOKEN_STORE_PATH") or os.path.join(tempfile.gettempdir(), "pocketbroker_tokens.sqlite3")
+
+# /coins/markets returns at most 250 rows per page
+MARKETS_PAGE_SIZE = 250
+
+DETAIL_PARAMS = {
+    "localization": "false",
+    "tickers": "false",
+    "market_data": "true",
+    "community_data": "false",
+    "developer_data": "false",
+    "sparkline": "false"
+}
+
+
+class TokenBucket:
+    """Blocks callers so that at most `capacity` calls burst and `rate` calls per second follow."""
+
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            self.sleep(wait)
 
-COINGECKO_API = "https://api.coingecko.com/api/v3"
+    def penalize(self, seconds: float):
+        """Drain the bucket for `seconds` after the server answered 429."""
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=COINGECKO_CONCURRENCY))
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=COINGECKO_CONCURRENCY))
+
+bucket = TokenBucket(COINGECKO_CALLS_PER_MINUTE / 60, COINGECKO_BURST)
+
+def coingecko_get(path: str, params: Dict, max_retries: int = 3) -> requests.Response:
+    """GET on the shared session, paced by the token bucket and retried on 429."""
+    for attempt in range(max_retries + 1):
+        bucket.acquire()
+        resp = session.get(f"{COINGECKO_API}{path}", params=params, timeout=COINGECKO_TIMEOUT)
+
+        if resp.status_code != 429 or attempt == max_retries:
+            return resp
+
+        bucket.penalize(float(resp.headers.get("Retry-After") or 60))
+
+    return resp
 
 def fetch_token_from_coingecko(coin_id: str, holding_amount: float = 0.0) -> Optional[Token]:
-    url = f"{COINGECKO_API}/coins/{coin_id}"
-    params = {
-        "localization": "false",
-        "tickers": "false",
-        "market_data": "true",
-        "community_data": "false",
-        "developer_data": "false",
-        "sparkline": "false"
-    }
-    resp = requests.get(url, params=params)
+    resp = coingecko_get(f"/coins/{coin_id}", DETAIL_PARAMS)
     if resp.status_code != 200:
         print(f"Error fetching {coin_id}: {resp.text}")
         return None
-    
-    data = resp.json()
+
+    return token_from_details(resp.json(), holding_amount)
+
+def token_from_details(data: Dict, holding_amount: float = 0.0) -> Token:
+    """Token from a /coins/{id} response, market data and metadata."""
     m = data["market_data"]
-    
+
     token = Token(
         symbol=data["symbol"].upper(),
         name=data["name"],
@@ -35,13 +114,19 @@ def fetch_token_from_coingecko(coin_id: str, holding_amount: float = 0.0) -> Opt
         rank=data.get("market_cap_rank", -1),
         holding_amount=holding_amount,
     )
-    
+
+    apply_coin_details(token, data)
+
+    return token
+
+def apply_coin_details(token: Token, data: Dict):
+    """Sector and metadata from a /coins/{id} response."""
     # classification from categories
     categories = data.get("categories", [])
     if token.is_stablecoin is False:
         if categories:
             token.sector = map_to_sector(categories, token.symbol)
-    
+
     homepage_list = data.get("links", {}).get("homepage") or []
     blockchain_list = data.get("links", {}).get("blockchain_site") or []
 
@@ -52,29 +137,115 @@ def fetch_token_from_coingecko(coin_id: str, holding_amount: float = 0.0) -> Opt
         "genesis_date": data.get("genesis_date")
     }
 
-    return token
+def token_from_market(row: Dict, holding_amount: float = 0.0) -> Token:
+    """Token from one /coins/markets row (market fields only)."""
+    return Token(
+        symbol=row["symbol"].upper(),
+        name=row["name"],
+        price=row["current_price"],
+        volume_24h=row["total_volume"],
+        market_cap=row["market_cap"],
+        circulating_supply=row.get("circulating_supply") or 0.0,
+        change_24h=row["price_change_24h"],
+        change_percent_24h=row["price_change_percentage_24h"],
+        rank=row.get("market_cap_rank") or -1,
+        holding_amount=holding_amount,
+    )
+
+def fetch_markets(coin_ids: List[str]) -> Dict[str, Dict]:
+    """Market rows for all ids, MARKETS_PAGE_SIZE ids per /coins/markets call."""
+    chunks = [coin_ids[i:i + MARKETS_PAGE_SIZE] for i in range(0, len(coin_ids), MARKETS_PAGE_SIZE)]
+
+    def fetch(chunk: List[str]) -> List[Dict]:
+        resp = coingecko_get("/coins/markets", {
+            "vs_currency": "usd",
+            "ids": ",".join(chunk),
+            "per_page": MARKETS_PAGE_SIZE,
+            "page": 1,
+            "sparkline": "false",
+        })
+        if resp.status_code != 200:
+            print(f"Error fetching markets: {resp.text}")
+            return []
+        return resp.json()
+
+    with ThreadPoolExecutor(max_workers=COINGECKO_CONCURRENCY) as executor:
+        return {row["id"]: row for rows in executor.map(fetch, chunks) for row in rows}
+
+def fetch_coin_details(coin_ids: List[str]) -> Dict[str, Dict]:
+    """/coins/{id} responses for the ids, COINGECKO_CONCURRENCY at a time; failures are left out."""
+    def fetch(coin_id: str) -> Optional[Dict]:
+        resp = coingecko_get(f"/coins/{coin_id}", DETAIL_PARAMS)
+        if resp.status_code != 200:
+            print(f"Error fetching {coin_id}: {resp.text}")
+            return None
+        return resp.json()
+
+    with ThreadPoolExecutor(max_workers=COINGECKO_CONCURRENCY) as executor:
+        return {coin_id: data for coin_id, data in zip(coin_ids, executor.map(fetch, coin_ids)) if data is not None}
+
+def fetch_tokens_from_coingecko(coin_ids: List[str], holdings: Optional[Dict[str, float]] = None, with_details: bool = True) -> List[Optional[Token]]:
+    """
+    Bulk counterpart of fetch_token_from_coingecko. Market data comes from
+    /coins/markets in pages of ids; /coins/{id} is only called for category
+    metadata when with_details is set. Returns Tokens in the order of
+    coin_ids, None for ids CoinGecko does not know.
+    """
+    holdings = holdings or {}
+    unique = list(dict.fromkeys(coin_ids))
+
+    markets = fetch_markets(unique)
+    details = fetch_coin_details([i for i in unique if i in markets]) if with_details else {}
+
+    tokens = []
+    for coin_id in coin_ids:
+        if coin_id not in markets:
+            tokens.append(None)
+            continue
+
+        token = token_from_market(markets[coin_id], holdings.get(coin_id, 0.0))
+        if coin_id in details:
+            apply_coin_details(token, details[coin_id])
+        tokens.append(token)
+
+    return tokens
+
+_token_store = None
+
+def get_token_store() -> TokenStore:
+    global _token_store
+    if _token_store is None:
+        _token_store = TokenStore(TOKEN_STORE_PATH)
+    return _token_store
+
+def sync_tokens(coin_ids: List[str], holdings: Optional[Dict[str, float]] = None, store: Optional[TokenStore] = None, offline: bool = False) -> List[Optional[Token]]:
+    """
+    Like fetch_tokens_from_coingecko, but only refetches what the snapshot
+    store considers stale: /coins/{id} for ids with expired metadata (it
+    carries market data too), /coins/markets for the rest with expired
+    prices. offline=True serves the snapshot without any network call.
+    """
+    store = store or get_token_store()
+
+    if not offline:
+        market_ids, detail_ids = store.stale(coin_ids)
+
+        details = fetch_coin_details(detail_ids) if detail_ids else {}
+        if details:
+            store.put_tokens({coin_id: token_from_details(data) for coin_id, data in details.items()})
+
+        market_ids = [coin_id for coin_id in market_ids if coin_id not in details]
+        markets = fetch_markets(market_ids) if market_ids else {}
+        if markets:
+            store.put_tokens({coin_id: token_from_market(row) for coin_id, row in markets.items()}, MARKET_FIELDS)
+
+    return store.load(coin_ids, holdings)
+
+def load_portfolio(holdings: Dict[str, float], offline: bool = False, store: Optional[TokenStore] = None) -> Portfolio:
+    """Portfolio of coin id -> amount held; ids without data are left out."""
+    tokens = sync_tokens(list(holdings), holdings, store=store, offline=offline)
+    return Portfolio([token for token in tokens if token is not None])
 
 def map_to_sector(tags, symbol):
-    SECTOR_MAP = {
-        "Layer 1": "Layer1",
-        "L1": "Layer1",
-        "Smart Contract Platform": "Layer1",
-        "Layer 2": "Layer2",
-        "L2": "Layer2",
-        "DeFi": "DeFi",
-        "Lending/Borrowing": "DeFi",
-        "DEX": "DeFi",
-        "Gaming": "Gaming",
-        "GameFi": "Gaming",
-        "NFT": "Gaming",
-        "Meme": "Memecoin",
-    }
-    
-    if symbol.upper() in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
-        return "Stablecoin"
-    
-    for tag in tags:
-        for key, sector in SECTOR_MAP.items():
-            if key.lower() in tag.lower():
-                return sector
-    return "Noname"
\ No newline at end of file
+    # keywords, priorities and stablecoins live in RAG/sectors.yaml
+    return get_classifier().classify(tags, symbol)
\ No newline at end of file
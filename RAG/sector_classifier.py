@@ -0,0 +1,83 @@
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import yaml
+
+'''
+Token sector classification from CoinGecko categories, configured by
+RAG/sectors.yaml (or SECTORS_FILE).
+
+All keywords are compiled into one regex. The alternation sits inside a
+lookahead so finditer reports a match at every position where any keyword
+starts, and within one position the alternation tries keywords in priority
+order; the lowest keyword index over all positions is therefore the
+highest-priority keyword the category contains, exactly what a scan of
+`keyword in category` in priority order finds. Results are memoized per
+category and per category tuple.
+'''
+
+SECTORS_FILE = os.getenv('SECTORS_FILE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sectors.yaml')
+
+
+def load_config(path: str = SECTORS_FILE) -> Dict:
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+class SectorClassifier:
+    def __init__(self, keywords: Dict[str, str], stablecoins: Iterable[str] = (), default: str = 'Noname', cache_size: int = 65536):
+        self.keywords = [key.lower() for key in keywords]
+        self.sectors = list(keywords.values())
+        self.stablecoins = frozenset(symbol.upper() for symbol in stablecoins)
+        self.default = default
+
+        # one group per keyword, group number - 1 is the keyword's priority
+        self.pattern = re.compile('(?=' + '|'.join(f'({re.escape(key)})' for key in self.keywords) + ')')
+
+        self._priority = lru_cache(maxsize=cache_size)(self._category_priority)
+        self._classify = lru_cache(maxsize=cache_size)(self._classify_categories)
+
+    @classmethod
+    def from_yaml(cls, path: str = SECTORS_FILE) -> 'SectorClassifier':
+        config = load_config(path)
+        return cls(config['keywords'], config.get('stablecoins', ()), config.get('default', 'Noname'))
+
+    def _category_priority(self, category: str) -> Optional[int]:
+        best = None
+        for match in self.pattern.finditer(category.lower()):
+            priority = match.lastindex - 1
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return best
+
+    def _classify_categories(self, categories: tuple) -> str:
+        for category in categories:
+            priority = self._priority(category)
+            if priority is not None:
+                return self.sectors[priority]
+        return self.default
+
+    def classify(self, categories: Sequence[str], symbol: str) -> str:
+        if symbol.upper() in self.stablecoins:
+            return 'Stablecoin'
+        return self._classify(tuple(categories))
+
+    def classify_many(self, categories: Sequence[Sequence[str]], symbols: Sequence[str]) -> List[str]:
+        '''classify() for many tokens; every distinct category is matched once.'''
+        return [self.classify(tags, symbol) for tags, symbol in zip(categories, symbols)]
+
+    def cache_info(self) -> Dict:
+        return {'categories': self._priority.cache_info()._asdict(), 'category_tuples': self._classify.cache_info()._asdict()}
+
+
+_classifier: Optional[SectorClassifier] = None
+
+def get_classifier() -> SectorClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = SectorClassifier.from_yaml()
+    return _classifier
@@ -0,0 +1,256 @@
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+'''
+Cosine similarity indexes over token vectors.
+
+ExactIndex scores every vector with one matrix-vector product and selects the
+top k with argpartition. IVFIndex clusters the vectors with spherical k-means
+and only scores the `nprobe` clusters closest to the query, which trades a
+little recall for far fewer dot products on large universes. Both keep ids
+alongside the rows, support incremental add/remove and save()/load_index()
+via npz.
+
+    index = build_index(ids, vectors)
+    index.search(query, k=5, exclude={'BTC'})  # [(id, score), ...]
+'''
+
+# below this many vectors the exact scan is already fast enough
+EXACT_MAX_SIZE = 20_000
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    '''Positions of the k highest scores, best first.'''
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best], kind='stable')]
+
+
+class ExactIndex:
+    kind = 'exact'
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        self.ids: List[Hashable] = []
+        self._rows: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, id: Hashable) -> bool:
+        return id in self._rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    def add(self, ids: Iterable[Hashable], vectors: np.ndarray):
+        ids = list(ids)
+        vectors = normalize(vectors).reshape(len(ids), self.dim)
+
+        # an id that is already indexed gets its vector replaced
+        fresh = []
+        for id, vector in zip(ids, vectors):
+            if id in self._rows:
+                self._replace(self._rows[id], vector)
+            else:
+                fresh.append((id, vector))
+
+        if not fresh:
+            return
+
+        needed = self._size + len(fresh)
+        if needed > len(self._vectors):
+            grown = np.zeros((max(needed, 2 * len(self._vectors), 64), self.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+
+        start = self._size
+        self._vectors[start:needed] = np.stack([vector for _, vector in fresh])
+        for row, (id, _) in enumerate(fresh, start):
+            self._rows[id] = row
+            self.ids.append(id)
+        self._size = needed
+        self._added(np.arange(start, needed))
+
+    def remove(self, ids: Iterable[Hashable]):
+        for id in ids:
+            row = self._rows.pop(id, None)
+            if row is None:
+                continue
+
+            # move the last row into the hole so the matrix stays dense
+            last = self._size - 1
+            self._removed(row)
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self.ids[row] = self.ids[last]
+                self._rows[self.ids[row]] = row
+                self._moved(last, row)
+            self.ids.pop()
+            self._size -= 1
+
+    def search(self, query: np.ndarray, k: int = 5, exclude: Optional[Set[Hashable]] = None) -> List[Tuple[Hashable, float]]:
+        query = normalize(query).reshape(self.dim)
+        if not self._size:
+            return []
+
+        rows = self._candidates(query)
+
+        exclude = exclude or set()
+        scores = self._vectors[rows] @ query if rows is not None else self.vectors @ query
+        best = top_k(scores, k + len(exclude))
+
+        results = []
+        for position in best:
+            row = rows[position] if rows is not None else position
+            if self.ids[row] in exclude:
+                continue
+            results.append((self.ids[row], float(scores[position])))
+            if len(results) >= k:
+                break
+        return results
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        # None means every row
+        return None
+
+    def _replace(self, row: int, vector: np.ndarray):
+        self._vectors[row] = vector
+
+    def _added(self, rows: np.ndarray):
+        pass
+
+    def _removed(self, row: int):
+        pass
+
+    def _moved(self, old: int, new: int):
+        pass
+
+    def _state(self) -> Dict:
+        return {}
+
+    def save(self, path: str):
+        '''Writes an .npz file; ids are stored as a plain numpy array (str or int).'''
+        np.savez(path, kind=self.kind, ids=np.array(self.ids), vectors=self.vectors, **self._state())
+
+
+class IVFIndex(ExactIndex):
+    '''
+    Inverted-file index: each vector lives in the list of its nearest
+    centroid. Centroids are trained once; later adds are assigned to the
+    existing centroids, so retrain (build_index) after large changes.
+    '''
+    kind = 'ivf'
+
+    def __init__(self, dim: int, centroids: np.ndarray, nprobe: int = 8):
+        super().__init__(dim)
+        self.centroids = normalize(centroids)
+        self.nprobe = nprobe
+        self._assign = np.zeros(0, dtype=np.intp)
+        self._lists: List[Set[int]] = [set() for _ in range(len(self.centroids))]
+        self._arrays: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: Optional[int] = None, nprobe: Optional[int] = None, iterations: int = 10, sample: int = 50_000, seed: int = 0) -> 'IVFIndex':
+        vectors = normalize(vectors)
+        rng = np.random.default_rng(seed)
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+
+        training = vectors[rng.choice(len(vectors), min(sample, len(vectors)), replace=False)]
+        centroids = training[rng.choice(len(training), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assign = np.argmax(training @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, training)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+
+        return cls(vectors.shape[1], centroids, nprobe=nprobe or max(1, nlist // 8))
+
+    def _nearest(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=-1)
+
+    def _added(self, rows: np.ndarray):
+        if len(self._assign) < len(self._vectors):
+            grown = np.zeros(len(self._vectors), dtype=np.intp)
+            grown[:len(self._assign)] = self._assign
+            self._assign = grown
+        for row, cluster in zip(rows.tolist(), self._nearest(self._vectors[rows]).tolist()):
+            self._set_list(row, cluster)
+
+    def _replace(self, row: int, vector: np.ndarray):
+        super()._replace(row, vector)
+        self._removed(row)
+        self._set_list(row, int(self._nearest(vector)))
+
+    def _set_list(self, row: int, cluster: int):
+        self._assign[row] = cluster
+        self._lists[cluster].add(row)
+        self._arrays.pop(cluster, None)
+
+    def _removed(self, row: int):
+        cluster = int(self._assign[row])
+        self._lists[cluster].discard(row)
+        self._arrays.pop(cluster, None)
+
+    def _moved(self, old: int, new: int):
+        cluster = int(self._assign[old])
+        self._lists[cluster].discard(old)
+        self._arrays.pop(cluster, None)
+        self._set_list(new, cluster)
+
+    def _list(self, cluster: int) -> np.ndarray:
+        if cluster not in self._arrays:
+            self._arrays[cluster] = np.fromiter(self._lists[cluster], dtype=np.intp, count=len(self._lists[cluster]))
+        return self._arrays[cluster]
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        probes = top_k(self.centroids @ query, self.nprobe)
+        return np.concatenate([self._list(int(cluster)) for cluster in probes])
+
+    def _state(self) -> Dict:
+        return {'centroids': self.centroids, 'nprobe': self.nprobe}
+
+
+def build_index(ids: Iterable[Hashable], vectors: np.ndarray, kind: str = 'auto', **kwargs) -> ExactIndex:
+    '''vectors is a (len(ids), dim) matrix; kind is "exact", "ivf", or "auto" (ivf above EXACT_MAX_SIZE vectors).'''
+    ids = list(ids)
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    if kind == 'auto':
+        kind = IVFIndex.kind if len(ids) > EXACT_MAX_SIZE else ExactIndex.kind
+
+    if kind == IVFIndex.kind and len(ids):
+        index = IVFIndex.train(vectors, **kwargs)
+    else:
+        index = ExactIndex(vectors.shape[1])
+
+    index.add(ids, vectors)
+    return index
+
+
+def load_index(path: str) -> ExactIndex:
+    data = np.load(path)
+    vectors = data['vectors']
+
+    if str(data['kind']) == IVFIndex.kind:
+        index = IVFIndex(vectors.shape[1], centroids=data['centroids'], nprobe=int(data['nprobe']))
+    else:
+        index = ExactIndex(vectors.shape[1])
+
+    index.add(data['ids'].tolist(), vectors)
+    return index
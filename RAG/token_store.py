@@ -0,0 +1,142 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from entities.Token import Token
+
+'''
+Local snapshot of CoinGecko token data, keyed by coin id.
+
+Each stored field remembers when it was last written. TTL says how long each
+group of fields stays fresh: the MARKET_FIELDS for a minute, the
+DETAIL_FIELDS (categories, links and the sector mapping) for a week. The
+groups follow the CoinGecko call that returns them: /coins/markets answers
+every market field of a coin at once, so a longer TTL on rank or supply
+alone would not save a request. stale() tells the loader which ids need
+/coins/markets and which need the /coins/{id} detail call, so metadata that
+rarely changes is not refetched with every price update. load() rebuilds Tokens from the snapshot
+alone, which is what a warm start with no network uses.
+'''
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# fields refreshed from /coins/markets
+MARKET_FIELDS = ('symbol', 'name', 'price', 'volume_24h', 'market_cap', 'circulating_supply', 'change_24h', 'change_percent_24h', 'rank')
+
+# fields refreshed from /coins/{id}
+DETAIL_FIELDS = ('sector', 'metadata')
+
+# freshness per group of fields, each group is refetched as a whole
+TTL = {
+    'market': MINUTE,
+    'detail': 7 * DAY,
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS token_fields (
+    coin_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (coin_id, field)
+);
+'''
+
+
+class TokenStore:
+    def __init__(self, path: str, ttl: Optional[Dict[str, float]] = None, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = {**TTL, **(ttl or {})}
+        self.clock = clock
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _rows(self, coin_ids: List[str]) -> Dict[str, Dict[str, Tuple[object, float]]]:
+        '''{coin_id: {field: (value, updated_at)}} for the stored ids.'''
+        rows: Dict[str, Dict[str, Tuple[object, float]]] = {}
+        conn = self._connect()
+
+        # stay under SQLite's bound-parameter limit
+        for i in range(0, len(coin_ids), 500):
+            chunk = coin_ids[i:i + 500]
+            query = f'SELECT coin_id, field, value, updated_at FROM token_fields WHERE coin_id IN ({",".join("?" * len(chunk))})'
+            for coin_id, field, value, updated_at in conn.execute(query, chunk):
+                rows.setdefault(coin_id, {})[field] = (json.loads(value), updated_at)
+
+        return rows
+
+    def _put(self, values: Dict[str, Dict[str, object]]):
+        now = self.clock()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO token_fields (coin_id, field, value, updated_at) VALUES (?, ?, ?, ?)',
+                    [
+                        (coin_id, field, json.dumps(value), now)
+                        for coin_id, fields in values.items()
+                        for field, value in fields.items()
+                    ]
+                )
+
+    def put_tokens(self, tokens: Dict[str, Token], fields: Tuple[str, ...] = MARKET_FIELDS + DETAIL_FIELDS):
+        '''Store the given fields of each Token under its coin id.'''
+        self._put({
+            coin_id: {field: getattr(token, field) for field in fields}
+            for coin_id, token in tokens.items()
+        })
+
+    def stale(self, coin_ids: List[str]) -> Tuple[List[str], List[str]]:
+        '''(ids needing market data, ids needing detail data), in input order.'''
+        with self._lock:
+            rows = self._rows(list(dict.fromkeys(coin_ids)))
+
+        now = self.clock()
+
+        def is_stale(coin_id: str, fields: Tuple[str, ...], ttl: float) -> bool:
+            stored = rows.get(coin_id, {})
+            return any(field not in stored or now - stored[field][1] > ttl for field in fields)
+
+        unique = list(dict.fromkeys(coin_ids))
+        return (
+            [coin_id for coin_id in unique if is_stale(coin_id, MARKET_FIELDS, self.ttl['market'])],
+            [coin_id for coin_id in unique if is_stale(coin_id, DETAIL_FIELDS, self.ttl['detail'])],
+        )
+
+    def load(self, coin_ids: List[str], holdings: Optional[Dict[str, float]] = None) -> List[Optional[Token]]:
+        '''Tokens from the snapshot in input order, None for ids without market data. No freshness check.'''
+        holdings = holdings or {}
+        with self._lock:
+            rows = self._rows(list(dict.fromkeys(coin_ids)))
+
+        tokens = []
+        for coin_id in coin_ids:
+            stored = {field: value for field, (value, _) in rows.get(coin_id, {}).items()}
+            if not all(field in stored for field in MARKET_FIELDS):
+                tokens.append(None)
+                continue
+
+            token = Token(**{field: stored[field] for field in MARKET_FIELDS}, holding_amount=holdings.get(coin_id, 0.0))
+            if 'sector' in stored:
+                token.sector = stored['sector']
+            if 'metadata' in stored:
+                token.metadata = stored['metadata']
+            tokens.append(token)
+
+        return tokens
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,294 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from utils import (
+    build_url, build_signed_request, is_private, rate_limiter, rate_limit_wait, rate_limit_error,
+    rate_limit_deadline, NON_IDEMPOTENT_PATHS
+)
+from rate_limiter import RateLimitTimeout
+from transport import should_retry, is_rate_limited, backoff_delay
+from service import (
+    ticker_cache, streamed_prices, order_body, build_portfolio, get_portfolio_pairs,
+    get_speculative_pairs, retrieve_trades_history, pair_registry, PORTFOLIO_DEADLINE
+)
+from orders import plan_orders, apply_response, summarize, check_legs, ORDER_CONCURRENCY
+
+'''
+Non-blocking counterparts of the service.py calls, used by the ASGI app.
+
+Kraken is reached through one pooled httpx.AsyncClient with the same signing,
+rate limit pacing, retry and caching rules as the synchronous transport. The
+trade ledger is SQLite backed and stays synchronous; its sync runs in a worker
+thread.
+'''
+
+
+class AsyncKraken:
+    def __init__(self, pool_size: int = 32, timeout: float = 10.0, max_retries: int = 3, backoff: float = 0.25, max_backoff: float = 4.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout
+        )
+
+    async def request(self, method: str, path: str, query: Optional[dict] = None, body: Optional[dict] = None) -> Tuple[int, Dict]:
+        url, query_str = build_url(path, query)
+        body = dict(body or {})
+        retry_server_errors = path not in NON_IDEMPOTENT_PATHS
+        paced = rate_limiter is not None and is_private(path)
+        attempt = 0
+
+        while True:
+            if paced:
+                try:
+                    await rate_limiter.acquire_async(path, timeout=rate_limit_wait())
+                except RateLimitTimeout as e:
+                    return 429, rate_limit_error(e)
+
+            headers, data = build_signed_request(path, query_str, body)
+
+            try:
+                response = await self.client.request(method, url, headers=headers, content=data)
+            except httpx.TransportError:
+                if not retry_server_errors or attempt >= self.max_retries:
+                    raise
+            else:
+                if paced and is_rate_limited(response.content):
+                    rate_limiter.penalize()
+
+                if attempt >= self.max_retries or not should_retry(response.status_code, response.content, retry_server_errors):
+                    return response.status_code, response.json()
+
+            await asyncio.sleep(backoff_delay(attempt, self.backoff, self.max_backoff))
+            attempt += 1
+
+    async def close(self):
+        await self.client.aclose()
+
+
+kraken: Optional[AsyncKraken] = None
+_inflight: Dict[str, asyncio.Future] = {}
+
+def get_kraken() -> AsyncKraken:
+    # created lazily so the client binds to the server's event loop
+    global kraken
+
+    if kraken is None:
+        kraken = AsyncKraken(
+            pool_size=int(os.getenv('KRAKEN_POOL_SIZE', 32)),
+            timeout=float(os.getenv('KRAKEN_TIMEOUT', 10)),
+            max_retries=int(os.getenv('KRAKEN_MAX_RETRIES', 3)),
+            backoff=float(os.getenv('KRAKEN_BACKOFF', 0.25)),
+        )
+
+    return kraken
+
+async def close():
+    global kraken
+
+    if kraken is not None:
+        await kraken.close()
+        kraken = None
+
+async def fetch_asset_info(pairs: List[str]) -> Tuple[Dict, Dict]:
+    status, json_data = await get_kraken().request(
+        method="GET",
+        path="/0/public/Ticker",
+        query={'pair': ",".join(pairs)}
+    )
+
+    if status != 200 or ('error' in json_data and len(json_data['error'])):
+        return None, json_data['error']
+
+    return json_data['result'], None
+
+async def retrieve_asset_info(pair: str) -> Tuple[Dict, Dict]:
+    pairs = [name.strip() for name in pair.split(",") if name.strip()]
+
+    found, missing = ticker_cache.lookup(pairs, pending=_inflight)
+
+    # same single-flight rule as TickerCache.get_many, with futures instead of thread events
+    waiting = [(name, _inflight[name]) for name in missing if name in _inflight]
+    leading = [name for name in missing if name not in _inflight]
+
+    if leading:
+        flight = asyncio.get_running_loop().create_future()
+        for name in leading:
+            _inflight[name] = flight
+
+        try:
+            result, error = await fetch_asset_info(leading)
+            if not error:
+                # matching resolves names through the registry, load it off the event loop
+                await asyncio.to_thread(pair_registry.load)
+            flight.set_result((None, error) if error else (ticker_cache.store(leading, result), None))
+        except Exception as e:
+            flight.set_result((None, [str(e)]))
+        finally:
+            # a cancelled leader must not leave its followers waiting forever
+            if not flight.done():
+                flight.set_result((None, ['Ticker request was cancelled']))
+
+            for name in leading:
+                if _inflight.get(name) is flight:
+                    del _inflight[name]
+
+        # reported pairs no requested name matched come back under their own name
+        matched = flight.result()[0] or {}
+        waiting.extend((name, flight) for name in dict.fromkeys([*leading, *matched]))
+
+    for name, other in waiting:
+        matched, error = await asyncio.shield(other)
+
+        if error:
+            return None, error
+
+        if name in matched:
+            reported, info = matched[name]
+            found[reported] = info
+
+    return found, None
+
+async def retrieve_prices(pairs: List[str]) -> Tuple[Dict, Dict]:
+    '''service.retrieve_prices, with the REST lookups on the shared async client.'''
+    prices = streamed_prices(pairs)
+    missing = [name for name in pairs if name not in prices]
+
+    if not missing:
+        return prices, None
+
+    result, error = await retrieve_asset_info(",".join(missing))
+
+    if error:
+        return None, error
+
+    return {**{name: float(info['c'][0]) for name, info in result.items()}, **prices}, None
+
+async def retrieve_asset_pair_name(symbol1: str, symbol2: str) -> Tuple[Dict, Dict]:
+    await asyncio.to_thread(pair_registry.load)
+    found = pair_registry.find(symbol1, symbol2)
+
+    if found:
+        return found, None
+
+    status, json_data = await get_kraken().request(
+        method="GET",
+        path="/0/public/AssetPairs",
+        query={'pair': f'{symbol1}/{symbol2}'}
+    )
+
+    if status != 200 or not 'result' in json_data:
+        return None, json_data['error']
+
+    return json_data['result'], None
+
+async def retrieve_balance() -> Tuple[Dict, Dict]:
+    status, json_data = await get_kraken().request(
+        method="POST",
+        path="/0/private/Balance"
+    )
+
+    if status != 200 or ('error' in json_data and len(json_data['error'])):
+        return None, json_data['error']
+
+    return json_data['result'], None
+
+async def retrieve_portfolio(deadline: Optional[float] = None) -> Tuple[Dict, Dict]:
+    deadline = deadline if deadline is not None else PORTFOLIO_DEADLINE
+    # calls queued behind the rate limit give up with the portfolio, not after RATE_LIMIT_MAX_WAIT
+    token = rate_limit_deadline.set(time.monotonic() + deadline)
+
+    try:
+        return await asyncio.wait_for(_retrieve_portfolio(), timeout=deadline)
+    except asyncio.TimeoutError:
+        return None, f'Portfolio request exceeded the {deadline}s deadline'
+    finally:
+        rate_limit_deadline.reset(token)
+
+async def _retrieve_portfolio() -> Tuple[Dict, Dict]:
+    # the ledger sync is blocking SQLite work, keep it off the event loop
+    trades_task = asyncio.create_task(asyncio.to_thread(retrieve_trades_history))
+    ticker_task = asyncio.create_task(retrieve_prices(get_speculative_pairs()))
+
+    try:
+        result, error = await retrieve_balance()
+
+        if error:
+            return None, error
+
+        # a due registry refresh is blocking I/O, a fresh registry returns at once
+        await asyncio.to_thread(pair_registry.load)
+        equivalents = get_portfolio_pairs(result)
+
+        prices, error = await ticker_task
+
+        if error:
+            return None, error
+
+        missing = list(dict.fromkeys(pair for pair in equivalents.values() if pair not in prices))
+
+        if missing:
+            missing_prices, error = await retrieve_prices(missing)
+
+            if error:
+                return None, error
+
+            prices = {**prices, **missing_prices}
+
+        trades, error = await trades_task
+
+        if error:
+            return None, error
+    finally:
+        ticker_task.cancel()
+
+    return build_portfolio(result, trades, equivalents, prices), None
+
+async def execute_order(side: str, pair: str, amount: float, order_type: str = 'market', price: Optional[float] = None) -> Tuple[Dict, Dict]:
+    await asyncio.to_thread(pair_registry.load)
+    body, error = order_body(side, pair, amount, order_type, price)
+
+    if error:
+        return None, error
+
+    status, json_data = await get_kraken().request(
+        method="POST",
+        path="/0/private/AddOrder",
+        body=body
+    )
+
+    if 'error' in json_data and len(json_data['error']):
+        return None, json_data['error']
+
+    return json_data['result'], None
+
+async def execute_orders(legs: List[Dict], validate: bool = False) -> Tuple[Dict, Dict]:
+    '''orders.execute_orders on the shared async client.'''
+    error = check_legs(legs)
+
+    if error:
+        return None, error
+
+    await asyncio.to_thread(pair_registry.load)
+    results, submissions = plan_orders(legs, validate)
+    semaphore = asyncio.Semaphore(ORDER_CONCURRENCY)
+
+    async def send(path: str, body: Dict, indexes: List[int]):
+        async with semaphore:
+            try:
+                status, json_data = await get_kraken().request(method="POST", path=path, body=body)
+            except Exception as e:
+                apply_response(results, path, indexes, None, None, [str(e)])
+                return
+
+        apply_response(results, path, indexes, status, json_data)
+
+    await asyncio.gather(*(send(path, body, indexes) for path, body, indexes in submissions))
+
+    return summarize(results), None
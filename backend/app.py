@@ -1,12 +1,29 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from dotenv import load_dotenv
-from service import retrieve_asset_info, retrieve_portfolio, execute_buy_order, retrieve_asset_pair_name, execute_sell_order
-from llm import send_grok_request
+from service import retrieve_asset_info, retrieve_portfolio, execute_buy_order, retrieve_asset_pair_name, execute_sell_order, ticker_cache, price_feed, pair_registry
+from utils import session, rate_limiter
+from orders import execute_orders
+from risk import retrieve_portfolio_risk, risk_params, ohlc_store
+from llm import send_grok_request, stream_grok_request, format_sse, StreamTimer
+from jobs import RecommendationJobs
+import os
+import requests
 
 load_dotenv()
 
 app = Flask(__name__)
 
+recommendation_jobs = RecommendationJobs(
+    retrieve_portfolio=retrieve_portfolio,
+    recommend=send_grok_request,
+    workers=int(os.getenv('RECOMMENDATION_WORKERS', 4)),
+    default_ttl=float(os.getenv('RECOMMENDATION_TTL_SECONDS', 900)),
+    max_ttl=float(os.getenv('RECOMMENDATION_MAX_TTL_SECONDS', 86400))
+)
+
+# jobs live in this process, on Vercel (which sets VERCEL) the follow-up GET reaches another instance
+JOBS_UNAVAILABLE = 'Recommendation jobs need a long-lived server, use /api/v1/recommendation'
+
 @app.route("/api/v1/pairs", methods=["POST"])
 def get_pair_name():
     request_body = request.get_json()
@@ -19,7 +36,7 @@ def get_pair_name():
     if error:
         return jsonify({'details': error, 'error': True}), 500
 
-    data = response.values()
+    data = list(response.values())
 
     return jsonify({'data': data, 'error': False}), 200
 
@@ -41,6 +58,20 @@ def get_portfolio():
 
     return jsonify({'data': response, 'error': False}), 200
 
+@app.route("/api/v1/portfolio/risk", methods=["GET"])
+def get_portfolio_risk():
+    params, error = risk_params(request.args)
+
+    if error:
+        return jsonify({'details': error, 'error': True}), 400
+
+    response, error = retrieve_portfolio_risk(**params)
+
+    if error:
+        return jsonify({'details': error, 'error': True}), 500
+
+    return jsonify({'data': response, 'error': False}), 200
+
 @app.route("/api/v1/buy", methods=["POST"])
 def buy():
     request_body = request.get_json()
@@ -83,16 +114,96 @@ def sell():
 
     return jsonify({'data': response, 'error': False}), 200
 
+@app.route("/api/v1/orders/batch", methods=["POST"])
+def orders_batch():
+    request_body = request.get_json(silent=True) or {}
+
+    response, error = execute_orders(request_body.get('orders'), validate=bool(request_body.get('validate')))
+
+    if error:
+        return jsonify({'details': error, 'error': True}), 400
+
+    return jsonify({'data': response, 'error': False}), 200
+
 @app.route("/api/v1/recommendation", methods=["POST"])
 def recommendation():
+    request_body = request.get_json(silent=True) or {}
+
+    error = recommendation_jobs.validate(request_body)
+
+    if error:
+        return jsonify({'details': error, 'error': True}), 400
+
+    response, error = recommendation_jobs.run(request_body)
+
+    if error:
+        return jsonify({'details': error, 'error': True}), 500
+
+    # the snapshot hash lets the caller get this answer again from the cache while the holdings are unchanged
+    return jsonify({'data': response['recommendation'], 'snapshot': response['snapshot'], 'error': False}), 200
+
+@app.route("/api/v1/recommendation/stream", methods=["POST"])
+def recommendation_stream():
+    request_body = request.get_json(silent=True) or {}
+
     portfolio, error = retrieve_portfolio()
 
     if error:
         return jsonify({'details': error, 'error': True}), 500
 
-    reasoning = send_grok_request(portfolio)
+    def generate():
+        timer = StreamTimer()
+
+        try:
+            for delta in stream_grok_request(portfolio, request_body.get('interest'), timer):
+                yield format_sse({'delta': delta})
+        except requests.RequestException as e:
+            yield format_sse({'details': str(e), 'error': True}, event='error')
+            return
+
+        yield format_sse(timer.summary(), event='done')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route("/api/v1/recommendation/jobs", methods=["POST"])
+def submit_recommendation():
+    if os.getenv('VERCEL'):
+        return jsonify({'details': JOBS_UNAVAILABLE, 'error': True}), 501
+
+    request_body = request.get_json(silent=True) or {}
+
+    error = recommendation_jobs.validate(request_body)
+
+    if error:
+        return jsonify({'details': error, 'error': True}), 400
+
+    job = recommendation_jobs.submit(request_body)
+
+    return jsonify({'data': job, 'error': False}), 202
+
+@app.route("/api/v1/recommendation/jobs/<job_id>", methods=["GET"])
+def get_recommendation(job_id: str):
+    if os.getenv('VERCEL'):
+        return jsonify({'details': JOBS_UNAVAILABLE, 'error': True}), 501
+
+    job = recommendation_jobs.get(job_id)
+
+    if job is None:
+        return jsonify({'details': 'Unknown or expired job', 'error': True}), 404
+
+    return jsonify({'data': job, 'error': False}), 200
 
-    return jsonify({'data': reasoning, 'error': False}), 200
+@app.route("/api/v1/metrics", methods=["GET"])
+def metrics():
+    return jsonify({'data': {
+        'ticker_cache': ticker_cache.stats(),
+        'pair_registry': pair_registry.stats(),
+        'kraken_rate_limit': rate_limiter.stats() if rate_limiter else None,
+        'ohlc_store': ohlc_store.stats(),
+        'price_feed': price_feed.stats() if price_feed else None,
+        'recommendation_jobs': recommendation_jobs.stats(),
+        'kraken_session': session.stats()
+    }, 'error': False}), 200
 
 if __name__ == '__main__':
     app.run(debug=True, port=8080)
\ No newline at end of file
@@ -0,0 +1,230 @@
+import asyncio
+import contextlib
+import os
+
+import httpx
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import aio_service
+from aio_service import retrieve_asset_info, retrieve_portfolio, retrieve_asset_pair_name, execute_order, execute_orders
+from service import ticker_cache, price_feed, pair_registry
+from utils import rate_limiter
+from risk import portfolio_risk, risk_params, ohlc_store
+from service import retrieve_portfolio as retrieve_portfolio_sync
+from llm import asend_grok_request, astream_grok_request, send_grok_request, format_sse, StreamTimer
+from jobs import RecommendationJobs
+
+'''
+Async (ASGI) entry point with the same routes and {'data', 'error'} envelopes
+as app.py. Kraken and Grok calls never block a worker, so one process can
+hold many slow recommendation calls while portfolio and asset calls proceed.
+
+    uvicorn asgi:app --port 8080
+'''
+
+load_dotenv()
+
+llm_client: httpx.AsyncClient = None
+
+recommendation_jobs = RecommendationJobs(
+    retrieve_portfolio=retrieve_portfolio_sync,
+    recommend=send_grok_request,
+    workers=int(os.getenv('RECOMMENDATION_WORKERS', 4)),
+    default_ttl=float(os.getenv('RECOMMENDATION_TTL_SECONDS', 900)),
+    max_ttl=float(os.getenv('RECOMMENDATION_MAX_TTL_SECONDS', 86400))
+)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global llm_client
+
+    llm_client = httpx.AsyncClient(timeout=float(os.getenv('LLM_TIMEOUT', 300)))
+    await asyncio.to_thread(pair_registry.load)
+    yield
+    await llm_client.aclose()
+    await aio_service.close()
+
+async def get_pair_name(request: Request):
+    request_body = await request.json()
+
+    symbol1 = request_body['symbol1']
+    symbol2 = request_body['symbol2']
+
+    response, error = await retrieve_asset_pair_name(symbol1, symbol2)
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=500)
+
+    return JSONResponse({'data': list(response.values()), 'error': False}, status_code=200)
+
+async def get_asset(request: Request):
+    response, error = await retrieve_asset_info(request.path_params['ticker'])
+
+    if error:
+        return JSONResponse({'error': True, 'details': error}, status_code=500)
+
+    return JSONResponse({'data': response, 'error': False}, status_code=200)
+
+async def get_portfolio(request: Request):
+    response, error = await retrieve_portfolio()
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=500)
+
+    return JSONResponse({'data': response, 'error': False}, status_code=200)
+
+async def get_portfolio_risk(request: Request):
+    params, error = risk_params(request.query_params)
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=400)
+
+    portfolio, error = await retrieve_portfolio()
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=500)
+
+    # OHLC updates and the NumPy work are blocking, keep them off the event loop
+    response, error = await asyncio.to_thread(portfolio_risk, portfolio, **params)
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=500)
+
+    return JSONResponse({'data': response, 'error': False}, status_code=200)
+
+async def order(request: Request, side: str):
+    request_body = await request.json()
+
+    response, error = await execute_order(
+        side=side,
+        pair=request_body['pair'],
+        amount=request_body['amount'],
+        order_type=request_body['ordertype'],
+        price=request_body.get('price', None)
+    )
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=500)
+
+    return JSONResponse({'data': response, 'error': False}, status_code=200)
+
+async def buy(request: Request):
+    return await order(request, 'buy')
+
+async def sell(request: Request):
+    return await order(request, 'sell')
+
+async def orders_batch(request: Request):
+    request_body = await request.json() if await request.body() else {}
+
+    response, error = await execute_orders(request_body.get('orders'), validate=bool(request_body.get('validate')))
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=400)
+
+    return JSONResponse({'data': response, 'error': False}, status_code=200)
+
+async def recommendation(request: Request):
+    request_body = await request.json() if await request.body() else {}
+
+    error = recommendation_jobs.validate(request_body)
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=400)
+
+    # same cache rules as RecommendationJobs.run: a known snapshot hash skips the portfolio fetch
+    result = recommendation_jobs.cached(request_body)
+
+    if result is None:
+        portfolio, error = await retrieve_portfolio()
+
+        if error:
+            return JSONResponse({'details': error, 'error': True}, status_code=500)
+
+        result = recommendation_jobs.cached(request_body, portfolio)
+
+    if result is None:
+        reasoning = await asend_grok_request(portfolio, llm_client, request_body.get('interest'))
+        result = recommendation_jobs.remember(request_body, portfolio, reasoning)
+
+    return JSONResponse({'data': result['recommendation'], 'snapshot': result['snapshot'], 'error': False}, status_code=200)
+
+async def recommendation_stream(request: Request):
+    request_body = await request.json() if await request.body() else {}
+
+    portfolio, error = await retrieve_portfolio()
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=500)
+
+    async def generate():
+        timer = StreamTimer()
+
+        try:
+            async for delta in astream_grok_request(portfolio, llm_client, request_body.get('interest'), timer):
+                yield format_sse({'delta': delta})
+        except httpx.HTTPError as e:
+            yield format_sse({'details': str(e), 'error': True}, event='error')
+            return
+
+        yield format_sse(timer.summary(), event='done')
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+async def submit_recommendation(request: Request):
+    request_body = await request.json() if await request.body() else {}
+
+    error = recommendation_jobs.validate(request_body)
+
+    if error:
+        return JSONResponse({'details': error, 'error': True}, status_code=400)
+
+    # jobs run the blocking service calls on their own worker threads
+    job = recommendation_jobs.submit(request_body)
+
+    return JSONResponse({'data': job, 'error': False}, status_code=202)
+
+async def get_recommendation(request: Request):
+    job = recommendation_jobs.get(request.path_params['job_id'])
+
+    if job is None:
+        return JSONResponse({'details': 'Unknown or expired job', 'error': True}, status_code=404)
+
+    return JSONResponse({'data': job, 'error': False}, status_code=200)
+
+async def metrics(request: Request):
+    return JSONResponse({'data': {
+        'ticker_cache': ticker_cache.stats(),
+        'pair_registry': pair_registry.stats(),
+        'kraken_rate_limit': rate_limiter.stats() if rate_limiter else None,
+        'ohlc_store': ohlc_store.stats(),
+        'price_feed': price_feed.stats() if price_feed else None,
+        'recommendation_jobs': recommendation_jobs.stats(),
+    }, 'error': False}, status_code=200)
+
+app = Starlette(
+    routes=[
+        Route("/api/v1/pairs", get_pair_name, methods=["POST"]),
+        Route("/api/v1/asset/{ticker}", get_asset, methods=["GET"]),
+        Route("/api/v1/portfolio", get_portfolio, methods=["GET"]),
+        Route("/api/v1/portfolio/risk", get_portfolio_risk, methods=["GET"]),
+        Route("/api/v1/buy", buy, methods=["POST"]),
+        Route("/api/v1/sell", sell, methods=["POST"]),
+        Route("/api/v1/orders/batch", orders_batch, methods=["POST"]),
+        Route("/api/v1/recommendation", recommendation, methods=["POST"]),
+        Route("/api/v1/recommendation/stream", recommendation_stream, methods=["POST"]),
+        Route("/api/v1/recommendation/jobs", submit_recommendation, methods=["POST"]),
+        Route("/api/v1/recommendation/jobs/{job_id}", get_recommendation, methods=["GET"]),
+        Route("/api/v1/metrics", metrics, methods=["GET"]),
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, port=8080)
@@ -0,0 +1,333 @@
+import itertools
+import os
+import re
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+'''
+Backtests of portfolio strategies over the OHLC bars in the local store.
+
+A strategy turns a T x N closes matrix (pairs as columns, forward filled,
+NaN before a pair's first bar, see risk.align) into the bars it trades on and
+the target weights there: fractions of portfolio value per pair, the rest is
+cash, in the order of the portfolio's pairs. Between two trades the holdings
+do not change, so every bar of a segment is its start weights times the
+price ratios since the start, and the whole run is a handful of T x N array
+operations with no loop over bars:
+
+    result = simulate(closes, *Rebalance(weights, every=24).targets(closes), fee_rate=0.004)
+
+Each trade pays fee_rate on the value traded, as Kraken charges the `fee` of
+every trade in TradesHistory (backtest_recommendation uses the rate the trade
+ledger shows). run_grid() runs one strategy over every combination of its
+parameters in a process pool, the closes shared through a memory-mapped file.
+'''
+
+# Kraken's taker fee below $10k monthly volume, market orders as the rebalancer places them
+DEFAULT_FEE_RATE = float(os.getenv('BACKTEST_FEE_RATE', 0.004))
+
+SECONDS_PER_YEAR = 365 * 86400
+
+# points of the value and HHI series returned, they are thinned to at most this many
+SERIES_POINTS = 500
+
+
+class Strategy(ABC):
+    '''
+    targets(closes) returns (bars, weights): the increasing bar indexes to
+    trade on and an S x N matrix of target weights, each computed only from
+    closes up to its bar. Before the first trade the portfolio holds the
+    `start` weights given to simulate (cash if none).
+    '''
+    @abstractmethod
+    def targets(self, closes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class Hold(Strategy):
+    '''Trades to `weights` once, on the first bar, and lets them drift.'''
+    def __init__(self, weights: np.ndarray):
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+    def targets(self, closes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.array([0]), self.weights[None, :]
+
+
+class Rebalance(Strategy):
+    '''Trades back to fixed `weights` every `every` bars.'''
+    def __init__(self, weights: np.ndarray, every: int = 24):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.every = every
+
+    def targets(self, closes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        bars = np.arange(0, len(closes), self.every)
+        return bars, np.broadcast_to(self.weights, (len(bars), len(self.weights)))
+
+
+class Momentum(Strategy):
+    '''
+    Every `every` bars, equal weights in the `top` pairs with the best
+    return over the last `lookback` bars, of those that went up; `invested`
+    of the portfolio at most, cash if none went up.
+    '''
+    def __init__(self, lookback: int = 168, top: int = 5, every: int = 24, invested: float = 1.0):
+        self.lookback = lookback
+        self.top = top
+        self.every = every
+        self.invested = invested
+
+    def targets(self, closes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        bars = np.arange(self.lookback, len(closes), self.every)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = closes[bars] / closes[bars - self.lookback] - 1
+        score[~np.isfinite(score)] = -np.inf
+
+        top = min(self.top, closes.shape[1])
+        picked = np.argpartition(-score, top - 1, axis=1)[:, :top] if top else np.empty((len(bars), 0), dtype=np.intp)
+        rows = np.arange(len(bars))[:, None]
+        chosen = np.zeros(score.shape, dtype=bool)
+        chosen[rows, picked] = score[rows, picked] > 0
+
+        weights = chosen * (self.invested / np.maximum(chosen.sum(axis=1, keepdims=True), 1))
+        return bars, weights
+
+
+def parse_recommendation(reply) -> Optional[Dict]:
+    '''
+    {'token', 'action', 'price', 'quantity'} from a send_grok_request reply
+    (or its text) in the format llm.PROMPT_TEMPLATE asks for.
+    '''
+    text = reply
+    if isinstance(reply, dict):
+        text = ((reply.get('choices') or [{}])[0].get('message') or {}).get('content')
+
+    fields = {}
+    for name in ('Token', 'Action', 'Price', 'Quantity'):
+        match = re.search(rf'^\s*\**{name}\**\s*:\s*\[?([^\],\n]+)', text or '', re.MULTILINE | re.IGNORECASE)
+        if match is None:
+            return None
+        fields[name.lower()] = match.group(1).strip().strip('*').strip()
+
+    try:
+        price = float(fields['price'].replace('$', '').replace(',', ''))
+        quantity = float(fields['quantity'].replace(',', ''))
+    except ValueError:
+        return None
+
+    return {'token': fields['token'].upper(), 'action': fields['action'].upper(), 'price': price, 'quantity': quantity}
+
+
+def recommendation_weights(weights: np.ndarray, pairs: List[str], total: float, recommendation: Dict, pair_for: Callable[[str], Optional[str]]) -> Tuple[np.ndarray, Optional[str]]:
+    '''
+    The weights after following a recommendation on a portfolio worth
+    `total`: a buy is paid from cash first, then from the other pairs pro
+    rata; a sell goes to cash.
+    '''
+    pair = pair_for(recommendation['token'])
+    if pair not in pairs:
+        return None, f'No stored bars for {recommendation["token"]}'
+
+    i = pairs.index(pair)
+    traded = recommendation['price'] * recommendation['quantity'] / total
+    target = np.array(weights, dtype=np.float64)
+
+    if recommendation['action'] == 'SELL':
+        target[i] -= min(traded, target[i])
+    elif recommendation['action'] == 'BUY':
+        traded = min(traded, 1.0)
+        cash = 1 - target.sum()
+        others = target.sum() - target[i]
+        if traded > cash and others > 0:
+            keep = np.arange(len(target)) != i
+            target[keep] *= max(0.0, 1 - (traded - cash) / others)
+        target[i] += traded
+
+    return target, None
+
+
+def thinned(series: np.ndarray, points: int = SERIES_POINTS) -> np.ndarray:
+    '''Every k-th point, keeping the last, so at most `points` remain.'''
+    stride = max(1, -(-len(series) // points))
+    return series[::-1][::stride][::-1]
+
+
+def simulate(closes: np.ndarray, bars: np.ndarray, weights: np.ndarray, fee_rate: float = DEFAULT_FEE_RATE, start: Optional[np.ndarray] = None, interval: int = 60, initial: float = 1.0, series: bool = True) -> Dict:
+    '''
+    Replays closes through the trades (bars, weights). `start` is the
+    portfolio held before the first trade; by default it already matches
+    the first targets, so the initial allocation is free. Weights on pairs
+    without a close yet are dropped to cash.
+    '''
+    count, n = closes.shape
+    bars = np.asarray(bars, dtype=np.intp)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    if not len(bars) or bars[0] != 0:
+        bars = np.concatenate(([0], bars))
+        weights = np.vstack((np.zeros(n) if start is None else start, weights))
+
+    base = closes[bars]
+    weights = np.where(np.isfinite(base), weights, 0.0)
+    start = weights[0] if start is None else np.asarray(start, dtype=np.float64)
+    cash = 1 - weights.sum(axis=1)
+
+    # value of every bar as a multiple of its segment's value after the trade that opened it
+    segment = np.searchsorted(bars, np.arange(count), side='right') - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        exposure = closes / base[segment]
+    exposure *= weights[segment]
+    exposure[~np.isfinite(exposure)] = 0.0
+    growth = exposure.sum(axis=1) + cash[segment]
+
+    # holdings just before every trade after the first, as weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        held = weights[:-1] * (closes[bars[1:]] / base[:-1])
+    held[~np.isfinite(held)] = 0.0
+    segment_growth = held.sum(axis=1) + cash[:-1]
+    drifted = np.vstack((start[None, :], held / segment_growth[:, None]))
+
+    turnover = np.abs(weights - drifted).sum(axis=1)
+    fees = fee_rate * turnover
+    level = initial * np.cumprod(np.concatenate(([1.0], segment_growth))) * np.cumprod(1 - fees)
+    value = level[segment] * growth
+    before = level / (1 - fees)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hhi = (exposure * exposure).sum(axis=1) / (growth * growth)
+
+    periods = SECONDS_PER_YEAR / (interval * 60)
+    returns = value[1:] / value[:-1] - 1
+    years = (count - 1) / periods
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+
+    result = {
+        'bars': count,
+        'trades': len(bars),
+        'total_return': float(value[-1] / initial - 1),
+        'annual_return': float((value[-1] / initial) ** (1 / years) - 1) if years > 0 else 0.0,
+        'volatility': float(std * np.sqrt(periods)),
+        'sharpe': float(returns.mean() / std * np.sqrt(periods)) if std > 0 else 0.0,
+        'max_drawdown': float(1 - (value / np.maximum.accumulate(value)).min()),
+        'turnover': float((turnover * before).sum() / value.mean()),
+        'fees': float((fees * before).sum()),
+        'hhi_mean': float(hhi.mean()),
+        'hhi_final': float(hhi[-1]),
+    }
+
+    if series:
+        result['value'] = thinned(value).tolist()
+        result['hhi'] = thinned(hhi).tolist()
+
+    return result
+
+
+def run(strategy: Strategy, closes: np.ndarray, **options) -> Dict:
+    '''simulate(closes, *strategy.targets(closes), **options) with its throughput.'''
+    started = time.perf_counter()
+    result = simulate(closes, *strategy.targets(closes), **options)
+    elapsed = time.perf_counter() - started
+    return {**result, 'seconds': elapsed, 'bars_per_second': len(closes) / elapsed if elapsed else float('inf')}
+
+
+shared_closes: Optional[np.ndarray] = None
+
+def load_shared(path: str):
+    global shared_closes
+    shared_closes = np.load(path, mmap_mode='r')
+
+def run_shared(task: Tuple[type, Dict, Dict]) -> Dict:
+    strategy, params, options = task
+    return run(strategy(**params), shared_closes, series=False, **options)
+
+
+def run_grid(strategy: type, closes: np.ndarray, grid: Dict[str, List], processes: Optional[int] = None, **options) -> Dict:
+    '''
+    `strategy(**params)` for every combination of the values in `grid`, e.g.
+    run_grid(Momentum, closes, {'lookback': [24, 168], 'top': [3, 5]}).
+    Results keep the order of the combinations, without the series.
+    '''
+    names = list(grid)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    tasks = [(strategy, params, options) for params in combinations]
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+
+    started = time.perf_counter()
+
+    if processes <= 1:
+        results = [run(strategy(**params), closes, series=False, **options) for params in combinations]
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'closes.npy')
+            np.save(path, closes)
+            with ProcessPoolExecutor(max_workers=processes, initializer=load_shared, initargs=(path,)) as pool:
+                results = list(pool.map(run_shared, tasks, chunksize=max(1, len(tasks) // (4 * processes))))
+
+    elapsed = time.perf_counter() - started
+
+    return {
+        'runs': [{'params': params, **result} for params, result in zip(combinations, results)],
+        'processes': processes,
+        'seconds': elapsed,
+        'bars_per_second': len(closes) * len(tasks) / elapsed if elapsed else float('inf'),
+    }
+
+
+def portfolio_closes(portfolio: Dict, extra: Tuple[str, ...] = (), interval: int = 60, lookback_days: float = 365, end: Optional[int] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    '''
+    (pairs, weights, closes) of a retrieve_portfolio result and any `extra`
+    pairs (weight 0), from the OHLC store brought up to date.
+    '''
+    # imported here so the engine, and the grid's worker processes, need no Kraken setup
+    from risk import ohlc_store, align, portfolio_weights
+
+    weights = portfolio_weights(portfolio)
+    for pair in extra:
+        weights.setdefault(pair, 0.0)
+
+    pairs = list(weights)
+    for pair in pairs:
+        # a failed update leaves the stored bars, which is what a backtest wants anyway
+        ohlc_store.update(pair, interval)
+
+    end = int(end if end is not None else ohlc_store.clock())
+    _, closes = align(ohlc_store, pairs, interval, end - int(lookback_days * 86400), end)
+    return pairs, np.array([weights[pair] for pair in pairs]), closes
+
+
+def backtest_recommendation(portfolio: Dict, reply, interval: int = 60, lookback_days: float = 90, every: int = 24, fee_rate: Optional[float] = None) -> Tuple[Dict, Dict]:
+    '''
+    What following a recommendation at the start of the lookback would have
+    done, next to keeping the portfolio as it is ('hold') and to trading back
+    to today's weights every `every` bars ('rebalance').
+    '''
+    from service import ledger, pair_registry
+
+    recommendation = parse_recommendation(reply)
+
+    if recommendation is None:
+        return None, 'Recommendation is not in the Token/Action/Price/Quantity format'
+
+    pair = pair_registry.usd_pair(recommendation['token'])
+    pairs, weights, closes = portfolio_closes(portfolio, (pair,) if pair else (), interval, lookback_days)
+    target, error = recommendation_weights(weights, pairs, portfolio['total_holdings'], recommendation, pair_registry.usd_pair)
+
+    if error:
+        return None, error
+
+    if fee_rate is None:
+        fee_rate = ledger.fee_rate() or DEFAULT_FEE_RATE
+
+    options = {'fee_rate': fee_rate, 'interval': interval}
+
+    return {
+        'recommendation': recommendation,
+        'pairs': pairs,
+        'fee_rate': fee_rate,
+        'hold': run(Hold(weights), closes, **options),
+        'follow': run(Hold(target), closes, start=weights, **options),
+        'rebalance': run(Rebalance(weights, every), closes, **options),
+    }, None
@@ -2,11 +2,13 @@ TICKER_MAPPINGS = {
     "BTC": {
         "kraken_ticker": ["XXBT", "XBT"],
         "kraken_fiat_pairs": ["XXBTZUSD"],
+        "kraken_ws_pairs": ["BTC/USD"],
         "internal_name": "Bitcoin"
     },
     "SOL": {
         "kraken_ticker": ["SOL"],
         "kraken_fiat_pairs": ["SOLUSD"],
+        "kraken_ws_pairs": ["SOL/USD"],
         "internal_name": "Solana"
     }
 }
\ No newline at end of file
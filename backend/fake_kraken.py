@@ -0,0 +1,319 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+'''
+Local stand-in for the Kraken REST API, used to exercise the backend offline.
+
+Run it and point the backend at it:
+    python fake_kraken.py --port 8765 --handshake-latency 0.05 --latency 0.02
+    KRAKEN_API_URL=http://127.0.0.1:8765 python app.py
+
+`handshake_latency` is paid once per new TCP connection (standing in for the
+TCP+TLS handshake of the real api.kraken.com), `latency` once per request.
+`GET /__stats` returns connection and request counters.
+'''
+
+TRADES_PAGE_SIZE = 50
+OHLC_MAX_BARS = 720
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+DEFAULT_STATE = {
+    'balance': {
+        'ZUSD': '1520.4100',
+        'XXBT': '0.0150000000',
+        'SOL': '3.2500000000',
+    },
+    'trades': {
+        'TQ5TFI-ABCDE-FGHIJK': {
+            'ordertxid': 'OQCLML-BW3P3-BUCMWZ', 'postxid': 'TKH2SE-M7IF5-CFI7LT', 'pair': 'XXBTZUSD',
+            'time': 1727000000.1234, 'type': 'buy', 'ordertype': 'market', 'price': '62000.00000',
+            'cost': '930.00000', 'fee': '2.41800', 'vol': '0.01500000', 'margin': '0.00000', 'misc': '',
+        },
+        'TCWJEG-FL4SZ-3FKGH6': {
+            'ordertxid': 'OQCLML-BW3P3-BUCMWY', 'postxid': 'TKH2SE-M7IF5-CFI7LU', 'pair': 'SOLUSD',
+            'time': 1726000000.5678, 'type': 'buy', 'ordertype': 'market', 'price': '140.00000',
+            'cost': '455.00000', 'fee': '1.18300', 'vol': '3.25000000', 'margin': '0.00000', 'misc': '',
+        },
+    },
+    'ticker': {
+        'XXBTZUSD': {
+            'a': ['115960.00000', '1', '1.000'], 'b': ['115950.10000', '2', '2.000'],
+            'c': ['115953.00000', '0.00100000'], 'v': ['1200.1', '3400.2'],
+            'p': ['115800.1', '115700.2'], 't': [21000, 54000],
+            'l': ['114000.0', '113500.0'], 'h': ['116500.0', '117000.0'], 'o': '115500.0',
+        },
+        'SOLUSD': {
+            'a': ['239.90000', '10', '10.000'], 'b': ['239.80000', '12', '12.000'],
+            'c': ['239.81000', '1.50000000'], 'v': ['90000.1', '250000.2'],
+            'p': ['238.1', '237.2'], 't': [11000, 34000],
+            'l': ['232.0', '230.5'], 'h': ['242.5', '244.0'], 'o': '236.0',
+        },
+    },
+    'asset_pairs': {
+        'XXBTZUSD': {
+            'altname': 'XBTUSD', 'wsname': 'XBT/USD', 'base': 'XXBT', 'quote': 'ZUSD',
+            'pair_decimals': 1, 'lot_decimals': 8, 'ordermin': '0.00005', 'costmin': '0.5',
+        },
+        'SOLUSD': {
+            'altname': 'SOLUSD', 'wsname': 'SOL/USD', 'base': 'SOL', 'quote': 'ZUSD',
+            'pair_decimals': 2, 'lot_decimals': 8, 'ordermin': '0.02', 'costmin': '0.5',
+        },
+    },
+    'assets': {
+        'ZUSD': {'aclass': 'currency', 'altname': 'USD', 'decimals': 4, 'display_decimals': 2},
+        'XXBT': {'aclass': 'currency', 'altname': 'XBT', 'decimals': 10, 'display_decimals': 5},
+        'SOL': {'aclass': 'currency', 'altname': 'SOL', 'decimals': 10, 'display_decimals': 5},
+        'SOL.S': {'aclass': 'currency', 'altname': 'SOL.S', 'decimals': 10, 'display_decimals': 5},
+    },
+}
+
+
+class FakeKrakenServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state: Optional[Dict] = None, latency: float = 0.0, handshake_latency: float = 0.0, rate_limit_every: int = 0):
+        super().__init__(address, FakeKrakenHandler)
+        self.state = json.loads(json.dumps(state or DEFAULT_STATE))
+        self.latency = latency
+        self.handshake_latency = handshake_latency
+        self.rate_limit_every = rate_limit_every
+        self.connections = 0
+        self.requests = 0
+        self.orders: List[Dict] = []
+        self.paths: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeKrakenServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class KrakenError(Exception):
+    '''Raised by a route to answer with Kraken's {'error': [...]} envelope.'''
+
+
+class FakeKrakenHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake_latency)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        body = json.loads(raw) if raw else {}
+
+        if url.path == '/__stats':
+            return self._reply(200, {
+                'connections': self.server.connections,
+                'requests': self.server.requests,
+                'paths': self.server.paths,
+            })
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.paths[url.path] = self.server.paths.get(url.path, 0) + 1
+            count = self.server.requests
+
+        time.sleep(self.server.latency)
+
+        if self.server.rate_limit_every and count % self.server.rate_limit_every == 0:
+            return self._reply(200, {'error': ['EAPI:Rate limit exceeded']})
+
+        handler = getattr(self, 'route_' + url.path.strip('/').replace('/', '_'), None)
+        if handler is None:
+            return self._reply(404, {'error': ['EGeneral:Unknown method']})
+
+        try:
+            result = handler(query, body)
+        except KrakenError as e:
+            return self._reply(200, {'error': [str(e)]})
+
+        self._reply(200, {'error': [], 'result': result})
+
+    def _reply(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _pair_name(self, name: str) -> Optional[str]:
+        # Kraken accepts a pair's altname or wsname too and answers with its name
+        for pair, info in self.server.state['asset_pairs'].items():
+            if name in (pair, info['altname'], info['wsname']):
+                return pair
+        return None
+
+    def route_0_public_Ticker(self, query: Dict, body: Dict) -> Dict:
+        names = (self._pair_name(name) or name for name in query.get('pair', '').split(','))
+        ticker = self.server.state['ticker']
+        return {pair: ticker[pair] for pair in names if pair in ticker}
+
+    def route_0_public_Assets(self, query: Dict, body: Dict) -> Dict:
+        assets = self.server.state.get('assets', {})
+        wanted = query.get('asset')
+        if not wanted:
+            return assets
+
+        wanted = set(wanted.split(','))
+        return {name: info for name, info in assets.items() if name in wanted or info['altname'] in wanted}
+
+    def route_0_public_AssetPairs(self, query: Dict, body: Dict) -> Dict:
+        pairs = self.server.state['asset_pairs']
+        wanted = query.get('pair')
+        if not wanted:
+            return pairs
+
+        wanted = set(wanted.split(','))
+        return {
+            name: info for name, info in pairs.items()
+            if name in wanted or info['altname'] in wanted or info['wsname'] in wanted
+        }
+
+    def route_0_public_OHLC(self, query: Dict, body: Dict) -> Dict:
+        # the 720 most recent bars after `since`, the last one still forming, like Kraken;
+        # prices are a deterministic function of (pair, time) so repeated calls agree
+        name = self._pair_name(query.get('pair', ''))
+        if name is None:
+            raise KrakenError('EQuery:Unknown asset pair')
+
+        step = int(query.get('interval', 1)) * 60
+        now = int(time.time()) // step * step
+        since = int(query.get('since', 0))
+        first = max(now - (OHLC_MAX_BARS - 1) * step, since // step * step)
+        anchor = float(self.server.state['ticker'].get(name, {}).get('c', ['100'])[0])
+
+        bars = []
+        for t in range(first, now + 1, step):
+            rng = random.Random(f'{name}:{step}:{t}')
+            close = anchor * math.exp(0.1 * math.sin(t / (step * 97.0)) + rng.gauss(0, 0.01))
+            spread = close * 0.002 * rng.random()
+            bars.append([t, f'{close:.5f}', f'{close + spread:.5f}', f'{close - spread:.5f}', f'{close:.5f}',
+                         f'{close:.5f}', f'{rng.uniform(1, 100):.8f}', rng.randint(1, 500)])
+
+        return {name: bars, 'last': bars[-2][0] if len(bars) > 1 else since}
+
+    def route_0_private_Balance(self, query: Dict, body: Dict) -> Dict:
+        return self.server.state['balance']
+
+    def route_0_private_TradesHistory(self, query: Dict, body: Dict) -> Dict:
+        # newest first, 50 per page, `start` exclusive and `end` inclusive like Kraken
+        start = float(body.get('start', 0))
+        end = float(body.get('end', float('inf')))
+        ofs = int(body.get('ofs', 0))
+
+        trades = sorted(
+            (
+                (txid, trade) for txid, trade in self.server.state['trades'].items()
+                if start < float(trade['time']) <= end
+            ),
+            key=lambda item: -float(item[1]['time'])
+        )
+
+        return {'trades': dict(trades[ofs:ofs + TRADES_PAGE_SIZE]), 'count': len(trades)}
+
+    def _place_order(self, pair: str, order: Dict, validate: bool) -> Dict:
+        name = self._pair_name(pair)
+        if name is None:
+            raise KrakenError('EQuery:Unknown asset pair')
+
+        info = self.server.state['asset_pairs'][name]
+        if float(order.get('volume', 0)) < float(info['ordermin']):
+            raise KrakenError('EOrder:Order minimum not met')
+
+        descr = {'order': f'{order.get("type")} {order.get("volume")} {info["altname"]} @ {order.get("ordertype")}'}
+        if validate:
+            return {'descr': descr}
+
+        with self.server.lock:
+            txid = f'OFAKE{self.server.requests:06d}-{len(self.server.orders):03d}'
+            self.server.orders.append({**order, 'pair': name, 'txid': txid})
+        return {'descr': descr, 'txid': [txid]}
+
+    def route_0_private_AddOrder(self, query: Dict, body: Dict) -> Dict:
+        return self._place_order(body.get('pair', ''), body, bool(body.get('validate')))
+
+    def route_0_private_AddOrderBatch(self, query: Dict, body: Dict) -> Dict:
+        orders = body.get('orders') or []
+        if not 2 <= len(orders) <= 15:
+            raise KrakenError('EGeneral:Invalid arguments:orders')
+
+        # like Kraken, a bad order fails on its own and the others are still placed
+        placed = []
+        for order in orders:
+            try:
+                result = self._place_order(body.get('pair', ''), order, bool(body.get('validate')))
+            except KrakenError as e:
+                if str(e) == 'EQuery:Unknown asset pair':
+                    raise
+                placed.append({'error': str(e)})
+            else:
+                placed.append({**result, 'txid': result['txid'][0]} if 'txid' in result else result)
+        return {'orders': placed}
+
+
+def load_trades_fixture(path: str = os.path.join(FIXTURES_DIR, 'trades_history.json')) -> Dict:
+    '''Recorded TradesHistory response, usable as the `trades` entry of a server state.'''
+    with open(path) as f:
+        return json.load(f)['result']['trades']
+
+
+def serve(host: str = '127.0.0.1', port: int = 0, **kwargs) -> FakeKrakenServer:
+    '''Start a fake server in a background thread (port 0 picks a free port).'''
+    return FakeKrakenServer((host, port), **kwargs).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Kraken REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--handshake-latency', type=float, default=0.0)
+    parser.add_argument('--rate-limit-every', type=int, default=0)
+    parser.add_argument('--trades', help='recorded TradesHistory response to serve, e.g. fixtures/trades_history.json')
+    args = parser.parse_args()
+
+    state = json.loads(json.dumps(DEFAULT_STATE))
+    if args.trades:
+        state['trades'] = load_trades_fixture(args.trades)
+
+    server = FakeKrakenServer(
+        (args.host, args.port),
+        state=state,
+        latency=args.latency,
+        handshake_latency=args.handshake_latency,
+        rate_limit_every=args.rate_limit_every,
+    )
+    print(f'Fake Kraken listening on {server.url}')
+    server.serve_forever()
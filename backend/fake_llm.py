@@ -0,0 +1,146 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+'''
+Local stand-in for the xAI chat completions endpoint.
+
+    python fake_llm.py --port 8767 --latency 4
+    GROK_API_URL=http://127.0.0.1:8767/v1/chat/completions python app.py
+
+Every completion takes `latency` seconds and returns a fixed recommendation
+in the format get_payload asks for. Requests with "stream": true get the same
+text as server-sent events: the first chunk after `first_token_latency`
+seconds, then one word every `token_interval` seconds, then `data: [DONE]`.
+'''
+
+RECOMMENDATION = (
+    "Token: ETH\n"
+    "Action: BUY,\n"
+    "Price: 4660.03,\n"
+    "Quantity: 0.05,\n"
+    "Reasoning: The portfolio is concentrated in BTC and SOL with a large USD balance. "
+    "Adding ETH diversifies smart contract platform exposure while staying in large caps, "
+    "and keeps the stablecoin share high enough to absorb volatility — around 40 % of the portfolio "
+    "stays in USD, the €/$ spread is not a concern."
+)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, content: str = RECOMMENDATION, first_token_latency: float = 0.0, token_interval: float = 0.0):
+        super().__init__(address, FakeLLMHandler)
+        self.latency = latency
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.content = content
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1/chat/completions'
+
+    def start(self) -> 'FakeLLMServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        with self.server.lock:
+            self.server.requests += 1
+
+        if body.get('stream'):
+            return self.stream(body)
+
+        time.sleep(self.server.latency)
+        self._reply(200, self.completion(body))
+
+    def stream(self, body: Dict):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        time.sleep(self.server.first_token_latency)
+
+        words = self.server.content.split(' ')
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.server.token_interval)
+
+            chunk = {
+                'id': f'fake-{self.server.requests}',
+                'object': 'chat.completion.chunk',
+                'model': body.get('model', 'grok-4'),
+                'choices': [{'index': 0, 'delta': {'content': word if i == 0 else ' ' + word}}],
+            }
+            # raw UTF-8 like the real endpoint, not \u escapes, so clients must decode the stream as UTF-8
+            self._write_chunk(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode())
+
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def completion(self, body: Dict) -> Dict:
+        return {
+            'id': f'fake-{self.server.requests}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'grok-4'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': self.server.content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': len(self.server.content) // 4},
+        }
+
+    def _reply(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(host: str = '127.0.0.1', port: int = 0, **kwargs) -> FakeLLMServer:
+    return FakeLLMServer((host, port), **kwargs).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake xAI chat completions API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--latency', type=float, default=4.0)
+    parser.add_argument('--first-token-latency', type=float, default=1.0)
+    parser.add_argument('--token-interval', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(
+        (args.host, args.port),
+        latency=args.latency,
+        first_token_latency=args.first_token_latency,
+        token_interval=args.token_interval
+    )
+    print(f'Fake LLM listening on {server.url}')
+    server.serve_forever()
@@ -0,0 +1,43 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, threads are still safe
+    fcntl = None
+
+'''
+Exclusive advisory lock on a file, shared by every process on the host.
+
+    with file_lock('/tmp/some.lock'):
+        ...
+
+A path is opened (and created) for the duration of the lock; an already open
+descriptor is locked as is, for callers that keep one around. flock locks
+belong to the open file, so a forked process must open its own descriptor
+rather than reuse its parent's. Where fcntl is missing (Windows) the lock is
+a no-op and CROSS_PROCESS is False, callers still have to serialize their own
+threads.
+'''
+
+CROSS_PROCESS = fcntl is not None
+
+
+@contextmanager
+def file_lock(target: Union[str, int]) -> Iterator[int]:
+    '''Holds an exclusive flock on a path or an open descriptor, yields the descriptor.'''
+    opened = isinstance(target, str)
+    fd = os.open(target, os.O_RDWR | os.O_CREAT, 0o666) if opened else target
+
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield fd
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        if opened:
+            os.close(fd)
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+'''
+Recommendation jobs and their result cache.
+
+A recommendation is cached under (snapshot hash, interest), where the snapshot
+hash only covers what the user holds (symbol and quantity), not prices, so
+repeated asks about an unchanged portfolio within `ttl_seconds` (at most
+`max_ttl`) are answered without another Grok call. Jobs run on an in-process worker pool and are kept
+for `retention` seconds after they finish, so this needs a long-lived process
+(the ASGI/Flask server), not a serverless function.
+'''
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def snapshot_hash(portfolio: Dict) -> str:
+    '''Deterministic hash of the holdings in a retrieve_portfolio result (or a client snapshot).'''
+    positions = sorted(
+        (
+            str(position['symbol']).upper(),
+            round(float(position.get('holding_amount', position.get('quantity', 0))), 8)
+        )
+        for position in portfolio.get('positions', [])
+    )
+
+    return hashlib.sha256(json.dumps(positions, separators=(',', ':')).encode()).hexdigest()
+
+
+class RecommendationCache:
+    def __init__(self, max_entries: int = 256, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Tuple[str, str], value: Dict, ttl: float):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RecommendationJobs:
+    def __init__(self, retrieve_portfolio: Callable[[], Tuple[Dict, Dict]], recommend: Callable[[Dict, Optional[str]], Dict], workers: int = 4, default_ttl: float = 900, max_ttl: float = 86400, retention: float = 3600, clock: Callable[[], float] = time.time):
+        self.retrieve_portfolio = retrieve_portfolio
+        self.recommend = recommend
+        self.default_ttl = min(default_ttl, max_ttl)
+        self.max_ttl = max_ttl
+        self.retention = retention
+        self.clock = clock
+        self.cache = RecommendationCache(clock=clock)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recommendation')
+        self._jobs: Dict[str, Dict] = {}
+        self._running: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def validate(self, request_body: Dict) -> Optional[str]:
+        '''Why the request's snapshot can't be used, None when it can (or there is none).'''
+        snapshot = request_body.get('snapshot')
+
+        if snapshot is None:
+            return None
+
+        if not isinstance(snapshot, dict):
+            return 'snapshot must be an object with hash and ttl_seconds'
+
+        if not isinstance(snapshot.get('hash', ''), str):
+            return 'snapshot hash must be a string'
+
+        ttl = snapshot.get('ttl_seconds')
+
+        if ttl is not None:
+            try:
+                ttl = float(ttl)
+            except (TypeError, ValueError):
+                return f'Invalid snapshot ttl_seconds {ttl!r}'
+
+            if not math.isfinite(ttl) or ttl < 0:
+                return f'Invalid snapshot ttl_seconds {ttl!r}'
+
+        return None
+
+    def ttl(self, request_body: Dict) -> float:
+        '''The ttl_seconds the client asked for, capped at max_ttl; default_ttl when it is missing or invalid.'''
+        if self.validate(request_body):
+            return self.default_ttl
+
+        ttl = float((request_body.get('snapshot') or {}).get('ttl_seconds') or self.default_ttl)
+
+        return min(ttl, self.max_ttl)
+
+    def run(self, request_body: Dict) -> Tuple[Dict, Dict]:
+        '''
+        Synchronous recommendation through the same cache. Returns
+        ({'recommendation', 'snapshot', 'cached'}, error).
+        '''
+        cached = self.cached(request_body)
+        if cached is not None:
+            return cached, None
+
+        portfolio, error = self.retrieve_portfolio()
+
+        if error:
+            return None, error
+
+        cached = self.cached(request_body, portfolio)
+        if cached is not None:
+            return cached, None
+
+        return self.remember(request_body, portfolio, self.recommend(portfolio, request_body.get('interest'))), None
+
+    def cached(self, request_body: Dict, portfolio: Optional[Dict] = None) -> Optional[Dict]:
+        '''
+        Cached result for the snapshot hash the client sent or, given the
+        portfolio, for its holdings; None on a miss or with use_fresh.
+        '''
+        if request_body.get('use_fresh'):
+            return None
+
+        digest = snapshot_hash(portfolio) if portfolio is not None else (request_body.get('snapshot') or {}).get('hash')
+        cached = self.cache.get((digest, request_body.get('interest') or '')) if digest else None
+
+        return {**cached, 'cached': True} if cached is not None else None
+
+    def remember(self, request_body: Dict, portfolio: Dict, recommendation: Dict) -> Dict:
+        '''Caches a fresh recommendation for the portfolio's holdings and returns it with its snapshot.'''
+        ttl = self.ttl(request_body)
+        key = (snapshot_hash(portfolio), request_body.get('interest') or '')
+
+        result = {
+            'recommendation': recommendation,
+            'snapshot': {
+                'hash': key[0],
+                'asof': datetime.now(timezone.utc).isoformat(),
+                'ttl_seconds': ttl,
+            },
+        }
+
+        self.cache.put(key, result, ttl)
+
+        return {**result, 'cached': False}
+
+    def submit(self, request_body: Dict) -> Dict:
+        '''Queues a recommendation, answering at once from the cache or an identical running job when possible.'''
+        interest = request_body.get('interest')
+        snapshot = request_body.get('snapshot') or {}
+        use_fresh = bool(request_body.get('use_fresh'))
+        key = (snapshot.get('hash'), interest or '') if snapshot.get('hash') else None
+
+        cached = self.cache.get(key) if key and not use_fresh else None
+
+        # checking for an identical job and registering this one under one lock, so two can't both start
+        with self._lock:
+            if cached is not None:
+                job = self._new_job(DONE)
+                job.update(result={**cached, 'cached': True}, finished_at=self.clock())
+                return dict(job)
+
+            running = self._running.get(key) if key and not use_fresh else None
+            if running in self._jobs:
+                return dict(self._jobs[running])
+
+            job = self._new_job(QUEUED)
+
+            if key:
+                self._running[key] = job['job_id']
+
+            queued = dict(job)
+
+        self._executor.submit(self._work, job['job_id'], request_body, key)
+
+        return queued
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _new_job(self, status: str) -> Dict:
+        '''Adds a job, with self._lock held.'''
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': status,
+            'result': None,
+            'error': None,
+            'created_at': self.clock(),
+            'finished_at': None,
+        }
+
+        self._expire()
+        self._jobs[job['job_id']] = job
+
+        return job
+
+    def _work(self, job_id: str, request_body: Dict, key: Optional[Tuple[str, str]]):
+        self._update(job_id, status=RUNNING)
+
+        try:
+            result, error = self.run(request_body)
+        except Exception as e:
+            result, error = None, str(e)
+
+        if error:
+            self._update(job_id, status=FAILED, error=error, finished_at=self.clock())
+        else:
+            self._update(job_id, status=DONE, result=result, finished_at=self.clock())
+
+        if key:
+            with self._lock:
+                if self._running.get(key) == job_id:
+                    del self._running[key]
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _expire(self):
+        now = self.clock()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] > self.retention
+        ]
+
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
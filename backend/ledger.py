@@ -0,0 +1,195 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from pnl import PnLBook
+
+'''
+Local, persisted ledger of Kraken trades.
+
+Trades are stored by txid in SQLite. A sync only asks Kraken for trades newer
+than the newest one already stored and pages through the result 50 at a time
+(`ofs`), so the first sync walks the whole history and later ones are usually
+a single empty page. Each pair's lots, cost basis and realized P&L live in a
+PnLBook (pnl.py) rebuilt from the stored trades on start and updated as new
+trades arrive, so reading a position is O(1). Every sync books the rows this
+process has not seen yet, whichever worker sharing the database inserted them.
+A trade older than the newest one booked for its pair (Kraken can report it
+late) rebuilds that pair only.
+'''
+
+# Kraken's `start` is exclusive and several trades can share a timestamp,
+# so re-request a small overlap and let the txid primary key drop duplicates
+START_OVERLAP_SECONDS = 1.0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trades (
+    txid TEXT PRIMARY KEY,
+    pair TEXT NOT NULL,
+    time REAL NOT NULL,
+    type TEXT NOT NULL,
+    ordertype TEXT,
+    price REAL NOT NULL,
+    vol REAL NOT NULL,
+    cost REAL NOT NULL,
+    fee REAL NOT NULL,
+    margin REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_pair_time ON trades (pair, time);
+DROP TABLE IF EXISTS positions;
+'''
+
+TRADE_COLUMNS = 'pair, time, type, vol, cost, fee'
+
+
+def default_path(api_key: Optional[str]) -> str:
+    # one ledger per account, without putting the key itself in a file name
+    digest = hashlib.sha256((api_key or '').encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f'pocketbroker_trades_{digest}.sqlite3')
+
+
+class TradeLedger:
+    def __init__(self, path: str, fetch_page: Callable[[Dict], Tuple[Dict, Dict]], method: Optional[str] = None):
+        '''
+        fetch_page receives TradesHistory parameters (start, end, ofs) and
+        returns (result, error) where result holds 'trades' and 'count'.
+        method is 'fifo' or 'average' (PNL_METHOD, fifo by default).
+        '''
+        self.path = path
+        self.fetch_page = fetch_page
+        self._conn: Optional[sqlite3.Connection] = None
+        self.book = PnLBook(method or os.getenv('PNL_METHOD', 'fifo'))
+        self._last_time: Optional[float] = None
+        self._rowid = 0          # highest trades rowid booked by this process
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+
+            self._catch_up()
+
+        return self._conn
+
+    def sync(self) -> Tuple[Dict, Dict]:
+        '''Pull trades newer than the last stored one and return the per-pair positions.'''
+        with self._lock:
+            self._connect()
+
+            params = {}
+            if self._last_time is not None:
+                params['start'] = self._last_time - START_OVERLAP_SECONDS
+
+            fetched = {}
+            offset = 0
+
+            while True:
+                result, error = self.fetch_page({**params, 'ofs': offset})
+
+                if error:
+                    return None, error
+
+                page = result.get('trades') or {}
+
+                # pin the window to the first page so trades executed mid-sync don't shift the offsets
+                if offset == 0 and page:
+                    params['end'] = max(float(trade['time']) for trade in page.values())
+
+                fetched.update(page)
+                offset += len(page)
+
+                if not page or offset >= int(result.get('count', 0)):
+                    break
+
+            self._apply(fetched)
+
+            return self.positions(), None
+
+    @staticmethod
+    def _trade(row: Tuple) -> Dict:
+        return dict(zip(('pair', 'time', 'type', 'vol', 'cost', 'fee'), row))
+
+    def _apply(self, trades: Dict[str, Dict]):
+        if trades:
+            with self._conn as conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [
+                        (
+                            txid,
+                            trade['pair'],
+                            float(trade['time']),
+                            trade['type'],
+                            trade.get('ordertype'),
+                            float(trade['price']),
+                            float(trade['vol']),
+                            float(trade['cost']),
+                            float(trade['fee']),
+                            float(trade.get('margin', 0)),
+                        )
+                        for txid, trade in sorted(trades.items(), key=lambda item: float(item[1]['time']))
+                    ]
+                )
+
+        self._catch_up()
+
+    def _catch_up(self):
+        '''
+        Books every stored row this process has not booked yet. Other workers
+        share the database, so a trade this process fetched may already have
+        been inserted by them; rowids only grow, so nothing is missed or booked twice.
+        '''
+        conn = self._conn
+        rows = conn.execute(
+            f'SELECT rowid, {TRADE_COLUMNS} FROM trades WHERE rowid > ? ORDER BY time, rowid', (self._rowid,)
+        ).fetchall()
+
+        late = set()
+        for row in rows:
+            self._rowid = max(self._rowid, row[0])
+            trade = self._trade(row[1:])
+            self._last_time = max(self._last_time or 0, trade['time'])
+
+            pair = trade['pair']
+            if pair in late:
+                continue
+
+            booked = self.book.books.get(pair)
+            if booked is not None and trade['time'] < booked.last_time:
+                late.add(pair)
+            else:
+                self.book.apply(trade)
+
+        for pair in late:
+            self.book.rebuild(pair, map(self._trade, conn.execute(
+                f'SELECT {TRADE_COLUMNS} FROM trades WHERE pair = ? ORDER BY time, rowid', (pair,)
+            )))
+
+    def fee_rate(self) -> Optional[float]:
+        '''Fees paid over value traded across every stored trade, None before the first one.'''
+        with self._lock:
+            fee, cost = self._connect().execute('SELECT SUM(fee), SUM(cost) FROM trades').fetchone()
+
+        return fee / cost if cost else None
+
+    def mark(self, prices: Dict[str, float]) -> Dict:
+        '''Marks the books at the given prices and returns the running totals: realized, unrealized, fees.'''
+        with self._lock:
+            for pair, price in prices.items():
+                self.book.mark(pair, price)
+
+            return self.book.totals()
+
+    def positions(self) -> Dict[str, Dict]:
+        '''Books of the pairs still held or with realized P&L: amount, cost, fee, realized, unmatched, trades, last_time.'''
+        return {pair: book.to_dict() for pair, book in self.book.books.items() if book.amount or book.realized}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
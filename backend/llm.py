@@ -11,50 +11,129 @@ import json
 
 # Initialize Gemini model
 
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
 from dotenv import load_dotenv
+import httpx
+import logging
+import textwrap
+import time
 import requests
 import json
 
 ## Load env variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 ## Initialize models
-grok_api_url = "https://api.x.ai/v1/chat/completions"
+# point at a local stand-in (see fake_llm.py) to run offline
+grok_api_url = os.getenv('GROK_API_URL', "https://api.x.ai/v1/chat/completions")
 
-def get_payload(portfolio: Dict, interest: Optional[str] = None):
-    return {
-        "messages": [
-            {
-                "role": "user",
-                "content": f"""
-                # Cryptocurrency Portfolio Analysis and Investment Recommendation
+PROMPT_TEMPLATE = textwrap.dedent("""\
+    # Cryptocurrency Portfolio Analysis and Investment Recommendation
+
+    ## Current Portfolio
+    I currently hold the following cryptocurrency positions:
+
+    {portfolio}
+
+    ## Research Request
+    Please conduct thorough market research on current cryptocurrency trends, market conditions, and emerging opportunities. Based on this research and my existing portfolio composition, provide a smart diversification recommendation on what i should buy.
+
+    ## Interest
+    {interest}
+
+    ## Analysis Requirements
+    1. **Market Research**: Analyze current market conditions, trends, and sentiment
+    2. **Portfolio Assessment**: Evaluate my current holdings and identify gaps or overexposure
+    3. **Diversification Strategy**: Recommend a action that would improve portfolio balance
+    4. **Risk Management**: Consider how the recommendation fits my risk profile
+
+    ## Output Format
+    Token: [TOKEN_NAME]
+    Action: [BUY/SELL/HOLD],
+    Price: [PRICE],
+    Quantity: [QUANTITY],
+    Reasoning: [Detailed explanation including market analysis, portfolio fit, risk assessment, and diversification benefits]
+    """)
+
+# upper bound for the user prompt, positions beyond it are folded into one OTHER row
+LLM_MAX_INPUT_TOKENS = int(os.getenv('LLM_MAX_INPUT_TOKENS', 2000))
 
-                ## Current Portfolio
-                I currently hold the following cryptocurrency positions:
+PORTFOLIO_HEADER = "symbol,amount,price_usd,value_usd,weight_pct,pnl_usd"
 
-                {portfolio}
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text and numbers under BPE tokenizers
+    return (len(text) + 3) // 4
 
+def serialize_portfolio(portfolio: Dict, max_rows: Optional[int] = None) -> str:
+    '''
+    Compact CSV-like view of a retrieve_portfolio result: fixed column order,
+    rounded numbers, zero positions dropped, largest positions first. With
+    max_rows, the smallest positions are summed into a single OTHER row.
+    '''
+    if not isinstance(portfolio, dict) or 'positions' not in portfolio:
+        return json.dumps(portfolio, separators=(',', ':'), default=str)
 
-                ## Research Request
-                Please conduct thorough market research on current cryptocurrency trends, market conditions, and emerging opportunities. Based on this research and my existing portfolio composition, provide a smart diversification recommendation on what i should buy.
+    positions = sorted(
+        (p for p in portfolio['positions'] if float(p.get('holding_amount', 0))),
+        key=lambda p: -float(p.get('value', 0))
+    )
 
-                ## Interest
-                {interest}
+    rows = [
+        f"{p['symbol']},{float(p['holding_amount']):.6g},{float(p.get('price', 0)):.6g},"
+        f"{float(p.get('value', 0)):.2f},{float(p.get('weight', 0)) * 100:.1f},{float(p.get('profit_loss', 0)):.2f}"
+        for p in positions
+    ]
 
-                ## Analysis Requirements
-                1. **Market Research**: Analyze current market conditions, trends, and sentiment
-                2. **Portfolio Assessment**: Evaluate my current holdings and identify gaps or overexposure
-                3. **Diversification Strategy**: Recommend a action that would improve portfolio balance
-                4. **Risk Management**: Consider how the recommendation fits my risk profile
+    if max_rows is not None and len(rows) > max_rows:
+        rest = positions[max_rows - 1:]
+        rows = rows[:max_rows - 1] + [
+            f"OTHER({len(rest)}),,,"
+            f"{sum(float(p.get('value', 0)) for p in rest):.2f},"
+            f"{sum(float(p.get('weight', 0)) for p in rest) * 100:.1f},"
+            f"{sum(float(p.get('profit_loss', 0)) for p in rest):.2f}"
+        ]
 
-                ## Output Format
-                Token: [TOKEN_NAME]
-                Action: [BUY/SELL/HOLD],
-                Price: [PRICE],
-                Quantity: [QUANTITY],
-                Reasoning: [Detailed explanation including market analysis, portfolio fit, risk assessment, and diversification benefits]
-                """
+    lines = [PORTFOLIO_HEADER] + rows + [
+        f"total_value_usd={float(portfolio.get('total_holdings', 0)):.2f} "
+        f"total_pnl_usd={float(portfolio.get('total_profit_loss', 0)):.2f}"
+    ]
+
+    return "\n".join(lines)
+
+def build_prompt(portfolio: Dict, interest: Optional[str] = None, max_tokens: Optional[int] = None) -> Tuple[str, int]:
+    '''Prompt within the token budget, with as many individual positions as fit. Returns (prompt, estimated tokens).'''
+    max_tokens = max_tokens or LLM_MAX_INPUT_TOKENS
+
+    def render(max_rows: Optional[int]) -> str:
+        return PROMPT_TEMPLATE.format(portfolio=serialize_portfolio(portfolio, max_rows), interest=interest)
+
+    prompt = render(None)
+    positions = portfolio.get('positions', []) if isinstance(portfolio, dict) else []
+
+    if estimate_tokens(prompt) > max_tokens and len(positions) > 1:
+        # the prompt only shrinks as rows are folded into OTHER, so binary search the row count
+        low, high = 1, len(positions)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_tokens(render(middle)) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        prompt = render(low)
+
+    return prompt, estimate_tokens(prompt)
+
+def get_payload(portfolio: Dict, interest: Optional[str] = None):
+    prompt, tokens = build_prompt(portfolio, interest)
+    logger.info('Grok prompt: ~%d input tokens (budget %d)', tokens, LLM_MAX_INPUT_TOKENS)
+
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
             }
             ],
             "search_parameters": {
@@ -66,11 +145,102 @@ def get_payload(portfolio: Dict, interest: Optional[str] = None):
             "model": "grok-4"
         }
 
-def send_grok_request(payload: Dict):
-    headers = {
+def get_headers() -> Dict:
+    return {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {os.getenv('XAI_API_KEY')}"
     }
 
-    response = requests.post(grok_api_url, headers=headers, json=get_payload(payload))
+def send_grok_request(payload: Dict, interest: Optional[str] = None):
+    response = requests.post(grok_api_url, headers=get_headers(), json=get_payload(payload, interest))
+    return response.json()
+
+async def asend_grok_request(payload: Dict, client: httpx.AsyncClient, interest: Optional[str] = None):
+    # non-blocking twin of send_grok_request for the ASGI app
+    response = await client.post(grok_api_url, headers=get_headers(), json=get_payload(payload, interest))
     return response.json()
+
+STREAM_DONE = object()
+
+def parse_stream_line(line: str):
+    '''
+    One line of the provider's server-sent-events stream: returns the text
+    delta it carries, STREAM_DONE on `data: [DONE]`, or None for anything else.
+    '''
+    if not line or not line.startswith('data:'):
+        return None
+
+    data = line[len('data:'):].strip()
+
+    if data == '[DONE]':
+        return STREAM_DONE
+
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return None
+
+    choices = chunk.get('choices') or [{}]
+    return choices[0].get('delta', {}).get('content') or None
+
+def format_sse(data: Dict, event: Optional[str] = None) -> str:
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+class StreamTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.total = None
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.started
+            logger.info('Grok time to first token: %.3fs', self.first_token)
+
+    def done(self):
+        self.total = time.perf_counter() - self.started
+        logger.info('Grok stream finished in %.3fs (first token %ss)', self.total, self.first_token)
+
+    def summary(self) -> Dict:
+        return {'ttft_seconds': self.first_token, 'total_seconds': self.total}
+
+def stream_grok_request(payload: Dict, interest: Optional[str] = None, timer: Optional[StreamTimer] = None) -> Iterator[str]:
+    '''Yields the recommendation text as Grok generates it.'''
+    timer = timer or StreamTimer()
+    body = {**get_payload(payload, interest), "stream": True}
+
+    with requests.post(grok_api_url, headers=get_headers(), json=body, stream=True) as response:
+        response.raise_for_status()
+        # event streams are UTF-8, requests would fall back to ISO-8859-1 for a text/* type without a charset
+        response.encoding = 'utf-8'
+
+        for line in response.iter_lines(decode_unicode=True):
+            delta = parse_stream_line(line)
+
+            if delta is STREAM_DONE:
+                break
+
+            if delta:
+                timer.token()
+                yield delta
+
+    timer.done()
+
+async def astream_grok_request(payload: Dict, client: httpx.AsyncClient, interest: Optional[str] = None, timer: Optional[StreamTimer] = None) -> AsyncIterator[str]:
+    timer = timer or StreamTimer()
+    body = {**get_payload(payload, interest), "stream": True}
+
+    async with client.stream("POST", grok_api_url, headers=get_headers(), json=body) as response:
+        response.raise_for_status()
+
+        async for line in response.aiter_lines():
+            delta = parse_stream_line(line)
+
+            if delta is STREAM_DONE:
+                break
+
+            if delta:
+                timer.token()
+                yield delta
+
+    timer.done()
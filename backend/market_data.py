@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import aiohttp
+
+from data import TICKER_MAPPINGS
+
+'''
+Optional streaming market data.
+
+KrakenTickerFeed subscribes to the WebSocket v2 `ticker` channel for every pair
+in TICKER_MAPPINGS from a background thread and writes into a PriceBook, whose
+last prices the portfolio reads with no network round trip. When the feed has
+not heard from Kraken (ticker or heartbeat) for `stale_after` seconds the book
+reports nothing and callers fall back to REST Ticker.
+'''
+
+logger = logging.getLogger(__name__)
+
+KRAKEN_WS_URL = 'wss://ws.kraken.com/v2'
+
+
+class PriceBook:
+    def __init__(self, stale_after: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.stale_after = stale_after
+        self.clock = clock
+        self._prices: Dict[str, Dict] = {}
+        self._alive_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, pair: str, fields: Dict):
+        with self._lock:
+            self._prices[pair] = {**self._prices.get(pair, {}), **fields}
+            self._alive_at = self.clock()
+
+    def touch(self):
+        with self._lock:
+            self._alive_at = self.clock()
+
+    def mark_down(self):
+        with self._lock:
+            self._alive_at = None
+
+    def is_live(self) -> bool:
+        with self._lock:
+            return self._alive_at is not None and self.clock() - self._alive_at < self.stale_after
+
+    def last(self, pair: str) -> Optional[float]:
+        '''
+        Last trade price for the REST pair name, or None when the pair is
+        unknown or the feed is stale. Only the price is served from the feed:
+        its other fields are rolling 24h values and it carries no opening
+        price or trade count, so full Ticker entries stay on REST.
+        '''
+        if not self.is_live():
+            return None
+
+        with self._lock:
+            fields = self._prices.get(pair)
+
+        if not fields or fields.get('last') is None:
+            return None
+
+        return float(fields['last'])
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {pair: dict(fields) for pair, fields in self._prices.items()}
+
+
+def get_ws_symbols() -> Dict[str, str]:
+    '''WebSocket v2 symbol -> REST pair name, for every mapped asset.'''
+    symbols = {}
+
+    for mapping_info in TICKER_MAPPINGS.values():
+        usd_pairs = [pair for pair in mapping_info['kraken_fiat_pairs'] if 'USD' in pair]
+        if not usd_pairs:
+            continue
+
+        for symbol in mapping_info.get('kraken_ws_pairs', []):
+            symbols[symbol] = usd_pairs[0]
+
+    return symbols
+
+
+class KrakenTickerFeed:
+    def __init__(self, book: PriceBook, symbols: Dict[str, str], url: str = KRAKEN_WS_URL, backoff: float = 1.0, max_backoff: float = 60.0):
+        self.book = book
+        self.symbols = symbols
+        self.url = url
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connects = 0
+        self.messages = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'KrakenTickerFeed':
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), name='kraken-ticker-feed', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    async def run(self):
+        delay = self.backoff
+
+        while not self._stopped.is_set():
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url, heartbeat=30) as ws:
+                        self.connects += 1
+                        await ws.send_json(self.subscription())
+
+                        async for message in ws:
+                            if self._stopped.is_set():
+                                return
+
+                            if message.type != aiohttp.WSMsgType.TEXT:
+                                break
+
+                            self.handle(json.loads(message.data))
+                            delay = self.backoff
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+                logger.warning('Kraken ticker feed disconnected: %s', e)
+
+            self.book.mark_down()
+
+            if self._stopped.is_set():
+                return
+
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+            delay = min(self.max_backoff, delay * 2)
+
+    def subscription(self) -> Dict:
+        return {
+            'method': 'subscribe',
+            'params': {
+                'channel': 'ticker',
+                'symbol': list(self.symbols),
+            }
+        }
+
+    def handle(self, message: Dict):
+        self.messages += 1
+
+        if message.get('channel') == 'heartbeat':
+            self.book.touch()
+            return
+
+        if message.get('channel') != 'ticker':
+            return
+
+        for tick in message.get('data', []):
+            pair = self.symbols.get(tick.get('symbol'))
+            if pair is not None:
+                self.book.update(pair, tick)
+
+    def stats(self) -> Dict:
+        return {
+            'connects': self.connects,
+            'messages': self.messages,
+            'live': self.book.is_live(),
+            'pairs': list(self.book.snapshot()),
+        }
+
+
+def start_price_feed(url: Optional[str] = None, stale_after: float = 10.0, symbols: Optional[Dict[str, str]] = None) -> KrakenTickerFeed:
+    book = PriceBook(stale_after=stale_after)
+    return KrakenTickerFeed(book, symbols or get_ws_symbols(), url=url or KRAKEN_WS_URL).start()
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+from file_lock import CROSS_PROCESS, file_lock
+
+'''
+Kraken nonces that strictly increase across threads and worker processes.
+
+Kraken rejects a private call whose nonce is not greater than the last one it
+saw for the API key. Every process using the same key shares one counter
+file: a nonce is max(last + 1, clock in ms), read and written back under an
+exclusive flock, so concurrent callers anywhere on the host never reuse or
+reorder a value. Bursts of more than one call per millisecond run ahead of
+the clock by a little and fall back in step once the burst ends; staying
+on milliseconds keeps the values compatible with other clients of the key.
+
+Two requests can still reach Kraken in the opposite order of their nonces
+when they are sent concurrently. Kraken rejects the later-arriving one with
+`EAPI:Invalid nonce` without executing it, and the transport retries it with
+a fresh nonce (transport.RETRYABLE_ERRORS). Orders are not retried on it, see
+transport.py.
+'''
+
+COUNTER = struct.Struct('<Q')
+
+
+def default_path(api_key: Optional[str]) -> str:
+    # one counter per key, without putting the key itself in a file name
+    digest = hashlib.sha256((api_key or '').encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f'pocketbroker_nonce_{digest}')
+
+
+class NonceProvider:
+    def __init__(self, path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last = 0
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    def _file(self) -> int:
+        # a forked worker must not share the parent's descriptor: flock locks are per open file
+        if self._fd is None or self._pid != os.getpid():
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def next(self) -> int:
+        with self._lock:
+            now = int(self.clock() * 1000)
+
+            if self.path is None or not CROSS_PROCESS:
+                self._last = max(self._last + 1, now)
+                return self._last
+
+            with file_lock(self._file()) as fd:
+                data = os.pread(fd, COUNTER.size, 0)
+                last = COUNTER.unpack(data)[0] if len(data) == COUNTER.size else 0
+                self._last = max(last + 1, self._last + 1, now)
+                os.pwrite(fd, COUNTER.pack(self._last), 0)
+
+            return self._last
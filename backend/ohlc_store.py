@@ -0,0 +1,160 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+'''
+Local, persisted OHLC bars per Kraken pair and interval.
+
+Bars are stored column by column, one flat little-endian file per column
+({root}/{interval}/{pair}/{column}.bin), so a column is read as a memory-mapped
+NumPy array without parsing and only the columns a computation touches are
+paged in. New bars are only ever appended: update() asks Kraken's OHLC
+endpoint for bars after the last stored one, and only once a new bar can have
+been committed, so a store that is up to date costs no request at all.
+
+Kraken returns at most the 720 most recent bars per interval. Older history is
+whatever the store accumulated since it started, or what was loaded with
+append() (e.g. from Kraken's downloadable OHLCVT files).
+'''
+
+# Kraken's OHLC row: [time, open, high, low, close, vwap, volume, count]
+COLUMNS = {
+    'time': np.dtype('<i8'),
+    'open': np.dtype('<f8'),
+    'high': np.dtype('<f8'),
+    'low': np.dtype('<f8'),
+    'close': np.dtype('<f8'),
+    'vwap': np.dtype('<f8'),
+    'volume': np.dtype('<f8'),
+    'count': np.dtype('<i8'),
+}
+
+# intervals (minutes) Kraken serves OHLC for
+INTERVALS = (1, 5, 15, 30, 60, 240, 1440, 10080, 21600)
+
+
+class OHLCStore:
+    def __init__(self, root: str, fetch_ohlc: Callable[[str, int, Optional[int]], Tuple[Dict, Dict]], clock: Callable[[], float] = time.time):
+        '''
+        fetch_ohlc receives (pair, interval, since) and returns (result, error)
+        shaped like Kraken's OHLC result: {pair name: [rows], 'last': ...}.
+        '''
+        self.root = root
+        self.fetch_ohlc = fetch_ohlc
+        self.clock = clock
+        self._locks: Dict[Tuple[str, int], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._counters = {'updates': 0, 'upstream_requests': 0, 'bars_appended': 0, 'errors': 0}
+
+    def _dir(self, pair: str, interval: int) -> str:
+        # pair names are used as directory names, keep them to safe characters
+        return os.path.join(self.root, str(interval), re.sub(r'[^A-Za-z0-9._-]', '_', pair))
+
+    def _pair_lock(self, key: Tuple[str, int]) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _length(self, directory: str) -> int:
+        '''Complete rows on disk; an append interrupted between columns is cut back.'''
+        sizes = []
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(directory, name + '.bin')
+            sizes.append(os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0)
+        return min(sizes)
+
+    def bars(self, pair: str, interval: int = 60, columns: Tuple[str, ...] = ('time', 'close')) -> Dict[str, np.ndarray]:
+        '''
+        Read-only memory-mapped columns of every stored bar, oldest first. Maps
+        are not cached, every one holds a file descriptor until it is dropped.
+        '''
+        directory = self._dir(pair, interval)
+        n = self._length(directory)
+
+        if n == 0:
+            return {name: np.empty(0, dtype=COLUMNS[name]) for name in columns}
+
+        return {
+            name: np.memmap(os.path.join(directory, name + '.bin'), dtype=COLUMNS[name], mode='r', shape=(n,))
+            for name in columns
+        }
+
+    def last_time(self, pair: str, interval: int = 60) -> Optional[int]:
+        times = self.bars(pair, interval, ('time',))['time']
+        return int(times[-1]) if len(times) else None
+
+    def append(self, pair: str, interval: int, rows: List[List]) -> int:
+        '''
+        Appends Kraken OHLC rows newer than the last stored bar and returns how
+        many were added. Rows may be strings, as Kraken sends them, or a
+        numeric (n, 8) array.
+        '''
+        key = (pair, interval)
+        directory = self._dir(pair, interval)
+
+        with self._pair_lock(key):
+            os.makedirs(directory, exist_ok=True)
+            n = self._length(directory)
+
+            table = (rows if isinstance(rows, np.ndarray) else np.array(rows, dtype=object)).reshape(-1, len(COLUMNS))
+            times = table[:, 0].astype(np.float64).astype(np.int64)
+            last = self.last_time(pair, interval)
+            order = np.argsort(times, kind='stable')
+            keep = order[np.concatenate(([True], np.diff(times[order]) > 0))]
+            if last is not None:
+                keep = keep[times[keep] > last]
+
+            if not len(keep):
+                return 0
+
+            for i, (name, dtype) in enumerate(COLUMNS.items()):
+                column = table[keep, i].astype(np.float64).astype(dtype)
+                path = os.path.join(directory, name + '.bin')
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    f.truncate(n * dtype.itemsize)
+                    f.seek(n * dtype.itemsize)
+                    f.write(column.tobytes())
+
+        with self._lock:
+            self._counters['bars_appended'] += len(keep)
+        return len(keep)
+
+    def due(self, pair: str, interval: int = 60) -> bool:
+        '''Whether Kraken can have committed a bar after the last stored one.'''
+        last = self.last_time(pair, interval)
+        # the bar after `last` is still forming until last + 2 intervals
+        return last is None or self.clock() >= last + 2 * interval * 60
+
+    def update(self, pair: str, interval: int = 60) -> Tuple[int, Optional[str]]:
+        '''Fetches and stores the bars committed since the last update, returns (added, error).'''
+        if interval not in INTERVALS:
+            return 0, f'Unsupported interval {interval}, Kraken serves {", ".join(map(str, INTERVALS))} minutes'
+
+        with self._lock:
+            self._counters['updates'] += 1
+
+        if not self.due(pair, interval):
+            return 0, None
+
+        with self._lock:
+            self._counters['upstream_requests'] += 1
+
+        try:
+            result, error = self.fetch_ohlc(pair, interval, self.last_time(pair, interval))
+        except Exception as e:
+            result, error = None, [str(e)]
+
+        if error:
+            with self._lock:
+                self._counters['errors'] += 1
+            return 0, error
+
+        rows = next((value for name, value in result.items() if name != 'last'), [])
+        # the last row is the bar still forming, it changes until it is committed
+        return self.append(pair, interval, rows[:-1]), None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters)
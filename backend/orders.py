@@ -0,0 +1,155 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from utils import request
+from service import order_body
+
+'''
+Multi-leg order execution for /api/v1/orders/batch.
+
+Every leg is validated with service.order_body (pair, ordermin, lot and
+price decimals) before anything is sent, so one bad leg is reported without
+costing a round trip. Valid legs are grouped by pair: pairs with two or more
+legs go to Kraken's AddOrderBatch (at most BATCH_MAX_ORDERS per call), single
+legs to AddOrder, and those calls run concurrently, at most ORDER_CONCURRENCY
+at a time. Results come back per leg, in the order the legs were given:
+
+    {'leg': 0, 'pair': 'XXBTZUSD', 'side': 'buy', 'status': 'submitted', 'data': {'txid': [...], 'descr': {...}}}
+    {'leg': 1, 'pair': 'FOO/USD', 'side': 'buy', 'status': 'rejected', 'details': 'Unknown pair FOO/USD'}
+
+'rejected' legs were never sent, 'failed' legs were refused by Kraken or
+their call did not complete.
+'''
+
+# Kraken accepts 2 to 15 orders per AddOrderBatch, all on one pair
+BATCH_MAX_ORDERS = 15
+ORDER_CONCURRENCY = int(os.getenv('ORDER_CONCURRENCY', 4))
+MAX_LEGS = int(os.getenv('ORDER_BATCH_MAX_LEGS', 50))
+
+executor = ThreadPoolExecutor(max_workers=ORDER_CONCURRENCY, thread_name_prefix='orders')
+
+
+def plan_orders(legs: List[Dict], validate: bool = False) -> Tuple[List[Dict], List[Tuple[str, Dict, List[int]]]]:
+    '''
+    Returns (results, submissions): one result per leg, rejected legs
+    already filled in, and the (path, body, leg indexes) calls that submit
+    the valid ones.
+    '''
+    results = []
+    by_pair: Dict[str, List[Tuple[int, Dict]]] = {}
+
+    for index, leg in enumerate(legs):
+        result = {'leg': index, 'pair': leg.get('pair'), 'side': leg.get('side')}
+        results.append(result)
+
+        missing = [key for key in ('side', 'pair', 'amount') if leg.get(key) is None]
+        if missing:
+            result.update(status='rejected', details=f'Missing {", ".join(missing)}')
+            continue
+
+        body, error = order_body(leg['side'], leg['pair'], leg['amount'], leg.get('ordertype', 'market'), leg.get('price'))
+
+        if error:
+            result.update(status='rejected', details=error)
+            continue
+
+        result['pair'] = body['pair']
+        by_pair.setdefault(body['pair'], []).append((index, body))
+
+    submissions = []
+
+    for pair, orders in by_pair.items():
+        chunks = [orders[i:i + BATCH_MAX_ORDERS] for i in range(0, len(orders), BATCH_MAX_ORDERS)]
+
+        for chunk in chunks:
+            indexes = [index for index, _ in chunk]
+
+            if len(chunk) == 1:
+                body = dict(chunk[0][1])
+                if validate:
+                    body['validate'] = True
+                submissions.append(('/0/private/AddOrder', body, indexes))
+                continue
+
+            body = {
+                'pair': pair,
+                'orders': [{key: value for key, value in order.items() if key != 'pair'} for _, order in chunk],
+            }
+            if validate:
+                body['validate'] = True
+            submissions.append(('/0/private/AddOrderBatch', body, indexes))
+
+    return results, submissions
+
+
+def apply_response(results: List[Dict], path: str, indexes: List[int], status: Optional[int], json_data: Optional[Dict], error: Optional[List[str]] = None):
+    '''Fills in the results of one submission from Kraken's response (or the error that prevented one).'''
+    errors = error or (json_data or {}).get('error')
+
+    if errors or status != 200:
+        for index in indexes:
+            results[index].update(status='failed', details=errors or f'HTTP {status}')
+        return
+
+    if path == '/0/private/AddOrder':
+        results[indexes[0]].update(status='submitted', data=json_data['result'])
+        return
+
+    # AddOrderBatch answers per order, in the order they were sent
+    for index, order in zip(indexes, json_data['result']['orders']):
+        if order.get('error'):
+            results[index].update(status='failed', details=order['error'])
+        else:
+            results[index].update(status='submitted', data=order)
+
+
+def summarize(results: List[Dict]) -> Dict:
+    counts = {'submitted': 0, 'rejected': 0, 'failed': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return {'orders': results, **counts}
+
+
+def check_legs(legs) -> Optional[str]:
+    if not isinstance(legs, list) or not legs:
+        return 'orders must be a non-empty list of legs'
+
+    if len(legs) > MAX_LEGS:
+        return f'At most {MAX_LEGS} legs per batch'
+
+    if not all(isinstance(leg, dict) for leg in legs):
+        return 'Every leg must be an object'
+
+    return None
+
+
+def submit(path: str, body: Dict) -> Tuple[int, Dict]:
+    response = request(method="POST", path=path, body=body)
+    return response.status, json.loads(response.read().decode('utf-8'))
+
+
+def execute_orders(legs: List[Dict], validate: bool = False) -> Tuple[Dict, Dict]:
+    '''
+    Validates and submits many legs, returns ({'orders': per-leg results,
+    'submitted', 'rejected', 'failed'}, error). `validate` asks Kraken to
+    check the orders without placing them.
+    '''
+    error = check_legs(legs)
+
+    if error:
+        return None, error
+
+    results, submissions = plan_orders(legs, validate)
+    futures = [(path, indexes, executor.submit(submit, path, body)) for path, body, indexes in submissions]
+
+    for path, indexes, future in futures:
+        try:
+            status, json_data = future.result()
+        except Exception as e:
+            # the order may or may not have reached Kraken, so it is not retried
+            apply_response(results, path, indexes, None, None, [str(e)])
+        else:
+            apply_response(results, path, indexes, status, json_data)
+
+    return summarize(results), None
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+'''
+Kraken asset and pair names, resolved from the full AssetPairs and Assets
+lists instead of a hand-maintained mapping.
+
+Both lists are fetched once, written to a JSON file and reused until
+`refresh_interval` seconds old, so restarts and sibling workers start from
+disk. Lookups go through hash indexes built once per load:
+
+    asset code or altname -> asset code         (XBT -> XXBT, SOL -> SOL)
+    asset code            -> USD pair           (XXBT -> XXBTZUSD)
+    pair name, altname, wsname -> pair name     (XBTUSD, XBT/USD -> XXBTZUSD)
+    (base, quote)         -> pair name          (BTC/USD -> XXBTZUSD)
+
+When Kraken cannot be reached and there is no file yet, `seed` (asset ->
+pair, e.g. from TICKER_MAPPINGS) keeps the known pairs working and the load
+is retried after `retry_interval` seconds.
+'''
+
+# names users and other exchanges use for assets Kraken calls differently
+ASSET_ALIASES = {'BTC': 'XBT', 'DOGE': 'XDG'}
+
+
+class PairRegistry:
+    def __init__(
+        self,
+        fetch_pairs: Callable[[], Tuple[Dict, Dict]],
+        fetch_assets: Callable[[], Tuple[Dict, Dict]],
+        path: Optional[str] = None,
+        refresh_interval: float = 86400.0,
+        retry_interval: float = 60.0,
+        quote: str = 'ZUSD',
+        seed: Optional[Dict[str, str]] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self.fetch_pairs = fetch_pairs
+        self.fetch_assets = fetch_assets
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.quote = quote
+        self.seed = dict(seed or {})
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._fetched_at: Optional[float] = None
+        self._retry_at = 0.0
+        self._error = None
+        self._counters = {'loads_from_kraken': 0, 'loads_from_disk': 0, 'load_errors': 0}
+        self._build({}, {})
+
+    def _build(self, pairs: Dict, assets: Dict):
+        asset_codes = {}
+        for code, info in assets.items():
+            asset_codes[code] = code
+            asset_codes.setdefault(info.get('altname', code), code)
+
+        names, by_assets, usd = {}, {}, {}
+        for name, info in pairs.items():
+            # dark pool books (XBTUSD.d) share the base and quote of the lit pair
+            if name.endswith('.d'):
+                continue
+
+            names[name] = name
+            for alias in (info.get('altname'), info.get('wsname')):
+                if alias:
+                    names.setdefault(alias, name)
+
+            base, quote = info.get('base'), info.get('quote')
+            by_assets.setdefault((base, quote), name)
+            if quote == self.quote:
+                usd.setdefault(base, name)
+
+        for asset, pair in self.seed.items():
+            if pair not in pairs:
+                names.setdefault(pair, pair)
+                usd.setdefault(asset, pair)
+
+        self.pairs = pairs
+        self.assets = assets
+        self._asset_codes = asset_codes
+        self._names = names
+        self._by_assets = by_assets
+        self._usd = usd
+
+    def _read_file(self) -> Optional[Dict]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_file(self, snapshot: Dict):
+        if not self.path:
+            return
+
+        # write then rename, so a concurrent reader never sees half a file
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self.path)
+
+    def _load(self, force: bool = False):
+        now = self.clock()
+        if now < self._retry_at and not force:
+            return
+
+        snapshot = self._read_file()
+
+        if snapshot and not force and now - snapshot['fetched_at'] < self.refresh_interval:
+            self._counters['loads_from_disk'] += 1
+            self._fetched_at = snapshot['fetched_at']
+            self._build(snapshot['pairs'], snapshot['assets'])
+            return
+
+        try:
+            pairs, error = self.fetch_pairs()
+            assets = None
+            if not error:
+                assets, error = self.fetch_assets()
+        except Exception as e:
+            # a registry refresh must never fail the request that triggered it
+            pairs, assets, error = None, None, [str(e)]
+
+        if error:
+            self._counters['load_errors'] += 1
+            self._error = error
+            self._retry_at = now + self.retry_interval
+
+            # a stale file beats the seed
+            if snapshot and self._fetched_at is None:
+                self._fetched_at = snapshot['fetched_at']
+                self._build(snapshot['pairs'], snapshot['assets'])
+            return
+
+        self._counters['loads_from_kraken'] += 1
+        self._error = None
+        self._fetched_at = now
+        self._build(pairs, assets)
+        self._write_file({'fetched_at': now, 'pairs': pairs, 'assets': assets})
+
+    def load(self, force: bool = False) -> 'PairRegistry':
+        '''Loads or refreshes the lists if they are missing or older than the refresh interval.'''
+        fetched_at = self._fetched_at
+        if not force and fetched_at is not None and self.clock() - fetched_at < self.refresh_interval:
+            return self
+
+        with self._lock:
+            if force or self._fetched_at is None or self.clock() - self._fetched_at >= self.refresh_interval:
+                self._load(force)
+
+        return self
+
+    def asset_code(self, asset: str) -> Optional[str]:
+        self.load()
+        asset = asset.upper()
+        codes = self._asset_codes
+        return codes.get(asset) or codes.get(ASSET_ALIASES.get(asset, '')) or (asset if asset in self._usd else None)
+
+    def usd_pair(self, asset: str) -> Optional[str]:
+        '''
+        USD pair to price a Balance key with. Earning and staking balances
+        (SOL.S, XBT.M, ETH.F) are priced with their underlying asset's pair.
+        '''
+        self.load()
+        candidates = [asset, asset.split('.', 1)[0]] if '.' in asset else [asset]
+
+        for candidate in candidates:
+            code = self.asset_code(candidate)
+            if code is not None and code in self._usd:
+                return self._usd[code]
+
+        return None
+
+    def resolve(self, name: str) -> Optional[str]:
+        '''Pair name for a pair name, altname, wsname or BASE/QUOTE in any common spelling.'''
+        self.load()
+        name = name.strip().upper()
+
+        pair = self._names.get(name)
+        if pair is not None:
+            return pair
+
+        if '/' in name:
+            base, quote = (self.asset_code(part) for part in name.split('/', 1))
+            return self._by_assets.get((base, quote))
+
+        return None
+
+    def find(self, symbol1: str, symbol2: str) -> Dict[str, Dict]:
+        '''AssetPairs-shaped {pair name: info} for the pair trading symbol1 against symbol2.'''
+        pair = self.resolve(f'{symbol1}/{symbol2}')
+        return {pair: self.pairs[pair]} if pair in self.pairs else {}
+
+    def info(self, pair: str) -> Optional[Dict]:
+        '''AssetPairs entry (ordermin, lot_decimals, ...) of a resolvable pair.'''
+        name = self.resolve(pair)
+        return self.pairs.get(name) if name else None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.pairs)
+
+    def stats(self) -> Dict:
+        return {
+            **self._counters,
+            'pairs': len(self.pairs),
+            'assets': len(self.assets),
+            'usd_pairs': len(self._usd),
+            'fetched_at': self._fetched_at,
+            'last_error': self._error,
+        }
+
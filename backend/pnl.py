@@ -0,0 +1,178 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+'''
+Per-pair profit and loss from Kraken trades, lot by lot.
+
+Every buy opens a lot holding its volume and what it cost, its fee included.
+A sell closes volume in 'fifo' mode from the oldest lots, in 'average' mode
+from the pooled lots at their average cost; the proceeds less the sell's fee
+less the cost of the closed volume is realized. What the remaining volume
+would sell for at a price, less its cost, is unrealized:
+
+    book = PnLBook('fifo')
+    book.apply({'pair': 'XXBTZUSD', 'type': 'buy', 'vol': '0.1', 'cost': '6000', 'fee': '15.6', 'time': ...})
+    book.mark('XXBTZUSD', 62000.0)   # -> unrealized of the pair
+    book.totals()                    # {'realized', 'unrealized', 'fees'}
+
+A trade costs O(1) (amortized for fifo: a lot is opened once and closed
+once) and so does a price tick, so state is kept up to date as trades and
+prices arrive rather than recomputed from the history.
+
+Volume sold beyond what the trades bought (deposits, history older than the
+ledger) has no known cost; it is counted as `unmatched` and left out of
+realized.
+'''
+
+METHODS = ('fifo', 'average')
+
+# volume below this is float noise left by partial closes
+DUST = 1e-12
+
+
+class PairBook:
+    __slots__ = ('pair', 'method', 'amount', 'cost', 'fee', 'realized', 'trades', 'last_time', 'unmatched', 'lots')
+
+    def __init__(self, pair: str, method: str = 'fifo'):
+        if method not in METHODS:
+            raise ValueError(f'Unknown P&L method {method}, expected one of {", ".join(METHODS)}')
+
+        self.pair = pair
+        self.method = method
+        self.amount = 0.0        # volume held
+        self.cost = 0.0          # what the volume held cost, buy fees included
+        self.fee = 0.0           # every fee paid on the pair
+        self.realized = 0.0
+        self.trades = 0
+        self.last_time = 0.0
+        self.unmatched = 0.0
+        self.lots = deque()      # fifo: [volume, cost] per open lot, oldest first
+
+    def apply(self, side: str, vol: float, cost: float, fee: float, time: float = 0.0) -> float:
+        '''Books one trade and returns the P&L it realized.'''
+        self.trades += 1
+        self.fee += fee
+        self.last_time = max(self.last_time, time)
+
+        if side == 'buy':
+            self.amount += vol
+            self.cost += cost + fee
+            if self.method == 'fifo':
+                self.lots.append([vol, cost + fee])
+            return 0.0
+
+        closed, closed_cost = self._close(vol)
+        self.unmatched += vol - closed
+
+        realized = (cost - fee) * (closed / vol) - closed_cost if vol > 0 else -fee
+        self.realized += realized
+        return realized
+
+    def _close(self, vol: float):
+        '''Takes up to `vol` off the lots, returns (volume closed, its cost).'''
+        if self.method == 'average':
+            closed = min(vol, self.amount)
+            closed_cost = self.cost * closed / self.amount if self.amount > 0 else 0.0
+        else:
+            remaining, closed_cost = vol, 0.0
+            while remaining > DUST and self.lots:
+                lot = self.lots[0]
+                if lot[0] <= remaining + DUST:
+                    remaining -= lot[0]
+                    closed_cost += lot[1]
+                    self.lots.popleft()
+                else:
+                    part = lot[1] * remaining / lot[0]
+                    lot[0] -= remaining
+                    lot[1] -= part
+                    closed_cost += part
+                    remaining = 0.0
+            closed = vol - max(remaining, 0.0)
+
+        self.amount -= closed
+        self.cost -= closed_cost
+        if self.amount <= DUST:
+            self.amount, self.cost = 0.0, 0.0
+            self.lots.clear()
+        return closed, closed_cost
+
+    def unrealized(self, price: float) -> float:
+        return self.amount * price - self.cost
+
+    def to_dict(self) -> Dict:
+        return {
+            'pair': self.pair,
+            'method': self.method,
+            'amount': self.amount,
+            'cost': self.cost,
+            'average_price': self.cost / self.amount if self.amount else 0.0,
+            'fee': self.fee,
+            'realized': self.realized,
+            'unmatched': self.unmatched,
+            'trades': self.trades,
+            'last_time': self.last_time,
+        }
+
+
+def unrealized_profit_loss(position: Dict, price: float) -> float:
+    '''Unrealized P&L of a position dict (PairBook.to_dict) at `price`.'''
+    return position['amount'] * price - position['cost']
+
+
+class PnLBook:
+    '''PairBooks by pair, with running totals kept as trades and prices arrive.'''
+
+    def __init__(self, method: str = 'fifo'):
+        if method not in METHODS:
+            raise ValueError(f'Unknown P&L method {method}, expected one of {", ".join(METHODS)}')
+
+        self.method = method
+        self.books: Dict[str, PairBook] = {}
+        self.prices: Dict[str, float] = {}
+        self.realized = 0.0
+        self.unrealized = 0.0
+        self.fees = 0.0
+
+    def _marked(self, pair: str) -> float:
+        price = self.prices.get(pair)
+        return self.books[pair].unrealized(price) if price is not None and pair in self.books else 0.0
+
+    def apply(self, trade: Dict) -> PairBook:
+        '''Books a TradesHistory trade (strings or numbers), in time order per pair.'''
+        pair = trade['pair']
+        book = self.books.get(pair)
+        if book is None:
+            book = self.books[pair] = PairBook(pair, self.method)
+
+        before = self._marked(pair)
+        fee = float(trade['fee'])
+        self.realized += book.apply(trade['type'], float(trade['vol']), float(trade['cost']), fee, float(trade['time']))
+        self.fees += fee
+        self.unrealized += self._marked(pair) - before
+        return book
+
+    def rebuild(self, pair: str, trades: Iterable[Dict]):
+        '''Replaces a pair's book with one built from all of its trades, oldest first.'''
+        old = self.books.pop(pair, None)
+        if old is not None:
+            self.realized -= old.realized
+            self.fees -= old.fee
+            if pair in self.prices:
+                self.unrealized -= old.unrealized(self.prices[pair])
+
+        for trade in trades:
+            self.apply(trade)
+
+    def mark(self, pair: str, price: float) -> float:
+        '''Records a price for the pair and returns its unrealized P&L.'''
+        before = self._marked(pair)
+        self.prices[pair] = price
+        after = self._marked(pair)
+        self.unrealized += after - before
+        return after
+
+    def positions(self, pairs: Optional[List[str]] = None) -> Dict[str, Dict]:
+        return {pair: book.to_dict() for pair, book in self.books.items() if pairs is None or pair in pairs}
+
+    def totals(self) -> Dict:
+        return {'realized': self.realized, 'unrealized': self.unrealized, 'fees': self.fees}
@@ -0,0 +1,227 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+'''
+Client-side model of Kraken's per-API-key call counter, used to pace private
+calls instead of letting bursts fail with `EAPI:Rate limit exceeded`.
+
+Every private call adds its cost to the counter, which decays at a fixed
+rate per second; a call that would push it past the tier maximum is
+rejected by Kraken. Calls are queued here and admitted in priority order
+(orders first, then reads, FIFO within a priority) as soon as the decayed
+counter has room for them. Order placement and cancellation are metered by
+the matching engine's own limiter and cost nothing on this counter, so
+they are never held back behind reads.
+
+The counter is per API key but this model is per process: with several
+workers on one key give each a proportional share via `max_counter`.
+
+Everything reads time through `clock`, so `submit` + `admit` can be driven
+step by step with a fake clock (see testing/bench_rate_limit.py).
+'''
+
+# (counter maximum, decay per second) per Kraken verification tier
+TIERS = {
+    'starter': (15, 0.33),
+    'intermediate': (20, 0.5),
+    'pro': (20, 1.0),
+}
+
+ORDER_PATHS = {
+    '/0/private/AddOrder', '/0/private/AddOrderBatch', '/0/private/EditOrder',
+    '/0/private/CancelOrder', '/0/private/CancelOrderBatch', '/0/private/CancelAll',
+}
+
+# ledger and trade history queries cost 2, anything not listed costs 1
+CALL_COSTS = {
+    '/0/private/TradesHistory': 2,
+    '/0/private/QueryTrades': 2,
+    '/0/private/Ledgers': 2,
+    '/0/private/QueryLedgers': 2,
+    **{path: 0 for path in ORDER_PATHS},
+}
+
+PRIORITY_ORDER = 0
+PRIORITY_READ = 1
+PRIORITY_NAMES = {PRIORITY_ORDER: 'orders', PRIORITY_READ: 'reads'}
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+class Ticket:
+    __slots__ = ('path', 'cost', 'priority', 'queued_at', 'admitted_at')
+
+    def __init__(self, path: str, cost: float, priority: int, queued_at: float):
+        self.path = path
+        self.cost = cost
+        self.priority = priority
+        self.queued_at = queued_at
+        self.admitted_at: Optional[float] = None
+
+    @property
+    def wait(self) -> Optional[float]:
+        return None if self.admitted_at is None else self.admitted_at - self.queued_at
+
+
+class CallCounterScheduler:
+    def __init__(self, max_counter: float = 15, decay: float = 0.33, costs: Optional[Dict[str, float]] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_counter = max_counter
+        self.decay = decay
+        self.costs = CALL_COSTS if costs is None else costs
+        self.clock = clock
+
+        self.counter = 0.0
+        self._updated = clock()
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._counters = {'admitted': 0, 'delayed': 0, 'timeouts': 0, 'penalties': 0, 'max_queue_depth': 0}
+        self._waits = {name: {'admitted': 0, 'total_wait': 0.0, 'max_wait': 0.0} for name in PRIORITY_NAMES.values()}
+
+    @classmethod
+    def for_tier(cls, tier: str, **kwargs) -> 'CallCounterScheduler':
+        max_counter, decay = TIERS[tier]
+        return cls(max_counter=max_counter, decay=decay, **kwargs)
+
+    def cost(self, path: str) -> float:
+        return self.costs.get(path, 1)
+
+    def priority(self, path: str) -> int:
+        return PRIORITY_ORDER if path in ORDER_PATHS else PRIORITY_READ
+
+    def _decay(self, now: float):
+        self.counter = max(0.0, self.counter - (now - self._updated) * self.decay)
+        self._updated = now
+
+    def submit(self, path: str) -> Ticket:
+        '''Queues a call; it may go once admit() has marked it admitted.'''
+        with self._cond:
+            ticket = Ticket(path, self.cost(path), self.priority(path), self.clock())
+            heapq.heappush(self._queue, (ticket.priority, next(self._seq), ticket))
+            self._counters['max_queue_depth'] = max(self._counters['max_queue_depth'], len(self._queue))
+            return ticket
+
+    def admit(self) -> Optional[float]:
+        '''
+        Admits queued calls in priority order while the counter has room and
+        returns the seconds until the next one can go (None when the queue is
+        empty). Strictly head of line, so a cheap read never overtakes an
+        expensive one queued before it.
+        '''
+        with self._cond:
+            now = self.clock()
+            self._decay(now)
+            admitted = False
+
+            while self._queue:
+                ticket = self._queue[0][2]
+                excess = self.counter + ticket.cost - self.max_counter
+
+                if excess > 1e-9:
+                    if admitted:
+                        self._cond.notify_all()
+                    return excess / self.decay
+
+                heapq.heappop(self._queue)
+                self.counter += ticket.cost
+                ticket.admitted_at = now
+                admitted = True
+                self._record(ticket)
+
+            if admitted:
+                self._cond.notify_all()
+            return None
+
+    def _record(self, ticket: Ticket):
+        wait = ticket.wait
+        waits = self._waits[PRIORITY_NAMES[ticket.priority]]
+        waits['admitted'] += 1
+        waits['total_wait'] += wait
+        waits['max_wait'] = max(waits['max_wait'], wait)
+        self._counters['admitted'] += 1
+        # more than lock contention, the counter held it back
+        if wait > 1e-3:
+            self._counters['delayed'] += 1
+
+    def _cancel(self, ticket: Ticket):
+        self._queue = [entry for entry in self._queue if entry[2] is not ticket]
+        heapq.heapify(self._queue)
+        self._counters['timeouts'] += 1
+        self._cond.notify_all()
+
+    def acquire(self, path: str, timeout: Optional[float] = None) -> float:
+        '''Blocks until the call may be sent and returns how long it waited.'''
+        ticket = self.submit(path)
+        deadline = None if timeout is None else ticket.queued_at + timeout
+
+        with self._cond:
+            while True:
+                delay = self.admit()
+
+                if ticket.admitted_at is not None:
+                    return ticket.wait
+
+                if deadline is not None:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        self._cancel(ticket)
+                        raise RateLimitTimeout(f'{path} waited more than {timeout}s for the Kraken rate limit')
+                    delay = remaining if delay is None else min(delay, remaining)
+
+                # woken early when another waiter admits this ticket
+                self._cond.wait(delay)
+
+    async def acquire_async(self, path: str, timeout: Optional[float] = None) -> float:
+        ticket = self.submit(path)
+        deadline = None if timeout is None else ticket.queued_at + timeout
+
+        while True:
+            delay = self.admit()
+
+            if ticket.admitted_at is not None:
+                return ticket.wait
+
+            if deadline is not None:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    with self._cond:
+                        self._cancel(ticket)
+                    raise RateLimitTimeout(f'{path} waited more than {timeout}s for the Kraken rate limit')
+                delay = remaining if delay is None else min(delay, remaining)
+
+            try:
+                await asyncio.sleep(delay or 0)
+            except asyncio.CancelledError:
+                # a cancelled caller (a portfolio past its deadline) must not hold the head of the queue
+                with self._cond:
+                    if ticket.admitted_at is None:
+                        self._cancel(ticket)
+                raise
+
+    def penalize(self):
+        '''Kraken rejected a call for rate limit: the real counter is full, whatever the model says.'''
+        with self._cond:
+            self._decay(self.clock())
+            self.counter = self.max_counter
+            self._counters['penalties'] += 1
+
+    def stats(self) -> Dict:
+        with self._cond:
+            self._decay(self.clock())
+            return {
+                **self._counters,
+                'counter': round(self.counter, 3),
+                'max_counter': self.max_counter,
+                'decay_per_second': self.decay,
+                'queue_depth': len(self._queue),
+                'wait': {
+                    name: {**waits, 'avg_wait': waits['total_wait'] / waits['admitted'] if waits['admitted'] else 0.0}
+                    for name, waits in self._waits.items()
+                },
+            }
@@ -0,0 +1,328 @@
+import json
+import os
+import tempfile
+from typing import Dict, List, Mapping, Optional, Tuple
+import numpy as np
+from utils import request
+from service import retrieve_portfolio, pair_registry, executor
+from ohlc_store import OHLCStore, INTERVALS
+
+'''
+Portfolio risk from the local OHLC store, for /api/v1/portfolio/risk.
+
+The close of every held pair is laid on one time grid (forward filled, NaN
+before a pair's first bar) and everything is computed from that T x N matrix
+in one pass, without a Python loop over bars or pairs:
+
+- volatility per pair and of the portfolio, over the whole lookback and over
+  the last `window` bars, annualized for a market that trades all year;
+- the rolling portfolio volatility series, from cumulative sums;
+- the correlation matrix, pairwise over the bars both pairs have;
+- historical VaR and CVaR of a one-bar portfolio return;
+- max drawdown per pair and of the portfolio.
+
+Portfolio returns weight each pair by its current value; cash (USD) is part
+of the total and returns nothing. The portfolio series starts at the first
+bar every held pair has, so with a lookback longer than the stored history
+(Kraken sends at most 720 bars per fetch) it is bounded by the shortest
+history rather than padded with flat returns.
+'''
+
+DEFAULT_INTERVAL = int(os.getenv('RISK_INTERVAL_MINUTES', 60))
+DEFAULT_LOOKBACK_DAYS = float(os.getenv('RISK_LOOKBACK_DAYS', 365))
+DEFAULT_WINDOW_DAYS = float(os.getenv('RISK_WINDOW_DAYS', 30))
+DEFAULT_CONFIDENCE = 0.95
+
+# points of the rolling volatility series returned, it is thinned to at most this many
+SERIES_POINTS = 500
+
+SECONDS_PER_YEAR = 365 * 86400
+
+
+def fetch_ohlc(pair: str, interval: int, since: Optional[int]) -> Tuple[Dict, Dict]:
+    query = {'pair': pair, 'interval': interval}
+    if since is not None:
+        query['since'] = since
+
+    response = request(
+        method="GET",
+        path="/0/public/OHLC",
+        query=query
+    )
+
+    json_data = json.loads(response.read().decode('utf-8'))
+
+    if response.status != 200 or ('error' in json_data and len(json_data['error'])):
+        return None, json_data['error']
+
+    return json_data['result'], None
+
+ohlc_store = OHLCStore(
+    root=os.getenv('OHLC_STORE_PATH') or os.path.join(tempfile.gettempdir(), 'pocketbroker_ohlc'),
+    fetch_ohlc=fetch_ohlc
+)
+
+
+def align(store: OHLCStore, pairs: List[str], interval: int, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''(grid, closes): bar times from start to end and the T x N closes on them.'''
+    step = interval * 60
+    grid = np.arange(start - start % step, end + 1, step, dtype=np.int64)
+    # filled a pair (row) at a time, handed out transposed
+    closes = np.full((len(pairs), len(grid)), np.nan)
+
+    for j, pair in enumerate(pairs):
+        bars = store.bars(pair, interval)
+        times = bars['time']
+
+        # bars up to the grid's first point, and up to its last
+        before, inside = np.searchsorted(times, grid[[0, -1]], side='right')
+
+        # index of the last bar at or before every grid point, i.e. forward filled:
+        # a bar lands on the first grid point at or after it, the latest bar on a point wins
+        last = np.full(len(grid), -1)
+        last[0] = before - 1
+        at = -((grid[0] - times[before:inside]) // step)
+        latest = np.append(at[1:] != at[:-1], True)
+        last[at[latest]] = np.arange(before, inside)[latest]
+        last = np.maximum.accumulate(last)
+
+        found = np.flatnonzero(last >= 0)
+        if len(found):
+            closes[j, found[0]:] = bars['close'][last[found[0]:]]
+
+    return grid, closes.T
+
+
+def suffix_sums(values: np.ndarray, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    (boundaries, table): table[k, j] is the sum of column j from row
+    boundaries[k] to the end, for every distinct row in `starts` (and the end
+    itself). One pass over `values`, however many starts.
+    '''
+    boundaries = np.unique(np.append(starts, len(values)))
+    table = np.zeros((len(boundaries), values.shape[1]))
+    if len(boundaries) > 1:
+        blocks = np.add.reduceat(values, boundaries[:-1], axis=0)
+        table[:-1] = np.cumsum(blocks[::-1], axis=0)[::-1]
+    return boundaries, table
+
+
+def lookup(boundaries: np.ndarray, table: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    '''Sum of column j from row starts[j, ...] on; starts indexes columns on its first axis.'''
+    columns = np.arange(table.shape[1]).reshape((-1,) + (1,) * (starts.ndim - 1))
+    return table[np.searchsorted(boundaries, starts), columns]
+
+
+def variance(n: np.ndarray, total: np.ndarray, squares: np.ndarray) -> np.ndarray:
+    '''Sample variance from a count, sum and sum of squares, NaN with fewer than 2.'''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 1, np.maximum(squares - total * total / n, 0.0) / (n - 1), np.nan)
+
+
+def drawdown(values: np.ndarray) -> np.ndarray:
+    '''Max drawdown of every column (fraction of the running peak), NaN for a column without values.'''
+    peak = np.fmax.accumulate(values, axis=0)
+    return 1 - np.fmin.reduce(values / peak, axis=0)
+
+
+def risk_metrics(closes: np.ndarray, weights: np.ndarray, interval: int, window: int, confidence: float) -> Dict:
+    '''
+    Every metric from a T x N closes matrix as align() gives it and the N pair
+    weights (fractions of the whole portfolio).
+
+    Closes are forward filled, so a pair has a return for every bar from its
+    first one on and "the bars both pairs have" are the bars since the later
+    of the two starts. Every sum over such a span is read from suffix sums
+    taken at the few distinct start rows, which leaves one N x N matrix
+    product (for the cross terms) as the only work above O(T * N). The
+    portfolio series (VaR, volatility, drawdown) covers the rows from
+    `portfolio_start` on, where every held pair has data.
+    '''
+    annualize = np.sqrt(SECONDS_PER_YEAR / (interval * 60))
+    bars = len(closes) - 1
+
+    listed = np.isfinite(closes)
+    first = np.where(listed.any(axis=0), listed.argmax(axis=0), bars)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = closes[1:] / closes[:-1] - 1
+    # before a pair's first bar, and a zero close if Kraken ever sent one
+    returns[~np.isfinite(returns)] = 0.0
+
+    count = bars - first
+    recent = np.maximum(first, bars - window)
+    both = np.maximum.outer(first, first)
+
+    starts = np.concatenate((first, recent))
+    boundaries, sums = suffix_sums(returns, starts)
+    _, squares = suffix_sums(returns * returns, starts)
+
+    def volatility(since: np.ndarray) -> np.ndarray:
+        return np.sqrt(variance(bars - since, lookup(boundaries, sums, since), lookup(boundaries, squares, since))) * annualize
+
+    # pairwise: sums of column i over the rows both i and j have
+    n = bars - both
+    sx, sxx = lookup(boundaries, sums, both), lookup(boundaries, squares, both)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = returns.T @ returns - sx * sx.T / n
+        spread = np.maximum(sxx - sx * sx / n, 0.0)
+        corr = cov / np.sqrt(spread * spread.T)
+    corr[n < 3] = np.nan
+
+    # the portfolio series starts once every held pair with stored bars has returns,
+    # earlier rows would count the pairs not yet listed as flat
+    held = (weights != 0) & (first < bars)
+    start = int(first[held].max()) if held.any() else 0
+
+    portfolio = returns[start:] @ weights
+    steps = len(portfolio)
+    value = np.concatenate(([1.0], np.cumprod(1 + portfolio)))
+    running = np.concatenate(([0.0], np.cumsum(portfolio)))
+    running_sq = np.concatenate(([0.0], np.cumsum(portfolio * portfolio)))
+
+    # rolling std of the portfolio return, one value per bar from `window` on
+    rolling = np.empty(0)
+    if steps >= window > 1:
+        total, total_sq = running[window:] - running[:-window], running_sq[window:] - running_sq[:-window]
+        rolling = np.sqrt(variance(window, total, total_sq)) * annualize
+
+    var = cvar = 0.0
+    if steps:
+        var = -float(np.quantile(portfolio, 1 - confidence))
+        cvar = -float(portfolio[portfolio <= -var].mean())
+
+    def portfolio_volatility(since: int) -> float:
+        n = steps - since
+        return float(np.sqrt(variance(n, running[-1] - running[since], running_sq[-1] - running_sq[since])) * annualize)
+
+    return {
+        'count': count,
+        'volatility': volatility(first),
+        'volatility_window': volatility(recent),
+        'portfolio_volatility': portfolio_volatility(0),
+        'portfolio_volatility_window': portfolio_volatility(max(0, steps - window)),
+        'portfolio_start': start,
+        'rolling_volatility': rolling,
+        'correlation': corr,
+        'var': var,
+        'cvar': cvar,
+        'max_drawdown': drawdown(closes),
+        'portfolio_max_drawdown': float(drawdown(value[:, None])[0]),
+    }
+
+
+def rounded(values: np.ndarray, digits: int = 6) -> List:
+    '''JSON-ready list, NaN as None.'''
+    values = np.round(values, digits).astype(object)
+    values[~np.isfinite(values.astype(np.float64))] = None
+    return values.tolist()
+
+
+def check_params(interval: int, lookback_days: float, window_days: float, confidence: float) -> Optional[str]:
+    if interval not in INTERVALS:
+        return f'interval must be one of {", ".join(map(str, INTERVALS))} (minutes)'
+
+    if not 0 < window_days <= lookback_days:
+        return 'window_days must be positive and at most lookback_days'
+
+    if not 0.5 <= confidence < 1:
+        return 'confidence must be in [0.5, 1)'
+
+    return None
+
+
+def risk_params(args: Mapping[str, str]) -> Tuple[Dict, Optional[str]]:
+    '''Keyword arguments of portfolio_risk from query parameters, or an error.'''
+    try:
+        params = {
+            'interval': int(args.get('interval', DEFAULT_INTERVAL)),
+            'lookback_days': float(args.get('lookback_days', DEFAULT_LOOKBACK_DAYS)),
+            'window_days': float(args.get('window_days', DEFAULT_WINDOW_DAYS)),
+            'confidence': float(args.get('confidence', DEFAULT_CONFIDENCE)),
+        }
+    except ValueError as e:
+        return None, f'Invalid parameter: {e}'
+
+    return params, check_params(**params)
+
+
+def portfolio_weights(portfolio: Dict) -> Dict[str, float]:
+    '''{pair: fraction of total holdings}, staked balances (SOL.S) added to their asset's pair.'''
+    weights: Dict[str, float] = {}
+    total = portfolio['total_holdings']
+
+    for position in portfolio['positions']:
+        pair = pair_registry.usd_pair(position['symbol']) if position['symbol'] != 'USD' else None
+        if pair is None or not total:
+            continue
+        weights[pair] = weights.get(pair, 0.0) + position['value'] / total
+
+    return weights
+
+
+def portfolio_risk(portfolio: Dict, interval: int = DEFAULT_INTERVAL, lookback_days: float = DEFAULT_LOOKBACK_DAYS, window_days: float = DEFAULT_WINDOW_DAYS, confidence: float = DEFAULT_CONFIDENCE, end: Optional[int] = None) -> Tuple[Dict, Dict]:
+    '''
+    Risk of a portfolio as retrieve_portfolio returns it. Stored bars are
+    brought up to date first (one OHLC request per pair with a new bar due).
+    '''
+    error = check_params(interval, lookback_days, window_days, confidence)
+
+    if error:
+        return None, error
+
+    weights = portfolio_weights(portfolio)
+    pairs = list(weights)
+
+    errors = {}
+    for pair, (_, error) in zip(pairs, executor.map(lambda pair: ohlc_store.update(pair, interval), pairs)):
+        if error:
+            errors[pair] = error
+
+    end = int(end if end is not None else ohlc_store.clock())
+    grid, closes = align(ohlc_store, pairs, interval, end - int(lookback_days * 86400), end)
+    window = max(2, int(window_days * 1440 / interval))
+    metrics = risk_metrics(closes, np.array([weights[pair] for pair in pairs]), interval, window, confidence)
+
+    total = portfolio['total_holdings']
+    stride = max(1, -(-len(metrics['rolling_volatility']) // SERIES_POINTS))
+    series_time = grid[1 + metrics['portfolio_start']:][window - 1:][::-1][::stride][::-1]
+    series = metrics['rolling_volatility'][::-1][::stride][::-1]
+
+    return {
+        'interval': interval,
+        'bars': len(grid),
+        'start': int(grid[0]),
+        'end': int(grid[-1]),
+        'confidence': confidence,
+        'window_bars': window,
+        'pairs': pairs,
+        'weights': [weights[pair] for pair in pairs],
+        'returns_per_pair': metrics['count'].tolist(),
+        'portfolio': {
+            # the stored history of the shortest held pair bounds the portfolio series
+            'start': int(grid[metrics['portfolio_start']]) if len(grid) else None,
+            'bars': max(0, len(grid) - 1 - metrics['portfolio_start']),
+            'volatility': metrics['portfolio_volatility'],
+            'volatility_window': metrics['portfolio_volatility_window'],
+            'var': metrics['var'],
+            'cvar': metrics['cvar'],
+            'var_usd': metrics['var'] * total,
+            'cvar_usd': metrics['cvar'] * total,
+            'max_drawdown': metrics['portfolio_max_drawdown'],
+        },
+        'volatility': rounded(metrics['volatility']),
+        'volatility_window': rounded(metrics['volatility_window']),
+        'max_drawdown': rounded(metrics['max_drawdown']),
+        'correlation': rounded(metrics['correlation'], 4),
+        'rolling_volatility': {'time': series_time.tolist(), 'value': rounded(series)},
+        'stale': errors,
+    }, None
+
+
+def retrieve_portfolio_risk(**params) -> Tuple[Dict, Dict]:
+    portfolio, error = retrieve_portfolio()
+
+    if error:
+        return None, error
+
+    return portfolio_risk(portfolio, **params)
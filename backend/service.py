@@ -1,8 +1,27 @@
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import contextvars
+from decimal import Decimal, InvalidOperation, ROUND_DOWN
 import json
+import os
+import tempfile
+import time
 from typing import Dict, Optional, Tuple, List
-from utils import request
+from utils import request, rate_limit_deadline, KRAKEN_API_KEY
 from data import TICKER_MAPPINGS
+from ticker_cache import TickerCache
+from ledger import TradeLedger, default_path
+from pnl import unrealized_profit_loss
+from market_data import start_price_feed
+from pair_registry import PairRegistry
+
+# 'concurrent' fans Balance, TradesHistory and Ticker out in parallel, 'serial' chains them
+PORTFOLIO_FANOUT = os.getenv('PORTFOLIO_FANOUT', 'concurrent')
+PORTFOLIO_DEADLINE = float(os.getenv('PORTFOLIO_DEADLINE_SECONDS', 8))
+
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PORTFOLIO_WORKERS', 8)),
+    thread_name_prefix='portfolio'
+)
 
 '''
 Returns the asset information for the given symbol.
@@ -12,11 +31,11 @@ Returns the asset information for the given symbol.
 'v' -> Volume
 '''
 
-def retrieve_asset_info(pair: str) -> Tuple[Dict, Dict]:
+def fetch_asset_info(pairs: List[str]) -> Tuple[Dict, Dict]:
     response = request(
         method="GET", 
         path="/0/public/Ticker",
-        query={'pair': pair}
+        query={'pair': ",".join(pairs)}
     )
 
     response_data = response.read().decode('utf-8')
@@ -29,7 +48,104 @@ def retrieve_asset_info(pair: str) -> Tuple[Dict, Dict]:
     result = json_data['result']
     return result, None
 
+ticker_cache = TickerCache(
+    fetch=fetch_asset_info,
+    ttl=float(os.getenv('TICKER_CACHE_TTL_SECONDS', 5)),
+    max_entries=int(os.getenv('TICKER_CACHE_SIZE', 512)),
+    # requested altnames (XBTUSD) are matched to the names Kraken answers with (XXBTZUSD)
+    resolve=lambda name: pair_registry.resolve(name)
+)
+
+# streaming prices are opt-in, the feed needs a long-lived process (not serverless)
+price_feed = start_price_feed(
+    url=os.getenv('KRAKEN_WS_URL'),
+    stale_after=float(os.getenv('KRAKEN_WS_STALE_SECONDS', 10))
+) if os.getenv('KRAKEN_WS_FEED') == '1' else None
+
+def retrieve_asset_info(pair: str) -> Tuple[Dict, Dict]:
+    # comma separated pairs are looked up together, only the ones not cached go upstream
+    pairs = [name.strip() for name in pair.split(",") if name.strip()]
+
+    return ticker_cache.get_many(pairs)
+
+def streamed_prices(pairs: List[str]) -> Dict[str, float]:
+    '''Last prices the live WebSocket feed has for the pairs, empty without a feed.'''
+    if price_feed is None:
+        return {}
+
+    prices = {name: price_feed.book.last(name) for name in pairs}
+
+    return {name: price for name, price in prices.items() if price is not None}
+
+def retrieve_prices(pairs: List[str]) -> Tuple[Dict, Dict]:
+    '''{pair: last trade price}, from the price feed when it is live and REST Ticker otherwise.'''
+    prices = streamed_prices(pairs)
+    missing = [name for name in pairs if name not in prices]
+
+    if not missing:
+        return prices, None
+
+    result, error = retrieve_asset_info(",".join(missing))
+
+    if error:
+        return None, error
+
+    return {**{name: float(info['c'][0]) for name, info in result.items()}, **prices}, None
+
+def fetch_asset_pairs() -> Tuple[Dict, Dict]:
+    response = request(
+        method="GET",
+        path="/0/public/AssetPairs"
+    )
+
+    json_data = json.loads(response.read().decode('utf-8'))
+
+    if response.status != 200 or ('error' in json_data and len(json_data['error'])):
+        return None, json_data['error']
+
+    return json_data['result'], None
+
+def fetch_assets() -> Tuple[Dict, Dict]:
+    response = request(
+        method="GET",
+        path="/0/public/Assets"
+    )
+
+    json_data = json.loads(response.read().decode('utf-8'))
+
+    if response.status != 200 or ('error' in json_data and len(json_data['error'])):
+        return None, json_data['error']
+
+    return json_data['result'], None
+
+def mapping_seed() -> Dict[str, str]:
+    # TICKER_MAPPINGS only backs the registry up while Kraken's lists are unavailable
+    seed = {}
+
+    for mapping_info in TICKER_MAPPINGS.values():
+        pair = next((pair for pair in mapping_info["kraken_fiat_pairs"] if "USD" in pair), None)
+
+        if pair is not None:
+            for ticker in mapping_info['kraken_ticker']:
+                seed[ticker] = pair
+
+    return seed
+
+pair_registry = PairRegistry(
+    fetch_pairs=fetch_asset_pairs,
+    fetch_assets=fetch_assets,
+    path=os.getenv('PAIR_REGISTRY_PATH') or os.path.join(tempfile.gettempdir(), 'pocketbroker_pairs.json'),
+    refresh_interval=float(os.getenv('PAIR_REGISTRY_REFRESH_SECONDS', 86400)),
+    seed=mapping_seed()
+)
+
 def retrieve_asset_pair_name(symbol1: str, symbol2: str) -> Tuple[Dict, Dict]:
+    found = pair_registry.find(symbol1, symbol2)
+
+    # pairs listed since the last registry refresh are still looked up upstream
+    if found:
+        return found, None
+
     response = request(
         method="GET", 
         path="/0/public/AssetPairs",
@@ -47,60 +163,43 @@ def retrieve_asset_pair_name(symbol1: str, symbol2: str) -> Tuple[Dict, Dict]:
 
     return result, None
 
-def retrieve_trades_history() -> Tuple[Dict, Dict]:
+def fetch_trades_page(params: Dict) -> Tuple[Dict, Dict]:
     response = request(
         method="POST", 
-        path="/0/private/TradesHistory"
+        path="/0/private/TradesHistory",
+        body=params
     )
     
     response_data = response.read().decode('utf-8')
 
     json_data = json.loads(response_data)
 
-    if response.status != 200:
+    if response.status != 200 or ('error' in json_data and len(json_data['error'])):
         return None, json_data['error']
 
-    result = json_data['result']
-    trades = defaultdict(list)
-
-    for trade in result['trades'].values():
-        if trade['type'] == 'sell':
-            if trade['pair'] in trades:
-                trades[trade['pair']] = []
-            continue
-
-        trades[trade['pair']].append({
-            'pair': trade['pair'],
-            'time': trade['time'],
-            'type': trade['type'],
-            'amount': float(trade['vol']),
-            'price': float(trade['price']),
-            'cost': float(trade['cost']),
-            'fee': float(trade['fee']),
-            'margin': float(trade['margin']),
-        })
+    return json_data['result'], None
 
-    return trades, None
+ledger = TradeLedger(
+    # keyed on the API key like the nonce counter, another account never reads these trades
+    path=os.getenv('TRADE_LEDGER_PATH') or default_path(KRAKEN_API_KEY),
+    fetch_page=fetch_trades_page
+)
 
-def compute_asset_profit_loss(current: float, trades: List[Dict]) -> float:
-    total = 0
-    for trade in trades:
-        total += trade['cost']
+def retrieve_trades_history() -> Tuple[Dict, Dict]:
+    '''
+    Syncs the local trade ledger with Kraken and returns per-pair books:
+    {pair: {'amount', 'cost', 'fee', 'realized', 'unmatched', 'trades', 'last_time', ...}}.
+    '''
+    return ledger.sync()
 
-    return current - total
+def compute_asset_profit_loss(price: float, position: Dict) -> float:
+    '''Unrealized P&L of the lots still open in a ledger position at `price`.'''
+    return unrealized_profit_loss(position, price)
 
 def get_kraken_ticker_pair(symbol: str) -> str:
-    symbol = symbol.upper()
-    
-    for internal_name, mapping_info in TICKER_MAPPINGS.items():
-        if symbol in mapping_info['kraken_ticker']:
-            for pair in mapping_info["kraken_fiat_pairs"]:
-                if "USD" in pair:
-                    return pair
-            
-    return None
-
-def retrieve_portfolio() -> Tuple[Dict, Dict]:
+    return pair_registry.usd_pair(symbol)
+
+def retrieve_balance() -> Tuple[Dict, Dict]:
     response = request(
         method="POST", 
         path="/0/private/Balance"
@@ -110,64 +209,157 @@ def retrieve_portfolio() -> Tuple[Dict, Dict]:
 
     json_data = json.loads(response_data)
 
-    if response.status != 200:
+    if response.status != 200 or ('error' in json_data and len(json_data['error'])):
         return None, json_data['error']
-        
-    result = json_data['result']
-
-    portfolio = []
 
-    trades, error = retrieve_trades_history()
-
-    if error:
-        return None, error
+    return json_data['result'], None
 
-    total_loss_for_all_assets = 0
+# USD pairs of the last Balance seen, the best guess for the next one
+held_pairs: List[str] = []
 
-    assets = {}
+def get_portfolio_pairs(balance: Dict) -> Dict[str, str]:
+    global held_pairs
 
-    asset_symbols = ""
     equivalents = {}
 
-    for symbol in result.keys():
+    for symbol in balance.keys():
         kraken_ticker_pair = get_kraken_ticker_pair(symbol)
 
         if kraken_ticker_pair is None:
             continue
 
         equivalents[symbol] = kraken_ticker_pair
-        asset_symbols += kraken_ticker_pair + ","
 
-    asset_symbols = asset_symbols[:-1]
+    held_pairs = list(dict.fromkeys(equivalents.values()))
+
+    return equivalents
+
+def get_speculative_pairs() -> List[str]:
+    pairs = list(held_pairs)
+
+    for mapping_info in TICKER_MAPPINGS.values():
+        for pair in mapping_info["kraken_fiat_pairs"]:
+            if "USD" in pair:
+                pairs.append(pair)
+                break
 
-    assets_info, error = retrieve_asset_info(asset_symbols.encode())
+    return list(dict.fromkeys(pairs))
+
+def retrieve_portfolio(mode: Optional[str] = None, deadline: Optional[float] = None) -> Tuple[Dict, Dict]:
+    '''
+    mode 'serial' issues Balance, TradesHistory and Ticker one after another.
+    mode 'concurrent' issues all three at once: Ticker is speculatively
+    requested for the pairs of the previous Balance and the TICKER_MAPPINGS
+    pairs before the Balance keys are known, and only pairs it missed are
+    fetched afterwards.
+    deadline caps the whole fan-out in seconds.
+    '''
+    mode = mode or PORTFOLIO_FANOUT
+    deadline = deadline if deadline is not None else PORTFOLIO_DEADLINE
+
+    if mode == 'serial':
+        return retrieve_portfolio_serial()
+
+    started = time.monotonic()
+
+    def remaining() -> float:
+        return max(0.0, deadline - (time.monotonic() - started))
+
+    # calls queued behind the rate limit give up with the portfolio, not after RATE_LIMIT_MAX_WAIT
+    context = contextvars.copy_context()
+    context.run(rate_limit_deadline.set, started + deadline)
+
+    def submit(fn, *args):
+        return executor.submit(context.copy().run, fn, *args)
+
+    balance_future = submit(retrieve_balance)
+    trades_future = submit(retrieve_trades_history)
+    speculative_pairs = get_speculative_pairs()
+    ticker_future = submit(retrieve_prices, speculative_pairs)
+
+    try:
+        result, error = balance_future.result(timeout=remaining())
+
+        if error:
+            return None, error
+
+        equivalents = get_portfolio_pairs(result)
+
+        prices, error = ticker_future.result(timeout=remaining())
+
+        if error:
+            return None, error
+
+        missing = list(dict.fromkeys(pair for pair in equivalents.values() if pair not in prices))
+
+        if missing:
+            missing_future = submit(retrieve_prices, missing)
+            missing_prices, error = missing_future.result(timeout=remaining())
+
+            if error:
+                return None, error
+
+            prices = {**prices, **missing_prices}
+
+        trades, error = trades_future.result(timeout=remaining())
+
+        if error:
+            return None, error
+    except TimeoutError:
+        return None, f'Portfolio request exceeded the {deadline}s deadline'
+
+    return build_portfolio(result, trades, equivalents, prices), None
+
+def retrieve_portfolio_serial() -> Tuple[Dict, Dict]:
+    result, error = retrieve_balance()
 
     if error:
         return None, error
 
-    total_holdings = float(result['ZUSD'])
+    trades, error = retrieve_trades_history()
+
+    if error:
+        return None, error
 
-    for ticker, pair in equivalents.items():
-        assets[pair] = assets_info[pair]
-        total_holdings += float(assets[pair]['c'][0]) * float(result[ticker])
+    equivalents = get_portfolio_pairs(result)
+
+    prices, error = retrieve_prices(list(dict.fromkeys(equivalents.values())))
+
+    if error:
+        return None, error
+
+    return build_portfolio(result, trades, equivalents, prices), None
+
+def build_portfolio(result: Dict, trades: Dict, equivalents: Dict[str, str], prices: Dict[str, float]) -> Dict:
+    portfolio = []
+
+    usd_balance = float(result.get('ZUSD', 0))
+    total_holdings = usd_balance
 
     for ticker, pair in equivalents.items():
-        history = trades.get(pair)
+        total_holdings += prices[pair] * float(result[ticker])
 
+    # staked balances (SOL.S) share their asset's pair, its cost basis counts once
+    costed = set()
+
+    for ticker, pair in equivalents.items():
         if float(result[ticker]) == 0.00:
             continue
 
-        asset_value = float(result[ticker]) * float(assets[pair]['c'][0])
-        
-        current_loss = compute_asset_profit_loss(asset_value, history) if history else 0
-        total_loss_for_all_assets += current_loss
+        position = trades.get(pair) if pair not in costed else None
+        costed.add(pair)
 
-        price = float(assets[pair]['c'][0])
+        price = prices[pair]
+        asset_value = float(result[ticker]) * price
+
+        current_loss = compute_asset_profit_loss(price, position) if position else 0
+        realized = position['realized'] if position else 0
 
         asset_data = {
             'symbol': ticker,
             'holding_amount': float(result[ticker]),
             'profit_loss': current_loss,
+            'realized_profit_loss': realized,
             'price': price,
             'value': asset_value,
             'weight': asset_value / total_holdings
@@ -177,62 +369,92 @@ def retrieve_portfolio() -> Tuple[Dict, Dict]:
 
     portfolio.append({
         'symbol': 'USD',
-        'holding_amount': float(result['ZUSD']),
+        'holding_amount': usd_balance,
         'profit_loss': 0,
+        'realized_profit_loss': 0,
         'price': 1,
-        'value': float(result['ZUSD']),
-        'weight': float(result['ZUSD']) / total_holdings
+        'value': usd_balance,
+        'weight': usd_balance / total_holdings if total_holdings else 0
     })
 
-    data = {
+    # held assets without a USD pair are reported instead of silently dropped
+    unpriced = [
+        ticker for ticker, amount in result.items()
+        if ticker != 'ZUSD' and ticker not in equivalents and float(amount) != 0.00
+    ]
+
+    # the ledger keeps its unrealized total as prices are marked, no pass over the positions
+    totals = ledger.mark(prices)
+
+    return {
         'positions': portfolio,
-        'total_profit_loss': total_loss_for_all_assets,
-        'total_holdings': total_holdings
+        'total_profit_loss': totals['unrealized'],
+        'total_realized_profit_loss': totals['realized'],
+        'total_fees': totals['fees'],
+        'total_holdings': total_holdings,
+        'unpriced': unpriced
     }
 
-    return data, None
+def order_body(side: str, pair: str, amount: float, order_type: str = 'market', price: Optional[float] = None) -> Tuple[Dict, Dict]:
+    '''
+    AddOrder body for one order, checked against the pair's AssetPairs entry
+    when the registry has it: the volume is cut down to lot_decimals and
+    must reach ordermin, a limit price may not have more than pair_decimals
+    and must reach costmin.
+    '''
+    if side not in ('buy', 'sell'):
+        return None, f'Unknown order side {side}'
 
-def execute_buy_order(pair: str, amount: float, order_type: str = 'market', price: Optional[float] = None) -> Tuple[Dict, Dict]:
-    body = {
-        'ordertype': order_type,
-        'type': 'buy',
-        'volume': amount,
-        'pair': pair    
-    }
+    # altnames and wsnames (XBTUSD, BTC/USD) are sent as the pair name
+    resolved = pair_registry.resolve(pair)
 
-    if order_type == 'limit':
-        if not price:
-            return None, 'Price is required for limit orders'
+    if resolved is None and pair_registry.loaded:
+        return None, f'Unknown pair {pair}'
 
-        body['price'] = price
+    if order_type == 'limit' and not price:
+        return None, 'Price is required for limit orders'
 
-    response = request(
-        method="POST", 
-        path="/0/private/AddOrder",
-        body=body
-    )
+    try:
+        volume = Decimal(str(amount))
+        limit = Decimal(str(price)) if order_type == 'limit' else None
+    except InvalidOperation:
+        return None, f'Invalid amount {amount} or price {price}'
 
-    response_data = response.read().decode('utf-8')
-    json_data = json.loads(response_data)
+    if not volume.is_finite() or volume <= 0 or (limit is not None and (not limit.is_finite() or limit <= 0)):
+        return None, f'Invalid amount {amount} or price {price}'
 
-    if 'error' in json_data and len(json_data['error']):
-        return None, json_data['error']
+    info = pair_registry.pairs.get(resolved) if resolved else None
 
-    return json_data['result'], None
+    if info is not None:
+        volume = volume.quantize(Decimal(1).scaleb(-int(info['lot_decimals'])), rounding=ROUND_DOWN)
+
+        if volume < Decimal(info['ordermin']):
+            return None, f'Amount {amount} is below the {info["ordermin"]} minimum for {resolved}'
+
+        if limit is not None:
+            if limit != limit.quantize(Decimal(1).scaleb(-int(info['pair_decimals']))):
+                return None, f'Price {price} has more than {info["pair_decimals"]} decimals for {resolved}'
+
+            if 'costmin' in info and volume * limit < Decimal(info['costmin']):
+                return None, f'Order cost {volume * limit} is below the {info["costmin"]} minimum for {resolved}'
 
-def execute_sell_order(pair: str, amount: float, order_type: str = 'market', price: Optional[float] = None) -> Tuple[Dict, Dict]:
     body = {
         'ordertype': order_type,
-        'type': 'sell',
-        'volume': amount,
-        'pair': pair
+        'type': side,
+        'volume': format(volume, 'f'),
+        'pair': resolved or pair
     }
 
-    if order_type == 'limit':
-        if not price:
-            return None, 'Price is required for limit orders'
+    if limit is not None:
+        body['price'] = format(limit, 'f')
+
+    return body, None
 
-        body['price'] = price
+def execute_order(side: str, pair: str, amount: float, order_type: str = 'market', price: Optional[float] = None) -> Tuple[Dict, Dict]:
+    body, error = order_body(side, pair, amount, order_type, price)
+
+    if error:
+        return None, error
 
     response = request(
         method="POST", 
@@ -246,4 +468,10 @@ def execute_sell_order(pair: str, amount: float, order_type: str = 'market', pri
     if 'error' in json_data and len(json_data['error']):
         return None, json_data['error']
 
-    return json_data['result'], None
\ No newline at end of file
+    return json_data['result'], None
+
+def execute_buy_order(pair: str, amount: float, order_type: str = 'market', price: Optional[float] = None) -> Tuple[Dict, Dict]:
+    return execute_order('buy', pair, amount, order_type, price)
+
+def execute_sell_order(pair: str, amount: float, order_type: str = 'market', price: Optional[float] = None) -> Tuple[Dict, Dict]:
+    return execute_order('sell', pair, amount, order_type, price)
@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Container, Dict, List, Optional, Tuple
+
+'''
+In-process Kraken Ticker cache.
+
+Entries are keyed by the pair name the caller asked for and expire after
+`ttl` seconds; the least recently used entry is evicted past `max_entries`.
+Concurrent misses on the same pair are coalesced (single-flight): one caller
+fetches, the others wait for its result. A multi-pair lookup fetches all of
+its missing pairs in one upstream call. Kraken answers with its own pair names
+(XBTUSD -> XXBTZUSD); `resolve` (PairRegistry.resolve) maps requested names to
+them, and a reported pair nothing was matched to is kept under its own name.
+'''
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Dict[str, Tuple[str, Dict]] = {}
+        self.error = None
+
+
+class TickerCache:
+    def __init__(self, fetch: Callable[[List[str]], Tuple[Dict, Dict]], ttl: float = 5.0, max_entries: int = 512, wait_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic, resolve: Optional[Callable[[str], Optional[str]]] = None):
+        self.fetch = fetch
+        self.resolve = resolve
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self.clock = clock
+        self._entries: 'OrderedDict[str, Tuple[float, str, Dict]]' = OrderedDict()
+        self._inflight: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'upstream_requests': 0, 'evictions': 0}
+
+    def get_many(self, pairs: List[str]) -> Tuple[Dict, Dict]:
+        '''
+        Returns (result, error) shaped like Kraken's Ticker result: keyed by the
+        pair names Kraken reports, so altname lookups (XBTUSD) come back as XXBTZUSD.
+        '''
+        found: Dict[str, Dict] = {}
+        waiting: List[Tuple[str, Flight]] = []
+        leading: List[str] = []
+        flight = Flight()
+        now = self.clock()
+
+        with self._lock:
+            for pair in dict.fromkeys(pairs):
+                entry = self._entries.get(pair)
+
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(pair)
+                    self._counters['hits'] += 1
+                    found[entry[1]] = entry[2]
+                elif pair in self._inflight:
+                    self._counters['coalesced'] += 1
+                    waiting.append((pair, self._inflight[pair]))
+                else:
+                    self._counters['misses'] += 1
+                    self._inflight[pair] = flight
+                    leading.append(pair)
+
+            if leading:
+                self._counters['upstream_requests'] += 1
+
+        if leading:
+            self._lead(flight, leading)
+            # reported pairs no requested name matched come back under their own name
+            waiting.extend((pair, flight) for pair in dict.fromkeys([*leading, *flight.result]))
+
+        for pair, other in waiting:
+            if not other.done.wait(self.wait_timeout):
+                return None, [f'Timed out waiting for ticker {pair}']
+
+            if other.error:
+                return None, other.error
+
+            if pair in other.result:
+                name, info = other.result[pair]
+                found[name] = info
+
+        return found, None
+
+    def get(self, pair: str) -> Tuple[Dict, Dict]:
+        return self.get_many([pair])
+
+    def _lead(self, flight: Flight, pairs: List[str]):
+        try:
+            result, error = self.fetch(pairs)
+            # resolving can load the pair registry, keep it out of the lock
+            matched = None if error else match_pairs(pairs, result, self.resolve)
+        except Exception as e:
+            result, error = None, [str(e)]
+
+        with self._lock:
+            if error:
+                flight.error = error
+            else:
+                flight.result = self._store(matched)
+
+            for pair in pairs:
+                if self._inflight.get(pair) is flight:
+                    del self._inflight[pair]
+
+        flight.done.set()
+
+    def lookup(self, pairs: List[str], pending: Container[str] = ()) -> Tuple[Dict, List[str]]:
+        '''
+        Non-blocking read for callers doing their own fetching and coalescing
+        (the async API): returns (fresh entries, pairs not fresh). Pairs the
+        caller already has in flight (`pending`) count as coalesced, not missed.
+        '''
+        found = {}
+        missing = []
+        now = self.clock()
+
+        with self._lock:
+            for pair in dict.fromkeys(pairs):
+                entry = self._entries.get(pair)
+
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(pair)
+                    self._counters['hits'] += 1
+                    found[entry[1]] = entry[2]
+                else:
+                    self._counters['coalesced' if pair in pending else 'misses'] += 1
+                    missing.append(pair)
+
+        return found, missing
+
+    def store(self, pairs: List[str], result: Dict) -> Dict[str, Tuple[str, Dict]]:
+        '''
+        Stores an upstream Ticker result fetched for `pairs`, returns
+        {requested or unclaimed reported name: (reported name, info)}.
+        '''
+        matched = match_pairs(pairs, result, self.resolve)
+
+        with self._lock:
+            self._counters['upstream_requests'] += 1
+            return self._store(matched)
+
+    def _store(self, matched: Dict[str, Tuple[str, Dict]]) -> Dict[str, Tuple[str, Dict]]:
+        fetched_at = self.clock()
+
+        for pair, (name, info) in matched.items():
+            self._entries[pair] = (fetched_at, name, info)
+            self._entries.move_to_end(pair)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+        return matched
+
+    def invalidate(self, pair: Optional[str] = None):
+        with self._lock:
+            if pair is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(pair, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses'] + self._counters['coalesced']
+            return {
+                **self._counters,
+                'size': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'hit_ratio': self._counters['hits'] / lookups if lookups else 0.0,
+            }
+
+
+def match_pairs(requested: List[str], result: Dict, resolve: Optional[Callable[[str], Optional[str]]] = None) -> Dict[str, Tuple[str, Dict]]:
+    '''
+    Kraken answers with its own pair names (XBTUSD -> XXBTZUSD), so map every
+    requested name to the (reported name, info) it corresponds to. Reported
+    pairs no requested name could be matched to are kept under their own name.
+    '''
+    matched = {pair: (pair, result[pair]) for pair in requested if pair in result}
+
+    for pair in requested:
+        if pair not in matched and resolve is not None:
+            name = resolve(pair)
+            if name in result:
+                matched[pair] = (name, result[name])
+
+    claimed = {name for name, _ in matched.values()}
+    unmatched_requested = [pair for pair in requested if pair not in matched]
+    unmatched_reported = [name for name in result if name not in claimed]
+
+    # without a registry one leftover on each side can only be the same pair
+    if len(unmatched_requested) == 1 and len(unmatched_reported) == 1:
+        name = unmatched_reported.pop()
+        matched[unmatched_requested[0]] = (name, result[name])
+
+    for name in unmatched_reported:
+        matched.setdefault(name, (name, result[name]))
+
+    return matched
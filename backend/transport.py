@@ -0,0 +1,245 @@
+import http.client
+import json
+import queue
+import random
+import select
+import threading
+import time
+import urllib.parse
+from typing import Callable, Dict, Optional, Tuple
+
+'''
+Persistent, connection-pooled HTTP transport used for every Kraken call.
+
+Connections are kept alive and reused per (scheme, host, port), so a portfolio
+request only pays the TCP+TLS handshake once per pooled connection instead of
+once per call. Server errors (5xx/429), Kraken's `EAPI:Rate limit exceeded`
+and, for idempotent calls, `EAPI:Invalid nonce` are retried with exponential
+backoff.
+'''
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Kraken rejects these before executing anything, so even orders can be resent.
+REJECTED_ERRORS = ('EAPI:Rate limit exceeded',)
+# Concurrent private calls (Balance and TradesHistory of one portfolio) can
+# arrive in the opposite order of their nonces; a retry is signed with a new one.
+# Orders are left out: an Invalid nonce can also answer a duplicate of an order
+# that was already executed, and resending it would place the order twice.
+RETRYABLE_ERRORS = REJECTED_ERRORS + ('EAPI:Invalid nonce', 'EService:Unavailable', 'EService:Busy')
+
+
+def should_retry(status: int, body: bytes, retry_server_errors: bool) -> bool:
+    '''
+    Whether a Kraken response is worth another attempt. Without
+    retry_server_errors only explicit rejections (REJECTED_ERRORS) qualify,
+    since the request was then guaranteed not to be executed.
+    '''
+    if retry_server_errors and status in RETRYABLE_STATUSES:
+        return True
+
+    try:
+        errors = json.loads(body.decode('utf-8')).get('error') or []
+    except (ValueError, AttributeError):
+        return False
+
+    return any(error.startswith(RETRYABLE_ERRORS if retry_server_errors else REJECTED_ERRORS) for error in errors)
+
+
+def is_rate_limited(body: bytes) -> bool:
+    try:
+        errors = json.loads(body.decode('utf-8')).get('error') or []
+    except (ValueError, AttributeError):
+        return False
+
+    return any(error.startswith('EAPI:Rate limit') for error in errors)
+
+
+def backoff_delay(attempt: int, backoff: float, max_backoff: float) -> float:
+    delay = min(max_backoff, backoff * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class Response:
+    '''
+    Fully buffered response, so the underlying connection can go straight
+    back to the pool. Mirrors the parts of `http.client.HTTPResponse` that
+    `service.py` uses (`status`, `read()`, `headers`).
+    '''
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    def read(self) -> bytes:
+        return self._body
+
+    def json(self) -> Dict:
+        return json.loads(self._body.decode('utf-8'))
+
+
+class HostPool:
+    def __init__(self, scheme: str, host: str, port: Optional[int], size: int, timeout: float):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, wait: float) -> Tuple[http.client.HTTPConnection, bool]:
+        if not self._slots.acquire(timeout=wait):
+            raise PoolTimeoutError(f'No free connection to {self.host} within {wait}s')
+
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            # an idle connection the server already closed reads as ready (EOF); drop it before sending
+            if conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+                conn.close()
+                continue
+
+            self.reused += 1
+            return conn, True
+
+        connection_cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        self.created += 1
+        return connection_cls(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool):
+        if reusable:
+            self._idle.put(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class KrakenSession:
+    '''
+    Session holding one keep-alive pool per host.
+
+    pool_size     - max concurrent connections per host
+    timeout       - socket connect/read timeout in seconds
+    max_retries   - retries on 5xx/429, rate-limit errors and dropped connections
+    backoff       - base delay in seconds, doubled on every retry
+    '''
+
+    def __init__(self, pool_size: int = 8, timeout: float = 10.0, max_retries: int = 3, backoff: float = 0.25, max_backoff: float = 4.0):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = 0
+        self._pools: Dict[Tuple[str, str, Optional[int]], HostPool] = {}
+        self._lock = threading.Lock()
+
+    def _pool_for(self, url: urllib.parse.SplitResult) -> HostPool:
+        key = (url.scheme, url.hostname, url.port)
+
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = HostPool(url.scheme, url.hostname, url.port, self.pool_size, self.timeout)
+            return self._pools[key]
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], data: Optional[bytes], resent: bool = False) -> Response:
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path + ('?' + parts.query if parts.query else '')
+        pool = self._pool_for(parts)
+
+        conn, reused = pool.acquire(wait=self.timeout)
+        try:
+            conn.request(method, target, body=data, headers=headers)
+        except (BrokenPipeError, ConnectionResetError):
+            pool.release(conn, reusable=False)
+            if not reused or resent:
+                raise
+            # a dropped keep-alive connection failed while the request was being written:
+            # Kraken never saw a complete, signed request, so it was not executed; resend once
+            return self._send(method, url, headers, data, resent=True)
+        except BaseException:
+            pool.release(conn, reusable=False)
+            raise
+
+        try:
+            resp = conn.getresponse()
+            body = resp.read()
+        except BaseException:
+            # the request may have been executed, request() decides whether to try again
+            pool.release(conn, reusable=False)
+            raise
+
+        pool.release(conn, reusable=not resp.will_close)
+        return Response(resp.status, dict(resp.getheaders()), body)
+
+    def request(self, method: str, url: str, build: Callable[[], Tuple[Dict[str, str], Optional[bytes]]], retry_server_errors: bool = True, on_rate_limit: Optional[Callable[[], None]] = None) -> Response:
+        '''
+        `build` returns fresh (headers, body) for every attempt, so signed
+        Kraken calls get a new nonce and signature when they are retried.
+        Non-idempotent calls (orders) should pass retry_server_errors=False:
+        they are then only retried on explicit rate-limit rejections.
+        `on_rate_limit` is called for every `EAPI:Rate limit` rejection.
+        '''
+        attempt = 0
+
+        while True:
+            headers, data = build()
+
+            try:
+                response = self._send(method, url, headers, data)
+            except (OSError, http.client.HTTPException):
+                if not retry_server_errors or attempt >= self.max_retries:
+                    raise
+            else:
+                if on_rate_limit is not None and is_rate_limited(response.read()):
+                    on_rate_limit()
+
+                if attempt >= self.max_retries or not should_retry(response.status, response.read(), retry_server_errors):
+                    return response
+
+            self._sleep(attempt)
+            attempt += 1
+
+    def _sleep(self, attempt: int):
+        with self._lock:
+            self.retries += 1
+
+        time.sleep(backoff_delay(attempt, self.backoff, self.max_backoff))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pools = dict(self._pools)
+
+        return {
+            'retries': self.retries,
+            'pools': {
+                f'{pool.scheme}://{pool.host}' + (f':{pool.port}' if pool.port else ''): {
+                    'created': pool.created,
+                    'reused': pool.reused,
+                    'idle': pool._idle.qsize(),
+                }
+                for pool in pools.values()
+            }
+        }
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
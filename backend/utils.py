@@ -1,28 +1,94 @@
 import hmac
 import base64
-import time
 import hashlib
 import os
 from dotenv import load_dotenv
-import http.client
-import urllib.request
 import urllib.parse
 import json
-from typing import Dict, Optional
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from transport import KrakenSession, Response
+from rate_limiter import CallCounterScheduler, RateLimitTimeout, TIERS
+from nonce import NonceProvider, default_path
 
 load_dotenv()
 
 KRAKEN_API_KEY = os.getenv('KRAKEN_PUBLIC_KEY')
 KRAKEN_PRIVATE_KEY = os.getenv('KRAKEN_PRIVATE_KEY')
 
-def request(method: str, path: str, query: Optional[dict] = None, body: dict = {}, environment: str = "https://api.kraken.com") -> http.client.HTTPResponse:
-    url = environment + path
+# point at a local fake server (see fake_kraken.py) to run offline
+KRAKEN_API_URL = os.getenv('KRAKEN_API_URL', 'https://api.kraken.com')
+
+# orders must not be replayed blindly on 5xx, the first attempt may have been executed
+NON_IDEMPOTENT_PATHS = {'/0/private/AddOrder', '/0/private/AddOrderBatch'}
+
+session = KrakenSession(
+    pool_size=int(os.getenv('KRAKEN_POOL_SIZE', 8)),
+    timeout=float(os.getenv('KRAKEN_TIMEOUT', 10)),
+    max_retries=int(os.getenv('KRAKEN_MAX_RETRIES', 3)),
+    backoff=float(os.getenv('KRAKEN_BACKOFF', 0.25)),
+)
+
+# verification tier of the API key (starter, intermediate, pro), 'off' sends private calls unpaced
+KRAKEN_TIER = os.getenv('KRAKEN_TIER', 'starter')
+RATE_LIMIT_MAX_WAIT = float(os.getenv('KRAKEN_RATE_LIMIT_MAX_WAIT', 30))
+
+rate_limiter = CallCounterScheduler.for_tier(KRAKEN_TIER) if KRAKEN_TIER in TIERS else None
+
+# time.monotonic() by which the caller needs its answer (a portfolio deadline), None for no deadline
+rate_limit_deadline: ContextVar[Optional[float]] = ContextVar('rate_limit_deadline', default=None)
+
+def rate_limit_wait() -> float:
+    '''How long a call may queue for the rate limit: RATE_LIMIT_MAX_WAIT, less if a deadline is closer.'''
+    deadline = rate_limit_deadline.get()
+
+    if deadline is None:
+        return RATE_LIMIT_MAX_WAIT
+
+    return max(0.0, min(RATE_LIMIT_MAX_WAIT, deadline - time.monotonic()))
+
+def rate_limit_error(e: RateLimitTimeout) -> Dict:
+    # nothing was sent, answered like a Kraken rejection so callers return (None, error)
+    return {'error': [f'EAPI:Rate limit exceeded ({e})'], 'result': {}}
+
+def is_private(path: str) -> bool:
+    return path.startswith('/0/private/')
+
+def request(method: str, path: str, query: Optional[dict] = None, body: Optional[dict] = None, environment: Optional[str] = None) -> Response:
+    url, query_str = build_url(path, query, environment)
+    body = dict(body or {})
+    paced = rate_limiter is not None and is_private(path)
+
+    def build() -> Tuple[Dict[str, str], bytes]:
+        # every attempt, retries included, counts against the call counter
+        if paced:
+            rate_limiter.acquire(path, timeout=rate_limit_wait())
+        return build_signed_request(path, query_str, body)
+
+    try:
+        return session.request(
+            method=method,
+            url=url,
+            build=build,
+            retry_server_errors=path not in NON_IDEMPOTENT_PATHS,
+            on_rate_limit=rate_limiter.penalize if paced else None
+        )
+    except RateLimitTimeout as e:
+        return Response(429, {}, json.dumps(rate_limit_error(e)).encode())
+
+def build_url(path: str, query: Optional[dict] = None, environment: Optional[str] = None) -> Tuple[str, str]:
+    url = (environment or KRAKEN_API_URL) + path
 
     query_str = ""
     if query is not None and len(query):
         query_str = "?" + urllib.parse.urlencode(query)
         url += query_str
 
+    return url, query_str
+
+def build_signed_request(path: str, query_str: str, body: dict) -> Tuple[Dict[str, str], bytes]:
+    # called once per attempt, so every retry is signed with a fresh nonce
     body['nonce'] = get_nonce()
 
     body_str = json.dumps(body)
@@ -38,17 +104,13 @@ def request(method: str, path: str, query: Optional[dict] = None, body: dict = {
         ) 
     }
 
-    req = urllib.request.Request(
-        method=method,
-        url=url,
-        headers=headers,
-        data=body_str.encode()
-    )
+    return headers, body_str.encode()
 
-    return urllib.request.urlopen(req)
+# shared by every worker process on the host using this key, see nonce.py
+nonce_provider = NonceProvider(path=os.getenv('KRAKEN_NONCE_PATH') or default_path(KRAKEN_API_KEY))
 
 def get_nonce() -> str:
-   return str(int(time.time() * 1000))
+   return str(nonce_provider.next())
 
 def get_signature(private_key: str, data: str, nonce: str, path: str) -> str:
    return sign(
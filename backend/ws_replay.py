@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+'''
+Local WebSocket server replaying recorded Kraken v2 ticker frames.
+
+    python ws_replay.py --port 8766 --speed 2 --loop
+    KRAKEN_WS_FEED=1 KRAKEN_WS_URL=ws://127.0.0.1:8766/v2 python app.py
+
+Frames are JSON lines {"t": seconds_since_start, "frame": {...}} and are sent
+to every client after it subscribes. `drop_after` closes the connection after
+that many frames so reconnect handling can be exercised.
+'''
+
+FRAMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ws_ticker_frames.jsonl')
+
+
+def load_frames(path: str = FRAMES_PATH) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayServer:
+    def __init__(self, frames: List[Dict], speed: float = 1.0, loop: bool = False, drop_after: int = 0):
+        self.frames = frames
+        self.speed = speed
+        self.loop = loop
+        self.drop_after = drop_after
+        self.connections = 0
+        self.url: Optional[str] = None
+        self._started = threading.Event()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/v2', self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+
+        subscribe = await ws.receive_json()
+        if subscribe.get('method') != 'subscribe':
+            await ws.close()
+            return ws
+
+        sent = 0
+        while not ws.closed:
+            previous = 0.0
+            for entry in self.frames:
+                await asyncio.sleep(max(0.0, entry['t'] - previous) / self.speed)
+                previous = entry['t']
+
+                await ws.send_json(entry['frame'])
+                sent += 1
+
+                if self.drop_after and sent >= self.drop_after:
+                    await ws.close()
+                    return ws
+
+            if not self.loop:
+                break
+
+        # keep the connection open after a one-shot replay, like an idle market
+        async for _ in ws:
+            pass
+
+        return ws
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> 'ReplayServer':
+        '''Run in a background thread; `url` is set once the socket is bound.'''
+        threading.Thread(target=lambda: asyncio.run(self._serve(host, port)), daemon=True).start()
+        self._started.wait()
+        return self
+
+    async def _serve(self, host: str, port: int):
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.url = f'ws://{host}:{bound_port}/v2'
+        self._started.set()
+
+        await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded Kraken WebSocket ticker frames')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--frames', default=FRAMES_PATH)
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--loop', action='store_true')
+    parser.add_argument('--drop-after', type=int, default=0)
+    args = parser.parse_args()
+
+    server = ReplayServer(load_frames(args.frames), speed=args.speed, loop=args.loop, drop_after=args.drop_after)
+    print(f'Replaying {len(server.frames)} frames on ws://{args.host}:{args.port}/v2')
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
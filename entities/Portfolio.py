@@ -1,77 +1,229 @@
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict
-from sentence_transformers import SentenceTransformer
+from typing import Callable, List, Optional, Dict
 from entities.Token import Token
+from RAG.similarity_index import ExactIndex, build_index
+from RAG.sector_classifier import load_config
 import numpy as np
+import os
+import tempfile
+import threading
 
 
-# TODO: move to yaml
-SECTORS = ["Layer1", "DeFi", "Gaming", "Memecoin", "Stablecoin", "Noname"]
+# one-hot vocabulary for token vectors, see RAG/sectors.yaml
+SECTORS = load_config()["sectors"]
 
-from sklearn.metrics.pairwise import cosine_similarity
+# model name or a local model directory; EMBEDDING_LOCAL_ONLY=1 never goes to the Hugging Face hub
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_LOCAL_ONLY = os.getenv("EMBEDDING_LOCAL_ONLY", "0") == "1"
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """
+    Process-wide SentenceTransformer, loaded on first use. Importing this
+    module stays cheap for callers that only need the portfolio metrics.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL, local_files_only=EMBEDDING_LOCAL_ONLY)
+    return _model
+
+# on-disk embedding cache, shared by every process on the host
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "pocketbroker_embeddings")
+
+_embedding_cache = None
+
+def get_embedding_cache():
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _model_lock:
+            if _embedding_cache is None:
+                from RAG.embedding_cache import EmbeddingCache
+                _embedding_cache = EmbeddingCache(
+                    EMBEDDING_MODEL,
+                    encode=lambda texts: get_model().encode(texts, convert_to_numpy=True),
+                    root=EMBEDDING_CACHE_DIR,
+                )
+    return _embedding_cache
+
+def prewarm_model() -> threading.Thread:
+    """Load the model in a background thread, e.g. at server start."""
+    thread = threading.Thread(target=get_model, name="embedding-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+def __getattr__(name):
+    # `from entities.Portfolio import model` keeps working, now loading on access
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@dataclass
+class PortfolioColumns:
+    """
+    Columnar view of the portfolio tokens, one array entry per token, in the
+    order of Portfolio.tokens.
+    """
+    amounts: np.ndarray
+    prices: np.ndarray
+    values: np.ndarray         # holding_amount * price
+    total_value: float
+    sectors: List[str]         # sector names, in order of first appearance
+    sector_codes: np.ndarray   # index into sectors
+    stablecoin: np.ndarray     # is_stablecoin mask
+
+    @classmethod
+    def from_tokens(cls, tokens: List[Token]) -> "PortfolioColumns":
+        n = len(tokens)
+        amounts = np.fromiter((t.holding_amount for t in tokens), dtype=np.float64, count=n)
+        prices = np.fromiter((t.price for t in tokens), dtype=np.float64, count=n)
+        stablecoin = np.fromiter((t.is_stablecoin for t in tokens), dtype=bool, count=n)
+
+        codes: Dict[str, int] = {}
+        sector_codes = np.fromiter((codes.setdefault(t.sector, len(codes)) for t in tokens), dtype=np.intp, count=n)
+
+        values = amounts * prices
+
+        return cls(
+            amounts=amounts,
+            prices=prices,
+            values=values,
+            total_value=float(values.sum()),
+            sectors=list(codes),
+            sector_codes=sector_codes,
+            stablecoin=stablecoin,
+        )
+
+    @property
+    def weights(self) -> np.ndarray:
+        if self.total_value == 0:
+            return np.zeros_like(self.values)
+        return self.values / self.total_value
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
 
 @dataclass
 class Portfolio:
     tokens: List[Token]
     total_profit_loss: float = 0.0
+    # batch text encoder for find_similar, e.g. local_embed_many; None compares sector and stablecoin flag only
+    embed_many: Optional[Callable[[List[str]], np.ndarray]] = field(default=None, repr=False, compare=False)
+
+    # "exact", "ivf" or "auto", see RAG.similarity_index.build_index
+    index_kind: str = field(default="auto", repr=False, compare=False)
+
+    # built on first use, dropped by invalidate()
+    _columns: Optional[PortfolioColumns] = field(default=None, init=False, repr=False, compare=False)
+    _index: Optional[ExactIndex] = field(default=None, init=False, repr=False, compare=False)
+    _by_symbol: Dict[str, Token] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def invalidate(self):
+        """Drop the cached columns and index, call after changing self.tokens or a token in place."""
+        self._columns = None
+        self._index = None
+
+    def add_token(self, token: Token):
+        self.tokens.append(token)
+        self._columns = None
+        if self._index is not None:
+            self._index.add([token.symbol], token_matrix([token], self.embed_many))
+            self._by_symbol[token.symbol] = token
+
+    def remove_token(self, symbol: str) -> Optional[Token]:
+        for i, t in enumerate(self.tokens):
+            if t.symbol == symbol:
+                self._columns = None
+                if self._index is not None:
+                    self._index.remove([symbol])
+                    self._by_symbol.pop(symbol, None)
+                return self.tokens.pop(i)
+        return None
+
+    def set_holding(self, symbol: str, amount: float):
+        for t in self.tokens:
+            if t.symbol == symbol:
+                t.holding_amount = amount
+        # holdings are not part of the token vectors, the index stays valid
+        self._columns = None
+
+    @property
+    def columns(self) -> PortfolioColumns:
+        if self._columns is None:
+            self._columns = PortfolioColumns.from_tokens(self.tokens)
+        return self._columns
+
+    def similarity_index(self) -> ExactIndex:
+        """Similarity index over the token vectors, keyed by symbol, built once and updated by add/remove_token."""
+        if self._index is None:
+            vectors = token_matrix(self.tokens, self.embed_many) if self.tokens else np.zeros((0, 1))
+            self._index = build_index([t.symbol for t in self.tokens], vectors, kind=self.index_kind)
+            self._by_symbol = {t.symbol: t for t in self.tokens}
+        return self._index
     
     def find_similar(self, token: Token, top_k=5) -> list[Token]:
         """
         Find top-k most similar tokens (by embedding) from this portfolio.
         """
-        # compute query vector
-        query_vec = token.embedded_sector
-
-        # compute all portfolio vectors
-        all_vecs = [token_vector(t) for t in self.tokens]
+        index = self.similarity_index()
+        if not len(index):
+            return []
 
-        sims = cosine_similarity([query_vec], all_vecs)[0]
+        # compute query vector, skip self if in portfolio
+        query_vec = token_matrix([token], self.embed_many)[0]
+        matches = index.search(query_vec, top_k, exclude={token.symbol})
 
-        # sort by similarity (skip self if in portfolio)
-        sorted_idx = sims.argsort()[::-1]
-
-        results = []
-        for idx in sorted_idx:
-            candidate = self.tokens[idx]
-            if candidate.symbol == token.symbol:  # skip self
-                continue
-            results.append(candidate)
-            if len(results) >= top_k:
-                break
-        return results
+        return [self._by_symbol[symbol] for symbol, _ in matches]
 
+    def total_value(self) -> float:
+        return self.columns.total_value
 
     def stablecoin_ratio(self):
-        total_value = sum(t.holding_amount * t.price for t in self.tokens)
-        if total_value == 0:
+        c = self.columns
+        if c.total_value == 0:
             return 0.0
-        stable_value = sum(t.holding_amount * t.price for t in self.tokens if t.is_stablecoin)
-        return stable_value / total_value
+        return float(c.values[c.stablecoin].sum() / c.total_value)
 
     def sector_allocation(self):
-        total_value = sum(t.holding_amount * t.price for t in self.tokens)
-        if total_value == 0:
+        c = self.columns
+        if c.total_value == 0:
             return {}
-        alloc = {}
-        for t in self.tokens:
-            val = t.holding_amount * t.price
-            alloc[t.sector] = alloc.get(t.sector, 0) + val
-        return {k: v/total_value for k, v in alloc.items()}
+        alloc = np.bincount(c.sector_codes, weights=c.values, minlength=len(c.sectors)) / c.total_value
+        return dict(zip(c.sectors, alloc.tolist()))
 
     def compute_hhi(self):
         """Herfindahl–Hirschman Index of portfolio concentration."""
-        total_value = sum(t.holding_amount * t.price for t in self.tokens)
-        if total_value == 0:
+        c = self.columns
+        if c.total_value == 0:
             return 0.0
-        weights = [(t.holding_amount * t.price) / total_value for t in self.tokens if t.holding_amount > 0]
-        return sum(w**2 for w in weights)
+        weights = c.weights[c.amounts > 0]
+        return float(np.dot(weights, weights))
+
+    def summary(self) -> Dict:
+        """Every portfolio metric from a single pass over the columns."""
+        return {
+            "total_value": self.total_value(),
+            "positions": int(np.count_nonzero(self.columns.amounts > 0)),
+            "stablecoin_ratio": self.stablecoin_ratio(),
+            "sector_allocation": self.sector_allocation(),
+            "hhi": self.compute_hhi(),
+        }
+
+    def rebalance(self, sector_targets: Dict[str, float], **kwargs):
+        """Buy/sell legs that move the portfolio to sector_targets, see entities.Rebalancer."""
+        from entities.Rebalancer import rebalance
+        return rebalance(self, sector_targets, **kwargs)
 
 
 
 def local_embed(text: str) -> list[float]:
-    return model.encode(text).tolist()
+    return get_embedding_cache().get(text).tolist()
+
+def local_embed_many(texts: List[str]) -> np.ndarray:
+    """Cached embeddings for all texts, misses encoded in one model call."""
+    return get_embedding_cache().get_many(texts)
 
 def one_hot(value: str, vocab: list[str]) -> np.ndarray:
     
@@ -82,22 +234,22 @@ def one_hot(value: str, vocab: list[str]) -> np.ndarray:
         
     return vec
 
-def embed_categories(categories: list[str], text_embedding_fn) -> np.ndarray:
+def embed_categories(categories: list[str], text_embedding_fn, dim: int = 768) -> np.ndarray:
     """Embed each category separately, then average them."""
     
     if not categories or not text_embedding_fn:
-        return np.zeros(768)  # assume embedding dim = 768, adjust to your model
+        return np.zeros(dim)  # dim has to match the embedding model when text_embedding_fn is set
     
     cat_vecs = [text_embedding_fn(cat) for cat in categories]
     
     return np.mean(cat_vecs, axis=0)
 
-def token_vector(token: Token, text_embedding_fn=None) -> np.ndarray:
+def token_vector(token: Token, text_embedding_fn=None, dim: int = 768) -> np.ndarray:
 
     sector_vec = one_hot(token.sector, SECTORS)
     stable_vec = np.array([1.0 if token.is_stablecoin else 0.0])
 
-    cat_vec = embed_categories(token.metadata.get("categories", []), text_embedding_fn)
+    cat_vec = embed_categories(token.metadata.get("categories", []), text_embedding_fn, dim)
     
     desc_vec = np.zeros_like(cat_vec)
     if text_embedding_fn:
@@ -105,4 +257,24 @@ def token_vector(token: Token, text_embedding_fn=None) -> np.ndarray:
         if desc:
             desc_vec = text_embedding_fn(desc)
 
-    return np.concatenate([ sector_vec, stable_vec, cat_vec, desc_vec])
\ No newline at end of file
+    return np.concatenate([ sector_vec, stable_vec, cat_vec, desc_vec])
+
+def token_matrix(tokens: List[Token], embed_many=None, dim: int = 768) -> np.ndarray:
+    """
+    token_vector for every token as one matrix. With embed_many, every distinct
+    category and description across the tokens is embedded once, in one batch.
+    """
+    if embed_many is None:
+        return np.vstack([token_vector(t, dim=dim) for t in tokens])
+
+    texts = list(dict.fromkeys(
+        text
+        for t in tokens
+        for text in [*t.metadata.get("categories", []), t.metadata.get("description", "")]
+        if text
+    ))
+    # an empty string still pins the zero vectors to the model's dimension
+    embedded = np.asarray(embed_many(texts or [""]))
+    vectors = dict(zip(texts, embedded))
+
+    return np.vstack([token_vector(t, vectors.__getitem__, embedded.shape[1]) for t in tokens])
@@ -0,0 +1,271 @@
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+from entities.Portfolio import Portfolio
+import numpy as np
+
+
+# stablecoins form one group whatever their sector, and fund the other groups' buys
+STABLE_GROUP = "Stablecoin"
+
+# bisection steps for the position cap that meets max_hhi, 2^-50 of the largest position
+HHI_STEPS = 50
+
+
+def default_pair(symbol: str) -> str:
+    # BASE/QUOTE, resolved to the Kraken pair name by the backend's pair registry
+    return f"{symbol.upper()}/USD"
+
+
+def fit_total(values: np.ndarray, total: float, cap: float = np.inf) -> np.ndarray:
+    """
+    `values` changed as little as possible (in L1) to sum to `total` with none
+    above `cap`: the largest are cut down to a common level, or the smallest
+    raised to one, whichever way the total has to move. Of all the
+    minimum-turnover answers this one has the smallest sum of squares, i.e.
+    the lowest concentration. Needs total <= len(values) * cap.
+    """
+    n = len(values)
+    if n == 0:
+        return values.copy()
+
+    capped = np.minimum(values, cap)
+    s = np.sort(capped)
+    prefix = np.concatenate(([0.0], np.cumsum(s)))  # prefix[j]: sum of the j smallest
+    current = prefix[-1]
+
+    if total <= current:
+        # sum(min(capped, h)) for h = s[j]
+        at = prefix[:-1] + (n - np.arange(n)) * s
+        j = int(np.searchsorted(at, total))
+        return np.minimum(capped, (total - prefix[j]) / (n - j))
+
+    # sum(max(capped, lo)) for lo = s[j]
+    at = np.arange(n) * s + (current - prefix[:-1])
+    k = int(np.searchsorted(at, total, side="right"))
+    return np.maximum(capped, min((total - (current - prefix[k])) / k, cap))
+
+
+def hhi(values: np.ndarray) -> float:
+    """Herfindahl–Hirschman Index of token positions, as Portfolio.compute_hhi."""
+    total = values.sum()
+    if total <= 0:
+        return 0.0
+    return float(values @ values / total ** 2)
+
+
+@dataclass
+class RebalancePlan:
+    legs: List[Dict]             # {"side", "pair", "amount", "ordertype"}, as /api/v1/orders/batch takes them, sells first
+    values: Dict[str, float]     # target value per symbol after the legs
+    cash: float                  # USD after the legs
+    turnover: float              # total value traded
+    before: Dict
+    after: Dict
+    warnings: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class Rebalancer:
+    """
+    Minimum-turnover trades from a portfolio to target sector weights.
+
+    1. Every sector with a target gets target * total value, the rest keep
+       their value; risky sectors are scaled down together when they would
+       leave less than `stablecoin_floor` for stablecoins and cash, and
+       stablecoins are sold when buys need the funds. Whatever is left is
+       cash (USD).
+    2. Inside a sector the change is made by cutting the largest positions
+       or topping up the smallest (fit_total), which is minimum turnover
+       and lowest HHI at once.
+    3. If HHI is still above `max_hhi`, positions are capped at a common
+       level, found by bisection, and each sector refills its smallest ones.
+    4. Legs below `min_order_value` (USD) or `min_amounts` (token units per
+       symbol, e.g. Kraken's ordermin) are dropped, buys shrunk if the
+       dropped sells were funding them.
+
+    Tokens without a positive price are never traded. Everything is closed
+    form over numpy arrays, milliseconds for thousands of tokens.
+    """
+
+    def __init__(self, portfolio: Portfolio, cash: float = 0.0, pair_for: Callable[[str], str] = default_pair):
+        self.portfolio = portfolio
+        self.cash = cash
+        self.pair_for = pair_for
+
+        c = portfolio.columns
+        self.values = c.values
+        self.prices = c.prices
+        self.total = c.total_value + cash
+        self.tradable = np.isfinite(c.prices) & (c.prices > 0)
+
+        stable = c.stablecoin | np.fromiter((t.sector == STABLE_GROUP for t in portfolio.tokens), dtype=bool, count=len(c.values))
+        self.groups = [name for name in c.sectors if name != STABLE_GROUP] + [STABLE_GROUP]
+        self.stable = len(self.groups) - 1
+        index = {name: i for i, name in enumerate(self.groups)}
+        sector_group = np.array([index.get(name, self.stable) for name in c.sectors], dtype=np.intp)
+        self.group = np.where(stable, self.stable, sector_group[c.sector_codes])
+
+        order = np.argsort(self.group, kind="stable")
+        bounds = np.cumsum(np.bincount(self.group, minlength=len(self.groups)))[:-1]
+        self.members = [m[self.tradable[m]] for m in np.split(order, bounds)]
+
+    def sector_values(self, values: np.ndarray) -> np.ndarray:
+        return np.bincount(self.group, weights=values, minlength=len(self.groups))
+
+    def metrics(self, values: np.ndarray, cash: float) -> Dict:
+        total = values.sum() + cash
+        if total <= 0:
+            return {"sector_allocation": {}, "hhi": 0.0, "stablecoin_ratio": 0.0, "cash": cash}
+        allocation = dict(zip(self.groups, (self.sector_values(values) / total).tolist()))
+        allocation = {name: weight for name, weight in allocation.items() if weight > 0}
+        if cash > 0:
+            allocation["Cash"] = cash / total
+        return {
+            "sector_allocation": allocation,
+            "hhi": hhi(values),
+            "stablecoin_ratio": float((values[self.group == self.stable].sum() + cash) / total),
+            "cash": cash,
+        }
+
+    def sector_targets(self, targets: Dict[str, float], stablecoin_floor: float, warnings: List[str]) -> np.ndarray:
+        """Target value per group, see step 1."""
+        current = self.sector_values(self.values)
+        frozen = self.sector_values(np.where(self.tradable, 0.0, self.values))
+        wanted = current.copy()
+        explicit = np.zeros(len(self.groups), dtype=bool)
+
+        for name, weight in targets.items():
+            if name not in self.groups or not len(self.members[self.groups.index(name)]):
+                if weight > 0:
+                    warnings.append(f"No tradable tokens in sector {name}, its {weight:.1%} stays in cash")
+                continue
+            g = self.groups.index(name)
+            wanted[g] = max(weight * self.total, frozen[g])
+            explicit[g] = True
+
+        risky = np.arange(len(self.groups)) != self.stable
+        room = (1 - stablecoin_floor) * self.total
+        if wanted[risky].sum() > room:
+            scale = room / wanted[risky].sum()
+            wanted[risky] = np.maximum(wanted[risky] * scale, frozen[risky])
+            warnings.append(f"Risky sectors scaled to {scale:.1%} of their targets to keep the {stablecoin_floor:.0%} stablecoin floor")
+
+        # buys are funded from stablecoins unless stablecoins have a target of their own
+        shortfall = wanted.sum() - self.total
+        if shortfall > 0 and not explicit[self.stable]:
+            wanted[self.stable] = max(wanted[self.stable] - shortfall, frozen[self.stable])
+            shortfall = wanted.sum() - self.total
+
+        if shortfall > 1e-9 * self.total:
+            scale = (wanted[risky].sum() - shortfall) / wanted[risky].sum()
+            wanted[risky] *= scale
+            warnings.append(f"Sector targets add up to more than the portfolio, scaled to {scale:.1%}")
+
+        return wanted
+
+    def distribute(self, wanted: np.ndarray, cap: float = np.inf) -> np.ndarray:
+        """Token values reaching each group's wanted value, none above `cap` unless its sector needs it, see steps 2-3."""
+        frozen = self.sector_values(np.where(self.tradable, 0.0, self.values))
+        result = self.values.copy()
+        for g, members in enumerate(self.members):
+            if not len(members):
+                continue
+            total = max(wanted[g] - frozen[g], 0.0)
+            if cap == np.inf and abs(total - self.values[members].sum()) <= 1e-12 * self.total:
+                continue
+            result[members] = fit_total(self.values[members], total, max(cap, total / len(members)))
+        return result
+
+    def cap_hhi(self, wanted: np.ndarray, target: np.ndarray, max_hhi: float, warnings: List[str]) -> np.ndarray:
+        if hhi(target) <= max_hhi:
+            return target
+
+        flattest = self.distribute(wanted, cap=0.0)
+        if hhi(flattest) > max_hhi:
+            warnings.append(f"HHI {max_hhi} is out of reach with these sector targets, lowest is {hhi(flattest):.4f}")
+            return flattest
+
+        low, high = 0.0, float(target.max())
+        for _ in range(HHI_STEPS):
+            middle = (low + high) / 2
+            if hhi(self.distribute(wanted, cap=middle)) <= max_hhi:
+                low = middle
+            else:
+                high = middle
+        return self.distribute(wanted, cap=low)
+
+    def apply_minimums(self, target: np.ndarray, min_order_value: float, min_amounts: Dict[str, float], warnings: List[str]) -> np.ndarray:
+        """Step 4."""
+        symbols = [t.symbol for t in self.portfolio.tokens]
+        minimum = np.fromiter((min_amounts.get(symbol, 0.0) for symbol in symbols), dtype=np.float64, count=len(symbols))
+        prices = np.where(self.tradable, self.prices, 1.0)
+
+        def drop_small(target: np.ndarray) -> np.ndarray:
+            delta = np.abs(target - self.values)
+            small = (delta > 0) & ((delta < min_order_value) | (delta / prices < minimum))
+            if small.any():
+                warnings.append(f"{int(small.sum())} legs below the minimum order size dropped")
+            return np.where(small, self.values, target)
+
+        target = drop_small(target)
+
+        # dropped sells no longer fund every buy: shrink the buys evenly
+        overdraft = target.sum() - self.total
+        if overdraft > 1e-9 * self.total:
+            buys = target > self.values
+            bought = (target - self.values)[buys].sum()
+            target = target.copy()
+            target[buys] = self.values[buys] + (target - self.values)[buys] * max(0.0, 1 - overdraft / bought)
+            target = drop_small(target)
+
+        return target
+
+    def plan(
+        self,
+        sector_targets: Dict[str, float],
+        max_hhi: Optional[float] = None,
+        stablecoin_floor: float = 0.0,
+        min_order_value: float = 0.0,
+        min_amounts: Optional[Dict[str, float]] = None,
+    ) -> RebalancePlan:
+        warnings: List[str] = []
+
+        wanted = self.sector_targets(sector_targets, stablecoin_floor, warnings)
+        target = self.distribute(wanted)
+        if max_hhi is not None:
+            target = self.cap_hhi(wanted, target, max_hhi, warnings)
+        target = self.apply_minimums(target, min_order_value, min_amounts or {}, warnings)
+
+        cash = float(self.total - target.sum())
+        delta = target - self.values
+        tokens = self.portfolio.tokens
+        moved = np.flatnonzero(np.abs(delta) > 1e-12 * max(self.total, 1.0))
+        # sells first so their proceeds are there for the buys, then largest first
+        moved = moved[np.lexsort((-np.abs(delta[moved]), delta[moved] > 0))]
+
+        legs = [
+            {
+                "side": "sell" if delta[i] < 0 else "buy",
+                "pair": self.pair_for(tokens[i].symbol),
+                "amount": round(float(abs(delta[i]) / self.prices[i]), 10),
+                "ordertype": "market",
+            }
+            for i in moved
+        ]
+
+        return RebalancePlan(
+            legs=legs,
+            values={t.symbol: float(value) for t, value in zip(tokens, target)},
+            cash=cash,
+            turnover=float(np.abs(delta).sum()),
+            before=self.metrics(self.values, self.cash),
+            after=self.metrics(target, cash),
+            warnings=warnings,
+        )
+
+
+def rebalance(portfolio: Portfolio, sector_targets: Dict[str, float], cash: float = 0.0, pair_for: Callable[[str], str] = default_pair, **constraints) -> RebalancePlan:
+    """Rebalancer(portfolio, cash, pair_for).plan(sector_targets, **constraints)."""
+    return Rebalancer(portfolio, cash, pair_for).plan(sector_targets, **constraints)
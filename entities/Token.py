@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     
     # Core market data
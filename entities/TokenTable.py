@@ -0,0 +1,177 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from entities.Token import Token
+import numpy as np
+import sys
+
+
+# numeric Token fields stored as one array each
+FLOAT_FIELDS = ("price", "volume_24h", "market_cap", "circulating_supply", "change_24h", "change_percent_24h", "holding_amount", "weight")
+
+# metadata keys common enough to get their own column, everything else goes to `extra`
+METADATA_COLUMNS = ("homepage", "blockchain_site", "genesis_date")
+
+# marks a metadata key the token did not have, as opposed to one set to None
+MISSING = object()
+
+
+class Vocabulary:
+    """Interned strings with stable integer ids."""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for value in values:
+            self.id(value)
+
+    def id(self, value: str) -> int:
+        code = self.ids.get(value)
+        if code is None:
+            code = self.ids[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def numeric(values: List, dtype) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Column plus a mask of None entries (None when there are none, the usual case)."""
+    nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    if not nulls.any():
+        return np.array(values, dtype=dtype), None
+    return np.array([0 if value is None else value for value in values], dtype=dtype), nulls
+
+
+def ragged(lists: List[Optional[List[str]]], vocabulary: Vocabulary) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR layout of string lists: row i is ids[offsets[i]:offsets[i + 1]]."""
+    lengths = np.fromiter((len(values or ()) for values in lists), dtype=np.int64, count=len(lists))
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    ids = np.fromiter((vocabulary.id(value) for values in lists for value in values or ()), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, ids
+
+
+@dataclass
+class TokenTable:
+    """
+    Struct-of-arrays form of a list of Tokens for universe-sized collections.
+    Numeric fields are numpy columns, sector and risk level are codes into
+    small vocabularies, and category and news lists are integer ids into
+    shared vocabularies. to_tokens() gives back Tokens equal to the input.
+    """
+    symbol: List[str]
+    name: List[str]
+    rank: np.ndarray
+    floats: Dict[str, np.ndarray]
+    nulls: Dict[str, np.ndarray]         # per numeric column, only when some values were None
+    is_stablecoin: np.ndarray
+    sector: np.ndarray
+    risk_level: np.ndarray
+    labels: Vocabulary                   # sector and risk level strings
+    category_offsets: np.ndarray
+    category_ids: np.ndarray
+    has_categories: np.ndarray           # metadata had a "categories" list
+    categories: Vocabulary
+    news_offsets: np.ndarray
+    news_ids: np.ndarray
+    news: Vocabulary
+    embedding_id: List[Optional[str]]
+    metadata_columns: Dict[str, list]
+    extra: List[Optional[Dict]]          # remaining metadata keys, None when there are none
+
+    @classmethod
+    def from_tokens(cls, tokens: List[Token]) -> "TokenTable":
+        n = len(tokens)
+        labels, categories, news = Vocabulary(), Vocabulary(), Vocabulary()
+
+        # a non-list "categories" value (e.g. None) is kept as is in `extra`
+        category_lists = [c if isinstance(c, list) else None for c in (t.metadata.get("categories") for t in tokens)]
+        category_offsets, category_ids = ragged(category_lists, categories)
+        news_offsets, news_ids = ragged([t.news_refs for t in tokens], news)
+
+        columns, nulls = {}, {}
+        for name, dtype in (("rank", np.int64), *((name, np.float64) for name in FLOAT_FIELDS)):
+            columns[name], mask = numeric([getattr(t, name) for t in tokens], dtype)
+            if mask is not None:
+                nulls[name] = mask
+
+        extra = []
+        for t, c in zip(tokens, category_lists):
+            known = {*METADATA_COLUMNS} if c is None else {"categories", *METADATA_COLUMNS}
+            rest = {key: value for key, value in t.metadata.items() if key not in known}
+            extra.append(rest or None)
+
+        return cls(
+            symbol=[t.symbol for t in tokens],
+            name=[t.name for t in tokens],
+            rank=columns.pop("rank"),
+            floats=columns,
+            nulls=nulls,
+            is_stablecoin=np.fromiter((t.is_stablecoin for t in tokens), dtype=bool, count=n),
+            sector=np.fromiter((labels.id(t.sector) for t in tokens), dtype=np.int16, count=n),
+            risk_level=np.fromiter((labels.id(t.risk_level) for t in tokens), dtype=np.int16, count=n),
+            labels=labels,
+            category_offsets=category_offsets,
+            category_ids=category_ids,
+            has_categories=np.fromiter((c is not None for c in category_lists), dtype=bool, count=n),
+            categories=categories,
+            news_offsets=news_offsets,
+            news_ids=news_ids,
+            news=news,
+            embedding_id=[t.embedding_id for t in tokens],
+            metadata_columns={key: [t.metadata.get(key, MISSING) for t in tokens] for key in METADATA_COLUMNS},
+            extra=extra,
+        )
+
+    def __len__(self) -> int:
+        return len(self.symbol)
+
+    def __getitem__(self, i: int) -> Token:
+        metadata = {}
+        if self.has_categories[i]:
+            metadata["categories"] = [self.categories.values[c] for c in self.category_ids[self.category_offsets[i]:self.category_offsets[i + 1]]]
+        for key, column in self.metadata_columns.items():
+            if column[i] is not MISSING:
+                metadata[key] = column[i]
+        if self.extra[i]:
+            metadata.update(self.extra[i])
+
+        return Token(
+            symbol=self.symbol[i],
+            name=self.name[i],
+            rank=self._numeric("rank", self.rank, i, int),
+            **{name: self._numeric(name, column, i, float) for name, column in self.floats.items()},
+            sector=self.labels.values[self.sector[i]],
+            risk_level=self.labels.values[self.risk_level[i]],
+            is_stablecoin=bool(self.is_stablecoin[i]),
+            news_refs=[self.news.values[c] for c in self.news_ids[self.news_offsets[i]:self.news_offsets[i + 1]]],
+            embedding_id=self.embedding_id[i],
+            metadata=metadata,
+        )
+
+    def _numeric(self, name: str, column: np.ndarray, i: int, cast):
+        if name in self.nulls and self.nulls[name][i]:
+            return None
+        return cast(column[i])
+
+    def to_tokens(self) -> List[Token]:
+        return [self[i] for i in range(len(self))]
+
+    def values(self) -> np.ndarray:
+        """holding_amount * price per token."""
+        return self.floats["holding_amount"] * self.floats["price"]
+
+    def sector_names(self) -> List[str]:
+        return [self.labels.values[code] for code in self.sector]
+
+    def category_mask(self, category: str) -> np.ndarray:
+        """Tokens tagged with `category`."""
+        code = self.categories.ids.get(category)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        hits = np.flatnonzero(self.category_ids == code)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[np.searchsorted(self.category_offsets, hits, side="right") - 1] = True
+        return mask
+
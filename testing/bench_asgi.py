@@ -0,0 +1,177 @@
+'''
+Flask (thread-per-request worker pool) vs the ASGI app under a mix of slow
+recommendation calls and fast portfolio/asset calls, with stubbed upstreams.
+
+    python testing/bench_asgi.py --slow 100 --fast 10 --duration 10 --llm-latency 3
+
+Flask runs behind a fixed pool of --flask-threads worker threads, like a
+gunicorn gthread worker; the ASGI app runs under a single uvicorn worker.
+
+First checks that both Grok stream clients reassemble the fake recommendation,
+non-ASCII characters included, exactly as it was sent.
+'''
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+sys.path.insert(0, BACKEND)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve_flask(port: int, threads: int):
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import BaseWSGIServer
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    class PooledWSGIServer(BaseWSGIServer):
+        multithread = True
+        pool = ThreadPoolExecutor(threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer('127.0.0.1', port, app).serve_forever()
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def load(base: str, slow: int, fast: int, duration: float):
+    import httpx
+
+    stats = {'slow': [], 'fast': [], 'errors': 0}
+    stop_at = time.perf_counter() + duration
+
+    async def worker(kind: str, client):
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                if kind == 'slow':
+                    response = await client.post(base + '/api/v1/recommendation', json={})
+                else:
+                    response = await client.get(base + '/api/v1/portfolio')
+                response.raise_for_status()
+                stats[kind].append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                stats['errors'] += 1
+
+    limits = httpx.Limits(max_connections=slow + fast + 10)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        await asyncio.gather(*(
+            [worker('slow', client) for _ in range(slow)] +
+            [worker('fast', client) for _ in range(fast)]
+        ))
+
+    return stats
+
+
+def wait_for_port(port: int, timeout: float = 20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f'server on {port} did not start')
+
+
+def check_stream_text(url: str):
+    import fake_llm
+    import httpx
+    import llm
+
+    llm.grok_api_url = url
+    portfolio = {'positions': [], 'total_holdings': 0, 'total_profit_loss': 0}
+
+    async def astream():
+        async with httpx.AsyncClient() as client:
+            return ''.join([delta async for delta in llm.astream_grok_request(portfolio, client)])
+
+    assert ''.join(llm.stream_grok_request(portfolio)) == fake_llm.RECOMMENDATION
+    assert asyncio.run(astream()) == fake_llm.RECOMMENDATION
+
+
+def report(label: str, stats, duration: float):
+    for kind in ('fast', 'slow'):
+        values = stats[kind]
+        print(f'{label:6s} {kind:4s} {len(values) / duration:8.1f} req/s  '
+              f'p50 {percentile(values, 0.5) * 1000:8.1f} ms  p99 {percentile(values, 0.99) * 1000:8.1f} ms')
+    print(f'{label:6s} errors {stats["errors"]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--slow', type=int, default=100, help='concurrent recommendation clients')
+    parser.add_argument('--fast', type=int, default=10, help='concurrent portfolio clients')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--llm-latency', type=float, default=3)
+    parser.add_argument('--kraken-latency', type=float, default=0.03)
+    parser.add_argument('--flask-threads', type=int, default=8)
+    parser.add_argument('--serve-flask', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_flask:
+        serve_flask(args.serve_flask, args.flask_threads)
+        sys.exit(0)
+
+    import fake_kraken
+    import fake_llm
+
+    kraken = fake_kraken.serve(latency=args.kraken_latency)
+    llm = fake_llm.serve(latency=args.llm_latency)
+
+    check_stream_text(llm.url)
+    print('streamed recommendations decode as UTF-8 in both clients')
+
+    env = dict(
+        os.environ,
+        KRAKEN_API_URL=kraken.url,
+        GROK_API_URL=llm.url,
+        KRAKEN_PUBLIC_KEY='bench',
+        KRAKEN_PRIVATE_KEY=base64.b64encode(b'bench-secret').decode(),
+        TRADE_LEDGER_PATH=os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3'),
+        KRAKEN_TIER='off',
+    )
+
+    servers = {
+        'flask': lambda port: [sys.executable, os.path.abspath(__file__), '--serve-flask', str(port), '--flask-threads', str(args.flask_threads)],
+        'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning'],
+    }
+
+    for label, command in servers.items():
+        port = free_port()
+        proc = subprocess.Popen(command(port), cwd=BACKEND, env=env)
+        try:
+            wait_for_port(port)
+            stats = asyncio.run(load(f'http://127.0.0.1:{port}', args.slow, args.fast, args.duration))
+            report(label, stats, args.duration)
+        finally:
+            proc.terminate()
+            proc.wait()
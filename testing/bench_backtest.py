@@ -0,0 +1,164 @@
+'''
+Backtester checks on synthetic prices, then throughput of a parameter grid.
+
+    python testing/bench_backtest.py --pairs 300 --years 3 --processes 4
+
+Checks: simulate() matches a bar-by-bar replay with holdings in units (fees,
+drift, pairs listed part way through), fees only scale the value path,
+strategies never look ahead, a buy-and-hold of one pair has HHI 1, momentum
+finds the one trending pair, the process pool returns what a single process
+does, and recommendations parse from a send_grok_request reply.
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from backtest import Hold, Momentum, Rebalance, parse_recommendation, recommendation_weights, run_grid, simulate
+
+
+def synthetic_closes(bars: int, pairs: int, seed: int, listed_late: float = 0.25) -> np.ndarray:
+    '''Random walks, some pairs listed part way through (NaN before).'''
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (bars, pairs)), axis=0))
+    for j in np.flatnonzero(rng.random(pairs) < listed_late):
+        closes[:rng.integers(1, bars // 2), j] = np.nan
+    return closes
+
+
+def replay(closes: np.ndarray, bars, weights, fee_rate: float, start=None) -> np.ndarray:
+    '''The same trades bar by bar, holdings kept as units and cash.'''
+    trades = {int(bar): np.asarray(w, dtype=np.float64) for bar, w in zip(bars, weights)}
+    if 0 not in trades:
+        trades[0] = np.zeros(closes.shape[1]) if start is None else np.asarray(start)
+    held = np.where(np.isfinite(closes[0]), trades[0], 0.0) if start is None else np.asarray(start, dtype=np.float64)
+
+    units, cash, values = None, None, []
+    for t, prices in enumerate(closes):
+        listed = np.isfinite(prices)
+        if units is None:
+            value, current = 1.0, held
+        else:
+            value = cash + np.sum(units[listed] * prices[listed])
+            current = np.where(listed, units * np.where(listed, prices, 0) / value, 0.0)
+
+        if t in trades:
+            target = np.where(listed, trades[t], 0.0)
+            value -= fee_rate * np.abs(target - current).sum() * value
+            units = np.where(listed, target * value / np.where(listed, prices, 1), 0.0)
+            cash = value * (1 - target.sum())
+
+        values.append(value)
+    return np.array(values)
+
+
+def check_engine():
+    closes = synthetic_closes(480, 8, seed=1)
+    rng = np.random.default_rng(2)
+    weights = rng.dirichlet(np.ones(9))[:8]
+
+    for strategy in (Hold(weights), Rebalance(weights, every=37), Momentum(lookback=24, top=3, every=11)):
+        bars, targets = strategy.targets(closes)
+        for fee_rate in (0.0, 0.004):
+            result = simulate(closes, bars, targets, fee_rate=fee_rate)
+            assert np.allclose(result['value'], replay(closes, bars, targets, fee_rate)), (type(strategy).__name__, fee_rate)
+
+    # trading away from a different starting portfolio costs fees on the first bar too
+    start = rng.dirichlet(np.ones(9))[:8]
+    bars, targets = Rebalance(weights, every=50).targets(closes)
+    assert np.allclose(simulate(closes, bars, targets, start=start)['value'], replay(closes, bars, targets, 0.004, start))
+
+    # fees scale the whole path by (1 - fee) per trade, the turnover is unchanged
+    free = simulate(closes, bars, targets, fee_rate=0.0, start=start)
+    paid = simulate(closes, bars, targets, fee_rate=0.01, start=start)
+    assert paid['total_return'] < free['total_return'] and paid['fees'] > 0 == free['fees']
+    assert np.isclose(paid['turnover'] * np.mean(paid['value']), free['turnover'] * np.mean(free['value']), rtol=0.05)
+
+    # no look-ahead: changing the future leaves earlier targets alone
+    momentum = Momentum(lookback=24, top=3, every=11)
+    bars, targets = momentum.targets(closes)
+    changed = closes.copy()
+    changed[300:] *= np.random.default_rng(3).uniform(0.5, 2, changed[300:].shape)
+    later_bars, later_targets = momentum.targets(changed)
+    early = bars <= 300
+    assert np.array_equal(bars, later_bars) and np.array_equal(targets[early], later_targets[early])
+
+    single = np.zeros(8)
+    single[0] = 1.0
+    result = simulate(np.nan_to_num(closes, nan=100.0), *Hold(single).targets(closes), fee_rate=0.0)
+    assert np.allclose(result['hhi'], 1.0)
+
+
+def check_momentum():
+    closes = synthetic_closes(2000, 10, seed=4, listed_late=0)
+    closes[:, 7] = 100 * np.exp(np.linspace(0, 3, 2000))
+    momentum = simulate(closes, *Momentum(lookback=240, top=1, every=24).targets(closes))
+    hold = simulate(closes, *Hold(np.full(10, 0.1)).targets(closes))
+    assert momentum['total_return'] > hold['total_return'] and np.isclose(momentum['hhi_final'], 1.0)
+
+
+def check_grid():
+    closes = synthetic_closes(1500, 20, seed=5)
+    grid = {'lookback': [24, 72], 'top': [2, 5], 'every': [12, 48]}
+    single = run_grid(Momentum, closes, grid, processes=1, fee_rate=0.002)
+    pooled = run_grid(Momentum, closes, grid, processes=2, fee_rate=0.002)
+    assert pooled['processes'] == 2 and len(pooled['runs']) == 8
+    for a, b in zip(single['runs'], pooled['runs']):
+        assert a['params'] == b['params'] and a['total_return'] == b['total_return'] and a['turnover'] == b['turnover']
+
+
+def check_recommendation():
+    import fake_llm
+
+    reply = {'choices': [{'message': {'content': fake_llm.RECOMMENDATION}}]}
+    recommendation = parse_recommendation(reply)
+    assert recommendation == {'token': 'ETH', 'action': 'BUY', 'price': 4660.03, 'quantity': 0.05}, recommendation
+    assert parse_recommendation('no structured answer') is None
+
+    pairs = ['XXBTZUSD', 'SOLUSD', 'XETHZUSD']
+    weights = np.array([0.5, 0.4, 0.0])
+    pair_for = {'BTC': 'XXBTZUSD', 'SOL': 'SOLUSD', 'ETH': 'XETHZUSD'}.get
+
+    # $233 of ETH on a $1,000 portfolio: $100 of cash, the rest sold pro rata
+    target, error = recommendation_weights(weights, pairs, 1000.0, recommendation, pair_for)
+    assert error is None and np.allclose(target, [0.5 * (1 - 0.133 / 0.9), 0.4 * (1 - 0.133 / 0.9), 0.233], atol=1e-6)
+    target, _ = recommendation_weights(weights, pairs, 1000.0, {'token': 'SOL', 'action': 'SELL', 'price': 200, 'quantity': 5}, pair_for)
+    assert np.allclose(target, [0.5, 0.0, 0.0])
+    assert recommendation_weights(weights, pairs, 1000.0, {**recommendation, 'token': 'FOO'}, pair_for)[1] == 'No stored bars for FOO'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=300)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    check_engine()
+    check_momentum()
+    check_grid()
+    check_recommendation()
+    print('engine matches the bar-by-bar replay, grid and recommendation checks pass')
+
+    bars = int(args.years * 365 * 24)
+    closes = synthetic_closes(bars, args.pairs, seed=6)
+    print(f'{bars} hourly bars x {args.pairs} pairs')
+
+    for name, strategy in [('hold', Hold(np.full(args.pairs, 1 / args.pairs))),
+                           ('rebalance daily', Rebalance(np.full(args.pairs, 1 / args.pairs), every=24)),
+                           ('momentum', Momentum(lookback=168, top=10, every=24))]:
+        started = time.perf_counter()
+        result = simulate(closes, *strategy.targets(closes), fee_rate=0.004)
+        elapsed = time.perf_counter() - started
+        print(f'  {name:16s} {elapsed * 1000:7.1f} ms  {bars / elapsed:12,.0f} bars/s  return {result["total_return"]:+8.1%}'
+              f'  turnover {result["turnover"]:7.1f}x  fees {result["fees"]:.3f}  HHI {result["hhi_mean"]:.3f}')
+
+    grid = {'lookback': [24, 168, 720], 'top': [3, 10], 'every': [24, 168]}
+    result = run_grid(Momentum, closes, grid, processes=args.processes, fee_rate=0.004)
+    best = max(result['runs'], key=lambda r: r['sharpe'])
+    print(f'  momentum grid    {len(result["runs"])} runs in {result["seconds"]:.2f} s on {result["processes"]} processes,'
+          f' {result["bars_per_second"]:,.0f} bars/s; best sharpe {best["sharpe"]:.2f} with {best["params"]}')
@@ -0,0 +1,151 @@
+'''
+find_similar over a token universe: per-string embedding (the old token_vector
+path) vs the batched, persistent embedding cache.
+
+    python testing/bench_embeddings.py --tokens 2000
+    python testing/bench_embeddings.py --tokens 2000 --real   # all-MiniLM-L6-v2
+
+Without --real the model is a stand-in with a fixed cost per encode call and
+per text, so the numbers show the call pattern rather than a specific CPU.
+First checks that caches in several processes sharing one root never
+return another text's vector.
+'''
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from entities.Token import Token
+from entities.Portfolio import Portfolio, SECTORS, token_vector
+from RAG.embedding_cache import EmbeddingCache
+
+
+class FakeModel:
+    '''Deterministic 384-d vectors with a per-call and per-text cost.'''
+
+    def __init__(self, call_cost: float = 0.01, text_cost: float = 0.0005):
+        self.call_cost = call_cost
+        self.text_cost = text_cost
+        self.calls = 0
+
+    def encode(self, texts, convert_to_numpy=True):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        self.calls += 1
+        time.sleep(self.call_cost + self.text_cost * len(texts))
+        vectors = np.stack([
+            np.random.default_rng(int(hashlib.sha1(t.encode()).hexdigest()[:8], 16)).standard_normal(384).astype(np.float32)
+            for t in texts
+        ])
+        return vectors[0] if single else vectors
+
+
+def make_tokens(n: int, seed: int = 3):
+    rng = random.Random(seed)
+    vocabulary = [f'Category {i}' for i in range(300)] + ['Layer 1 (L1)', 'Coinbase 50 Index', 'Ethereum Ecosystem']
+    return [
+        Token(
+            symbol=f'T{i}', name=f'Token {i}', price=1.0, volume_24h=0.0, market_cap=0.0,
+            circulating_supply=0.0, change_24h=0.0, change_percent_24h=0.0, rank=i,
+            sector=rng.choice(SECTORS),
+            metadata={'categories': rng.sample(vocabulary, rng.randint(3, 15)), 'description': f'Token {i} description'}
+        )
+        for i in range(n)
+    ]
+
+
+def fake_vectors(texts):
+    return FakeModel(call_cost=0, text_cost=0).encode(texts)
+
+
+def fill_shared(root: str, worker: int):
+    cache = EmbeddingCache('fake-384', encode=fake_vectors, root=root)
+    for batch in range(20):
+        cache.get_many([f'text {worker} {batch} {i}' for i in range(5)] + ['shared'])
+
+
+def check_shared():
+    root = tempfile.mkdtemp()
+    try:
+        # two caches opened before either writes: the second must not overwrite the first's rows
+        first = EmbeddingCache('fake-384', encode=fake_vectors, root=root)
+        second = EmbeddingCache('fake-384', encode=fake_vectors, root=root)
+        first.get_many(['alpha'])
+        second.get_many(['beta'])
+
+        workers = [multiprocessing.Process(target=fill_shared, args=(root, w)) for w in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            assert worker.exitcode == 0
+
+        texts = ['alpha', 'beta', 'shared'] + [f'text {w} {b} {i}' for w in range(4) for b in range(20) for i in range(5)]
+        reopened = EmbeddingCache('fake-384', encode=fake_vectors, root=root)
+        assert np.array_equal(reopened.get_many(texts), fake_vectors(texts))
+        assert reopened.stats()['disk_hits'] == len(texts) and reopened.stats()['disk_entries'] == len(texts)
+    finally:
+        shutil.rmtree(root)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', type=int, default=2000)
+    parser.add_argument('--uncached-sample', type=int, default=50, help='tokens embedded one string at a time, extrapolated')
+    parser.add_argument('--real', action='store_true')
+    args = parser.parse_args()
+
+    if args.real:
+        from entities.Portfolio import get_model
+        model, name = get_model(), 'all-MiniLM-L6-v2'
+    else:
+        model, name = FakeModel(), 'fake-384'
+
+    check_shared()
+    print('shared root: concurrent processes keep every text on its own row')
+
+    tokens = make_tokens(args.tokens)
+    root = tempfile.mkdtemp()
+
+    try:
+        embed_one = lambda text: model.encode(text)
+        sample = tokens[:args.uncached_sample]
+        per_string, _ = timed(lambda: [token_vector(t, embed_one, 384) for t in sample])
+        print(f'per-string      {per_string / len(sample) * len(tokens):9.2f} s  (extrapolated from {len(sample)} tokens)')
+
+        def encode(texts):
+            return model.encode(texts, convert_to_numpy=True)
+
+        cache = EmbeddingCache(name, encode=encode, root=root)
+        portfolio = Portfolio(tokens, embed_many=cache.get_many)
+        cold, _ = timed(lambda: portfolio.find_similar(tokens[0]))
+        print(f'batched, cold   {cold:9.3f} s  {cache.stats()}')
+
+        portfolio.invalidate()
+        warm, _ = timed(lambda: portfolio.find_similar(tokens[0]))
+        print(f'memory cache    {warm:9.3f} s')
+
+        queries, _ = timed(lambda: [portfolio.find_similar(t) for t in tokens[:100]])
+        print(f'find_similar    {queries / 100 * 1000:9.3f} ms/query with vectors built')
+
+        # a new process: same directory, empty in-memory LRU
+        reopened = EmbeddingCache(name, encode=encode, root=root)
+        disk, _ = timed(lambda: Portfolio(tokens, embed_many=reopened.get_many).find_similar(tokens[0]))
+        print(f'disk cache      {disk:9.3f} s  {reopened.stats()}')
+    finally:
+        shutil.rmtree(root)
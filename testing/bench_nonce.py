@@ -0,0 +1,139 @@
+'''
+Nonce stress test: many processes with many threads each draw nonces from one
+shared counter file, as gunicorn workers signing private calls in parallel do.
+
+    python testing/bench_nonce.py --processes 8 --threads 8 --nonces 2000
+
+Checks that no nonce repeats and that every thread saw its nonces strictly
+increase, then shows how many the previous per-process millisecond nonce
+would have repeated under the same load. Also checks that calls reaching a
+Kraken-like server out of nonce order are retried with a fresh nonce, orders excepted.
+'''
+import argparse
+import http.server
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from nonce import NonceProvider
+from transport import KrakenSession, should_retry
+
+
+def per_process_nonce():
+    '''The previous utils.get_nonce: monotonic within one process only.'''
+    lock = threading.Lock()
+    last = [0]
+
+    def get_nonce() -> int:
+        with lock:
+            last[0] = max(last[0] + 1, int(time.time() * 1000))
+            return last[0]
+    return get_nonce
+
+
+def worker(path, threads: int, nonces: int, shared: bool, start, results):
+    get_nonce = NonceProvider(path).next if shared else per_process_nonce()
+    drawn = [[] for _ in range(threads)]
+
+    def draw(out):
+        start.wait()
+        for _ in range(nonces):
+            out.append(get_nonce())
+
+    pool = [threading.Thread(target=draw, args=(out,)) for out in drawn]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(drawn)
+
+
+def run(processes: int, threads: int, nonces: int, shared: bool):
+    path = os.path.join(tempfile.mkdtemp(), 'nonce')
+    ctx = multiprocessing.get_context('fork')
+    start, results = ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(path, threads, nonces, shared, start, results)) for _ in range(processes)]
+    for proc in procs:
+        proc.start()
+
+    started = time.perf_counter()
+    start.set()
+    sequences = [seq for _ in procs for seq in results.get()]
+    elapsed = time.perf_counter() - started
+    for proc in procs:
+        proc.join()
+
+    values = [nonce for seq in sequences for nonce in seq]
+    repeated = len(values) - len(set(values))
+    unordered = sum(any(b <= a for a, b in zip(seq, seq[1:])) for seq in sequences)
+    return len(values), repeated, unordered, elapsed
+
+
+class NonceCheckingHandler(http.server.BaseHTTPRequestHandler):
+    '''Answers EAPI:Invalid nonce unless the nonce beats the last accepted one, as Kraken does.'''
+    accepted = [0]
+    rejected = [0]
+
+    def do_POST(self):
+        nonce = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['nonce']
+        if nonce <= self.accepted[0]:
+            self.rejected[0] += 1
+            body = {'error': ['EAPI:Invalid nonce'], 'result': {}}
+        else:
+            self.accepted[0] = nonce
+            body = {'error': [], 'result': {'nonce': nonce}}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def check_out_of_order_retry():
+    rejection = json.dumps({'error': ['EAPI:Invalid nonce']}).encode()
+    assert should_retry(200, rejection, retry_server_errors=True)
+    assert not should_retry(200, rejection, retry_server_errors=False), 'an order is never resent on Invalid nonce'
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), NonceCheckingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/0/private/Balance'
+
+    provider = NonceProvider(os.path.join(tempfile.mkdtemp(), 'nonce'))
+    session = KrakenSession(backoff=0.001)
+    # the second call's nonce is drawn first but it is sent last: it arrives out of order
+    late = provider.next()
+    first = session.request('POST', url, lambda: ({}, json.dumps({'nonce': provider.next()}).encode()))
+    nonces = iter([late])
+    second = session.request('POST', url, lambda: ({}, json.dumps({'nonce': next(nonces, None) or provider.next()}).encode()))
+
+    assert json.loads(first.read())['error'] == []
+    assert json.loads(second.read())['error'] == [] and NonceCheckingHandler.rejected[0] == 1
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--nonces', type=int, default=2000, help='per thread')
+    args = parser.parse_args()
+
+    check_out_of_order_retry()
+    print('a call arriving behind a higher nonce is retried with a fresh one')
+
+    total, repeated, unordered, elapsed = run(args.processes, args.threads, args.nonces, shared=True)
+    print(f'shared counter file: {total} nonces from {args.processes}x{args.threads} threads in {elapsed:.2f} s '
+          f'({total / elapsed:,.0f}/s), {repeated} repeated, {unordered} threads out of order')
+    assert repeated == 0 and unordered == 0
+
+    total, repeated, unordered, elapsed = run(args.processes, args.threads, args.nonces, shared=False)
+    print(f'per-process counter: {total} nonces, {repeated} repeated across processes')
@@ -0,0 +1,105 @@
+'''
+Multi-leg orders against the local fake Kraken: one AddOrder per leg, as the
+buy/sell endpoints do, vs /api/v1/orders/batch.
+
+    python testing/bench_orders.py --legs 20 --latency 0.05
+
+The batch includes legs that must be rejected before reaching the exchange
+(unknown pair, below ordermin, bad price precision) and checks every leg's
+outcome and what the fake exchange actually recorded. Both the Flask and the
+ASGI endpoint are exercised.
+'''
+import argparse
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+os.environ.setdefault('KRAKEN_PUBLIC_KEY', 'bench')
+os.environ.setdefault('KRAKEN_PRIVATE_KEY', base64.b64encode(b'bench-secret').decode())
+os.environ.setdefault('TRADE_LEDGER_PATH', os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3'))
+os.environ.setdefault('PAIR_REGISTRY_PATH', os.path.join(tempfile.mkdtemp(), 'pairs.json'))
+
+
+def make_legs(n: int, seed: int = 2):
+    rng = random.Random(seed)
+    legs = []
+    for _ in range(n):
+        if rng.random() < 0.5:
+            legs.append({'side': rng.choice(['buy', 'sell']), 'pair': rng.choice(['XBTUSD', 'BTC/USD', 'XXBTZUSD']),
+                         'amount': round(rng.uniform(0.0001, 0.01), 10), 'ordertype': 'market'})
+        else:
+            legs.append({'side': rng.choice(['buy', 'sell']), 'pair': 'SOL/USD', 'amount': round(rng.uniform(0.05, 5), 10),
+                         'ordertype': 'limit', 'price': round(rng.uniform(200, 260), 2)})
+
+    # never reach the exchange
+    legs += [
+        {'side': 'buy', 'pair': 'FOO/USD', 'amount': 1, 'ordertype': 'market'},
+        {'side': 'buy', 'pair': 'SOLUSD', 'amount': 0.001, 'ordertype': 'market'},
+        {'side': 'sell', 'pair': 'XBTUSD', 'amount': 0.001, 'ordertype': 'limit', 'price': 100000.25},
+        {'side': 'hold', 'pair': 'XBTUSD', 'amount': 0.001},
+    ]
+    return legs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--legs', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    import fake_kraken
+    import utils
+
+    server = fake_kraken.serve(latency=args.latency)
+    utils.KRAKEN_API_URL = server.url
+
+    import app
+    import asgi
+    from service import execute_order, pair_registry
+    from starlette.testclient import TestClient
+
+    pair_registry.load()
+    legs = make_legs(args.legs)
+    valid = args.legs
+
+    started = time.perf_counter()
+    serial = [execute_order(leg['side'], leg['pair'], leg['amount'], leg.get('ordertype', 'market'), leg.get('price')) for leg in legs]
+    serial_time = time.perf_counter() - started
+    assert sum(error is None for _, error in serial) == valid
+    assert len(server.orders) == valid
+
+    client = app.app.test_client()
+    started = time.perf_counter()
+    response = client.post('/api/v1/orders/batch', json={'orders': legs})
+    batch_time = time.perf_counter() - started
+    data = response.get_json()['data']
+
+    assert [r['leg'] for r in data['orders']] == list(range(len(legs)))
+    assert (data['submitted'], data['rejected'], data['failed']) == (valid, len(legs) - valid, 0), data
+    assert all((r['status'] == 'submitted') == (error is None) for r, (_, error) in zip(data['orders'], serial))
+    assert len(server.orders) == 2 * valid
+    assert {o['txid'] for o in server.orders[valid:]} == {
+        r['data']['txid'] if isinstance(r['data']['txid'], str) else r['data']['txid'][0]
+        for r in data['orders'] if r['status'] == 'submitted'
+    }
+
+    with TestClient(asgi.app) as asgi_client:
+        started = time.perf_counter()
+        asgi_data = asgi_client.post('/api/v1/orders/batch', json={'orders': legs}).json()['data']
+        asgi_time = time.perf_counter() - started
+        assert [r['status'] for r in asgi_data['orders']] == [r['status'] for r in data['orders']]
+
+        dry_run = asgi_client.post('/api/v1/orders/batch', json={'orders': legs, 'validate': True}).json()['data']
+        assert dry_run['submitted'] == valid and len(server.orders) == 3 * valid
+
+    print(f'{len(legs)} legs ({valid} valid) at {args.latency * 1000:.0f} ms per exchange call')
+    print(f'AddOrder per leg   {serial_time:6.3f} s  {server.paths.get("/0/private/AddOrder", 0)} AddOrder calls so far')
+    print(f'batch (Flask)      {batch_time:6.3f} s  ({serial_time / batch_time:4.1f}x)')
+    print(f'batch (ASGI)       {asgi_time:6.3f} s  ({serial_time / asgi_time:4.1f}x)')
+    print(f'exchange calls: {server.paths}')
+    for result in data['orders'][-4:]:
+        print(f'    leg {result["leg"]}: {result["status"]}, {result["details"]}')
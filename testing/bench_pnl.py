@@ -0,0 +1,289 @@
+'''
+FIFO / average-cost P&L: randomized property checks, then throughput on
+synthetic trades.
+
+    python testing/bench_pnl.py --trades 100000 --pairs 50 --rounds 200
+
+Checks, each over --rounds random trade histories: FIFO realized matches a
+unit-by-unit brute force; average cost per unit is unchanged by sells; both
+methods agree on realized + unrealized; a closed position has realized equal
+to its cash flows; applying in chunks, restarting the ledger, receiving
+trades late and sharing the database with another worker all give the
+books a single in-order pass gives; the running
+unrealized total kept by mark() matches a recomputation. Then the recorded
+history in fixtures/trades_history.json is synced from the fake Kraken,
+three TradesHistory pages, booked like a single in-order pass and marked at
+the Ticker prices as build_portfolio does.
+'''
+import argparse
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+os.environ.setdefault('KRAKEN_PUBLIC_KEY', 'bench')
+os.environ.setdefault('KRAKEN_PRIVATE_KEY', base64.b64encode(b'bench-secret').decode())
+os.environ.setdefault('KRAKEN_TIER', 'off')
+
+from ledger import TradeLedger
+from pnl import METHODS, PairBook, PnLBook, unrealized_profit_loss
+
+
+def synthetic_trades(n: int, pairs: int, seed: int, whole: bool = False, oversell: float = 0.02) -> list:
+    '''Kraken-like trades (string fields) in time order; sells mostly within holdings.'''
+    rng = random.Random(seed)
+    held = [0.0] * pairs
+    prices = [rng.uniform(1, 1000) for _ in range(pairs)]
+    trades = []
+    for k in range(n):
+        j = rng.randrange(pairs)
+        prices[j] *= 1 + rng.gauss(0, 0.02)
+        if held[j] and rng.random() < 0.45:
+            side = 'sell'
+            vol = held[j] * 1.5 if rng.random() < oversell else held[j] * rng.choice((rng.random(), 1.0))
+            vol = max(round(vol), 1) if whole else vol
+        else:
+            side = 'buy'
+            vol = float(rng.randint(1, 20)) if whole else rng.uniform(0.001, 10)
+        held[j] = max(held[j] + (vol if side == 'buy' else -vol), 0.0)
+        cost = vol * prices[j]
+        trades.append({
+            'pair': f'P{j}USD',
+            'time': f'{1_700_000_000 + k * 0.5 + rng.random() * 0.1:.4f}',
+            'type': side,
+            'ordertype': 'market',
+            'price': repr(prices[j]),
+            'vol': repr(vol),
+            'cost': repr(cost),
+            'fee': repr(cost * rng.choice((0.0, 0.0016, 0.0026))),
+            'margin': '0',
+        })
+    return trades
+
+
+def close(a: float, b: float) -> bool:
+    return abs(a - b) <= 1e-6 * max(1.0, abs(a), abs(b))
+
+
+def check_fifo_brute_force(seed: int):
+    '''Whole-unit volumes: FIFO is a queue of per-unit costs.'''
+    trades = synthetic_trades(200, 3, seed, whole=True, oversell=0.1)
+    book = PnLBook('fifo')
+    units, realized, unmatched = {}, {}, {}
+    for trade in trades:
+        book.apply(trade)
+        pair, vol, cost, fee = trade['pair'], int(float(trade['vol'])), float(trade['cost']), float(trade['fee'])
+        queue = units.setdefault(pair, [])
+        if trade['type'] == 'buy':
+            queue.extend([(cost + fee) / vol] * vol)
+            continue
+        taken = queue[:vol]
+        del queue[:vol]
+        realized[pair] = realized.get(pair, 0.0) + (cost - fee) * len(taken) / vol - sum(taken)
+        unmatched[pair] = unmatched.get(pair, 0) + vol - len(taken)
+
+    for pair, state in book.books.items():
+        assert close(state.realized, realized.get(pair, 0.0)), (seed, pair, state.realized, realized.get(pair))
+        assert close(state.amount, len(units[pair])) and close(state.cost, sum(units[pair])), (seed, pair)
+        assert close(state.unmatched, unmatched.get(pair, 0)), (seed, pair)
+
+
+def check_average_cost(seed: int):
+    book = PairBook('P', 'average')
+    for trade in synthetic_trades(300, 1, seed, oversell=0):
+        before = book.cost / book.amount if book.amount else None
+        book.apply(trade['type'], float(trade['vol']), float(trade['cost']), float(trade['fee']))
+        if trade['type'] == 'sell' and book.amount:
+            assert close(book.cost / book.amount, before), seed
+
+
+def check_methods_agree(seed: int):
+    trades = synthetic_trades(500, 5, seed)
+    books = {method: PnLBook(method) for method in METHODS}
+    for book in books.values():
+        for trade in trades:
+            book.apply(trade)
+    prices = {trade['pair']: float(trade['price']) for trade in trades}
+
+    totals = []
+    for book in books.values():
+        for pair, price in prices.items():
+            book.mark(pair, price)
+        totals.append(book.realized + book.unrealized)
+        assert close(book.fees, sum(float(t['fee']) for t in trades))
+    assert close(*totals), (seed, totals)
+
+    # a flat position has realized every cash flow of its matched volume
+    for method, book in books.items():
+        for pair, state in book.books.items():
+            if state.amount == 0 and state.unmatched == 0:
+                flows = sum(float(t['cost']) * (1 if t['type'] == 'sell' else -1) - float(t['fee']) for t in trades if t['pair'] == pair)
+                assert close(state.realized, flows), (seed, method, pair)
+
+
+def positions_equal(a: dict, b: dict) -> bool:
+    return a.keys() == b.keys() and all(
+        all(close(a[pair][key], b[pair][key]) if isinstance(a[pair][key], float) else a[pair][key] == b[pair][key] for key in a[pair])
+        for pair in a
+    )
+
+
+def pages(trades: list):
+    '''fetch_page over a fixed set of trades, as one TradesHistory page.'''
+    def fetch_page(params):
+        if params.get('ofs'):
+            return {'trades': {}, 'count': len(trades)}, None
+        return {'trades': {f"{t['pair']}-{t['time']}": t for t in trades}, 'count': len(trades)}, None
+    return fetch_page
+
+
+def held(book: PnLBook) -> dict:
+    '''Positions as TradeLedger.positions() reports them.'''
+    return {pair: position for pair, position in book.positions().items() if position['amount'] or position['realized']}
+
+
+def check_incremental(seed: int, method: str):
+    trades = synthetic_trades(400, 4, seed)
+    batch = PnLBook(method)
+    for trade in trades:
+        batch.apply(trade)
+
+    path = os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3')
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(trades)), 5))
+    ledger = None
+    for lo, hi in zip([0] + cuts, cuts + [len(trades)]):
+        # a fresh ledger each sync: the books are rebuilt from SQLite, then extended
+        ledger = TradeLedger(path, pages(trades[lo:hi]), method=method)
+        positions, error = ledger.sync()
+        assert error is None
+        if hi < len(trades):
+            ledger.close()
+    assert positions_equal(positions, held(batch)), (seed, method)
+
+    # a trade Kraken reports late lands before trades already booked for its pair
+    late_path = os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3')
+    held_back = set(rng.sample(range(len(trades)), 20))
+    early = TradeLedger(late_path, pages([t for k, t in enumerate(trades) if k not in held_back]), method=method)
+    early.sync()
+    early.fetch_page = pages([trades[k] for k in held_back])
+    positions, _ = early.sync()
+    assert positions_equal(positions, held(batch)), (seed, method)
+
+    # workers share the database: trades another worker stored first still reach this one's books
+    shared = os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3')
+    first = TradeLedger(shared, pages(trades[:200]), method=method)
+    first.sync()
+    TradeLedger(shared, pages(trades[:300]), method=method).sync()
+    first.fetch_page = pages(trades[200:])
+    positions, _ = first.sync()
+    assert positions_equal(positions, held(batch)), (seed, method)
+
+
+def check_marks(seed: int):
+    rng = random.Random(seed)
+    trades = synthetic_trades(300, 6, seed)
+    book = PnLBook('fifo')
+    prices = {}
+    for trade in trades:
+        book.apply(trade)
+        if rng.random() < 0.5:
+            prices[trade['pair']] = float(trade['price']) * rng.uniform(0.9, 1.1)
+            book.mark(trade['pair'], prices[trade['pair']])
+    expected = sum(book.books[pair].unrealized(price) for pair, price in prices.items())
+    assert close(book.unrealized, expected), (seed, book.unrealized, expected)
+    assert close(book.realized, sum(b.realized for b in book.books.values()))
+
+
+def check_recorded_history():
+    '''The fixture history through service.fetch_trades_page, paged by the fake Kraken.'''
+    import fake_kraken
+    import utils
+    from service import fetch_trades_page
+
+    trades = fake_kraken.load_trades_fixture()
+    state = {**fake_kraken.DEFAULT_STATE, 'trades': trades}
+    server = fake_kraken.serve(state=state)
+    utils.KRAKEN_API_URL = server.url
+
+    batch = PnLBook('fifo')
+    for trade in sorted(trades.values(), key=lambda t: float(t['time'])):
+        batch.apply(trade)
+
+    ledger = TradeLedger(os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3'), fetch_trades_page, method='fifo')
+    positions, error = ledger.sync()
+    assert error is None, error
+    assert sum(position['trades'] for position in positions.values()) == len(trades) > fake_kraken.TRADES_PAGE_SIZE
+    assert positions_equal(positions, held(batch))
+
+    # what build_portfolio reports: the ledger marked at Ticker prices
+    prices = {pair: float(info['c'][0]) for pair, info in fake_kraken.DEFAULT_STATE['ticker'].items()}
+    totals = ledger.mark(prices)
+    assert close(totals['unrealized'], sum(unrealized_profit_loss(positions[pair], price) for pair, price in prices.items()))
+    assert close(totals['realized'], sum(position['realized'] for position in positions.values()))
+    server.shutdown()
+
+
+def bench(n: int, pairs: int):
+    trades = synthetic_trades(n, pairs, seed=1)
+    print(f'{n:,} trades over {pairs} pairs')
+
+    for method in METHODS:
+        book = PnLBook(method)
+        started = time.perf_counter()
+        for trade in trades:
+            book.apply(trade)
+        elapsed = time.perf_counter() - started
+        totals = book.totals()
+        print(f'  engine  {method:8s} {elapsed * 1000:8.1f} ms  {n / elapsed:10,.0f} trades/s'
+              f'  realized {totals["realized"]:14,.2f}  fees {totals["fees"]:12,.2f}')
+
+    path = os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3')
+    ledger = TradeLedger(path, pages(trades), method='fifo')
+    started = time.perf_counter()
+    ledger.sync()
+    elapsed = time.perf_counter() - started
+    print(f'  ledger  first sync {elapsed * 1000:8.1f} ms  {n / elapsed:10,.0f} trades/s (SQLite inserts included)')
+    ledger.close()
+
+    restarted = TradeLedger(path, pages([]), method='fifo')
+    started = time.perf_counter()
+    restarted._connect()
+    elapsed = time.perf_counter() - started
+    print(f'  ledger  restart    {elapsed * 1000:8.1f} ms  {n / elapsed:10,.0f} trades/s replayed')
+
+    book = restarted.book
+    rng = random.Random(2)
+    names = list(book.books)
+    ticks = [(rng.choice(names), rng.uniform(1, 1000)) for _ in range(n)]
+    started = time.perf_counter()
+    for pair, price in ticks:
+        book.mark(pair, price)
+    elapsed = time.perf_counter() - started
+    print(f'  marks   {elapsed * 1000:8.1f} ms  {n / elapsed:10,.0f} ticks/s  unrealized {book.unrealized:14,.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trades', type=int, default=100_000)
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    for seed in range(args.rounds):
+        check_fifo_brute_force(seed)
+        check_average_cost(seed)
+        check_methods_agree(seed)
+        check_marks(seed)
+    for seed in range(max(args.rounds // 20, 1)):
+        for method in METHODS:
+            check_incremental(seed, method)
+    print(f'{args.rounds} random histories: FIFO, average cost, chunked, restarted, late and marked books agree')
+
+    check_recorded_history()
+    print('recorded history: paged sync from the fake Kraken matches a single in-order pass')
+
+    bench(args.trades, args.pairs)
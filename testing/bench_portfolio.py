@@ -0,0 +1,102 @@
+'''
+Portfolio metrics: the previous per-method Python loops vs the columnar view.
+
+    python testing/bench_portfolio.py --sizes 10000 100000
+
+"cold" includes building the columns from the token list, "warm" reuses
+them (the common case: several metrics, or summary(), per portfolio).
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from entities.Token import Token
+from entities.Portfolio import Portfolio, SECTORS
+
+
+def legacy_stablecoin_ratio(tokens):
+    total_value = sum(t.holding_amount * t.price for t in tokens)
+    if total_value == 0:
+        return 0.0
+    stable_value = sum(t.holding_amount * t.price for t in tokens if t.is_stablecoin)
+    return stable_value / total_value
+
+def legacy_sector_allocation(tokens):
+    total_value = sum(t.holding_amount * t.price for t in tokens)
+    if total_value == 0:
+        return {}
+    alloc = {}
+    for t in tokens:
+        val = t.holding_amount * t.price
+        alloc[t.sector] = alloc.get(t.sector, 0) + val
+    return {k: v/total_value for k, v in alloc.items()}
+
+def legacy_hhi(tokens):
+    total_value = sum(t.holding_amount * t.price for t in tokens)
+    if total_value == 0:
+        return 0.0
+    weights = [(t.holding_amount * t.price) / total_value for t in tokens if t.holding_amount > 0]
+    return sum(w**2 for w in weights)
+
+
+def make_tokens(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    tokens = []
+    for i in range(n):
+        sector = rng.choice(SECTORS)
+        tokens.append(Token(
+            symbol=f'T{i}', name=f'Token {i}', price=rng.lognormvariate(0, 3),
+            volume_24h=0.0, market_cap=0.0, circulating_supply=0.0, change_24h=0.0,
+            change_percent_24h=0.0, rank=i, holding_amount=rng.random() if rng.random() > 0.1 else 0.0,
+            sector=sector, is_stablecoin=sector == 'Stablecoin'
+        ))
+    return tokens
+
+
+def timed(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def close(a, b):
+    return abs(a - b) <= 1e-9 * max(1.0, abs(a), abs(b))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        tokens = make_tokens(n)
+
+        legacy_time, legacy = timed(lambda: (
+            legacy_stablecoin_ratio(tokens), legacy_sector_allocation(tokens), legacy_hhi(tokens)
+        ), args.repeat)
+
+        def cold():
+            portfolio = Portfolio(tokens)
+            return portfolio.summary()
+
+        portfolio = Portfolio(tokens)
+        portfolio.summary()
+
+        cold_time, summary = timed(cold, args.repeat)
+        warm_time, _ = timed(portfolio.summary, args.repeat)
+
+        assert close(summary['stablecoin_ratio'], legacy[0])
+        assert all(close(summary['sector_allocation'][k], v) for k, v in legacy[1].items())
+        assert close(summary['hhi'], legacy[2])
+
+        print(f'{n:>8} positions  loops {legacy_time * 1000:9.2f} ms  '
+              f'columnar cold {cold_time * 1000:8.2f} ms ({legacy_time / cold_time:5.1f}x)  '
+              f'warm {warm_time * 1000:7.3f} ms ({legacy_time / warm_time:7.1f}x)')
@@ -0,0 +1,177 @@
+'''
+Kraken call counter pacing, simulated on a fake clock: several voice sessions
+fetching portfolios (Balance + TradesHistory) and placing orders, sent either
+as they come or through CallCounterScheduler.
+
+    python testing/bench_rate_limit.py --sessions 4 --seconds 600 --tier starter
+
+Both runs are replayed through an independent model of Kraken's counter to
+count the calls it would reject. The scheduled run must have none, and no
+read may be sent while an order is waiting.
+
+First checks that a call giving up on the rate limit comes back as a Kraken
+error from the service calls, and that a portfolio read gives up by its
+deadline rather than after KRAKEN_RATE_LIMIT_MAX_WAIT.
+'''
+import argparse
+import asyncio
+import base64
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+os.environ.setdefault('KRAKEN_PUBLIC_KEY', 'bench')
+os.environ.setdefault('KRAKEN_PRIVATE_KEY', base64.b64encode(b'bench-secret').decode())
+os.environ.setdefault('TRADE_LEDGER_PATH', os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3'))
+os.environ.setdefault('PAIR_REGISTRY_PATH', os.path.join(tempfile.mkdtemp(), 'pairs.json'))
+
+from rate_limiter import CallCounterScheduler, TIERS, CALL_COSTS
+
+PORTFOLIO = ['/0/private/Balance', '/0/private/TradesHistory']
+ORDER = '/0/private/AddOrder'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def workload(sessions: int, seconds: float, interval: float, burst: int, order_share: float, seed: int = 3):
+    '''
+    (time, path) calls: every ~interval seconds a session has a turn that
+    reads the portfolio up to `burst` times within two seconds (portfolio,
+    recommendation, stream), sometimes followed by an order.
+    '''
+    rng = random.Random(seed)
+    calls = []
+    for _ in range(sessions):
+        t = rng.uniform(0, interval)
+        while t < seconds:
+            for _ in range(rng.randint(1, burst)):
+                calls.extend((t + rng.uniform(0, 2), path) for path in PORTFOLIO)
+            if rng.random() < order_share:
+                calls.append((t + rng.uniform(2, 5), ORDER))
+            t += rng.expovariate(1 / interval)
+    return sorted(calls)
+
+
+def rejected(sent, max_counter: float, decay: float, costs) -> int:
+    '''Calls Kraken would reject, given (time, path) in send order.'''
+    counter, last, rejections = 0.0, 0.0, 0
+    for t, path in sent:
+        counter = max(0.0, counter - (t - last) * decay)
+        last = t
+        cost = costs.get(path, 1)
+        if counter + cost > max_counter + 1e-9:
+            rejections += 1
+        else:
+            counter += cost
+    return rejections
+
+
+def simulate(calls, tier: str, costs):
+    clock = Clock()
+    scheduler = CallCounterScheduler.for_tier(tier, costs=costs, clock=clock)
+    pending = list(reversed(calls))
+    tickets = []
+    delay = None
+
+    while pending or delay is not None:
+        next_arrival = pending[-1][0] if pending else float('inf')
+        next_admit = clock.now + delay if delay is not None else float('inf')
+        clock.now = min(next_arrival, next_admit)
+
+        while pending and pending[-1][0] <= clock.now:
+            tickets.append(scheduler.submit(pending.pop()[1]))
+
+        delay = scheduler.admit()
+        assert scheduler.counter <= scheduler.max_counter + 1e-9
+
+    return tickets, scheduler.stats()
+
+
+def overtaken_orders(tickets) -> int:
+    '''Orders some read was sent ahead of while the order waited.'''
+    orders = [t for t in tickets if t.path == ORDER]
+    reads = [t.admitted_at for t in tickets if t.path != ORDER]
+    return sum(any(o.queued_at < r < o.admitted_at for r in reads) for o in orders)
+
+
+def check_timeouts():
+    '''Against the fake Kraken with a counter that is full and barely decays.'''
+    import fake_kraken
+    import utils
+
+    server = fake_kraken.serve()
+    utils.KRAKEN_API_URL = server.url
+    utils.rate_limiter = CallCounterScheduler(max_counter=1, decay=0.001)
+    utils.rate_limiter.counter = 1
+
+    import aio_service
+    import service
+
+    utils.RATE_LIMIT_MAX_WAIT = 0.2
+    result, error = service.retrieve_balance()
+    assert result is None and error[0].startswith('EAPI:Rate limit exceeded'), error
+    result, error = asyncio.run(aio_service.retrieve_balance())
+    assert result is None and error[0].startswith('EAPI:Rate limit exceeded'), error
+
+    utils.RATE_LIMIT_MAX_WAIT = 30
+    for retrieve in (service.retrieve_portfolio, lambda deadline: asyncio.run(aio_service.retrieve_portfolio(deadline))):
+        started = time.monotonic()
+        result, error = retrieve(deadline=0.5)
+        assert result is None and error, error
+        assert time.monotonic() - started < 2, 'queued portfolio calls outlived the deadline'
+
+    # the queued TradesHistory gave up too, cancelled or timed out, nothing is left ahead of the next caller
+    time.sleep(0.5)
+    assert not utils.rate_limiter._queue
+    server.shutdown()
+
+
+def report(label, tickets, stats, max_counter, decay, costs):
+    sent = sorted((t.admitted_at, t.path) for t in tickets)
+    print(f'{label}: {len(sent)} calls, {rejected(sent, max_counter, decay, costs)} rejected by the counter model')
+    for name, waits in stats['wait'].items():
+        print(f'    {name:6s} avg wait {waits["avg_wait"]:7.2f} s  max {waits["max_wait"]:7.2f} s  ({waits["admitted"]} calls)')
+    print(f'    max queue depth {stats["max_queue_depth"]}')
+    return sent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=600)
+    parser.add_argument('--interval', type=float, default=90, help='mean seconds between turns per session')
+    parser.add_argument('--burst', type=int, default=3, help='most portfolio reads per turn')
+    parser.add_argument('--orders', type=float, default=0.3, help='share of portfolio requests followed by an order')
+    parser.add_argument('--tier', choices=list(TIERS), default='starter')
+    args = parser.parse_args()
+
+    check_timeouts()
+    print('rate limit timeouts come back as errors, portfolio reads give up by their deadline')
+
+    max_counter, decay = TIERS[args.tier]
+    calls = workload(args.sessions, args.seconds, args.interval, args.burst, args.orders)
+
+    print(f'{args.tier}: counter max {max_counter}, decay {decay}/s, offered load '
+          f'{sum(CALL_COSTS.get(p, 1) for _, p in calls) / args.seconds:.2f}/s')
+    print(f'unpaced: {len(calls)} calls, {rejected(calls, max_counter, decay, CALL_COSTS)} rejected by the counter model')
+
+    tickets, stats = simulate(calls, args.tier, CALL_COSTS)
+    sent = report('scheduled', tickets, stats, max_counter, decay, CALL_COSTS)
+    assert rejected(sent, max_counter, decay, CALL_COSTS) == 0
+    assert stats['wait']['orders']['max_wait'] == 0
+
+    # even if orders did count against the counter, they would only wait for room, never for queued reads
+    costs = {**CALL_COSTS, ORDER: 1}
+    tickets, stats = simulate(calls, args.tier, costs)
+    sent = report('scheduled, orders costing 1', tickets, stats, max_counter, decay, costs)
+    assert rejected(sent, max_counter, decay, costs) == 0
+    assert overtaken_orders(tickets) == 0
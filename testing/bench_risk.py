@@ -0,0 +1,198 @@
+'''
+OHLC store and portfolio risk: correctness against straightforward reference
+computations, then timing of /api/v1/portfolio/risk's work on a large store.
+
+    python testing/bench_risk.py --pairs 300 --years 3
+
+Checks: stored bars survive out of order, duplicate and interrupted appends;
+update() fetches only what Kraken can have committed (against the fake
+Kraken); pairwise correlation, volatility, rolling volatility, VaR/CVaR and
+max drawdown match per-pair loops on pairs with different history lengths,
+the portfolio figures only over the bars every pair has.
+'''
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+os.environ.setdefault('KRAKEN_PUBLIC_KEY', 'bench')
+os.environ.setdefault('KRAKEN_PRIVATE_KEY', base64.b64encode(b'bench-secret').decode())
+os.environ.setdefault('TRADE_LEDGER_PATH', os.path.join(tempfile.mkdtemp(), 'ledger.sqlite3'))
+os.environ.setdefault('PAIR_REGISTRY_PATH', os.path.join(tempfile.mkdtemp(), 'pairs.json'))
+os.environ['KRAKEN_TIER'] = 'off'
+
+HOUR = 3600
+
+
+def synthetic_bars(start: int, n: int, seed: int, step: int = HOUR) -> np.ndarray:
+    '''(n, 8) OHLC rows of a random walk.'''
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    times = start + step * np.arange(n)
+    return np.column_stack([times, close, close * 1.001, close * 0.999, close, close, rng.uniform(1, 10, n), rng.integers(1, 100, n)])
+
+
+def check_store():
+    from ohlc_store import OHLCStore
+
+    store = OHLCStore(tempfile.mkdtemp(), fetch_ohlc=None)
+    rows = synthetic_bars(1_700_000_000, 100, seed=1)
+    assert store.append('XBTUSD', 60, rows[50:]) == 50
+    assert store.append('XBTUSD', 60, rows[:60]) == 0, 'bars older than the last stored one are ignored'
+    shuffled = rows[np.r_[99, 99, 10:99][::-1]].copy()
+    assert store.append('XBTUSD', 60, np.vstack([rows[:50], rows[60:]])) == 0
+
+    other = OHLCStore(tempfile.mkdtemp(), fetch_ohlc=None)
+    assert other.append('XBTUSD', 60, shuffled) == 90
+    bars = other.bars('XBTUSD', 60, ('time', 'close', 'count'))
+    assert np.array_equal(bars['time'], rows[10:, 0].astype(np.int64))
+    assert np.array_equal(bars['close'], rows[10:, 4])
+
+    # an append cut short after some columns: the partial row is not visible and is overwritten
+    with open(os.path.join(other._dir('XBTUSD', 60), 'time.bin'), 'ab') as f:
+        f.write(np.int64(2_000_000_000).tobytes())
+    assert other.last_time('XBTUSD', 60) == int(rows[-1, 0])
+    assert other.append('XBTUSD', 60, synthetic_bars(int(rows[-1, 0]) + HOUR, 5, seed=2)) == 5
+    assert len(other.bars('XBTUSD', 60)['time']) == 95
+
+    # strings, as Kraken sends them
+    kraken_rows = [[int(r[0]), *(f'{x:.5f}' for x in r[1:7]), int(r[7])] for r in synthetic_bars(1_700_000_000, 3, seed=3)]
+    assert other.append('SOLUSD', 60, kraken_rows) == 3
+
+
+def check_updates():
+    import fake_kraken
+    import utils
+    from ohlc_store import OHLCStore
+
+    server = fake_kraken.serve()
+    utils.KRAKEN_API_URL = server.url
+    from risk import fetch_ohlc
+
+    now = [time.time()]
+    store = OHLCStore(tempfile.mkdtemp(), fetch_ohlc=fetch_ohlc, clock=lambda: now[0])
+
+    added, error = store.update('XBTUSD', 60)
+    assert error is None and added == fake_kraken.OHLC_MAX_BARS - 1, (added, error)
+    assert store.update('XBTUSD', 60) == (0, None) and server.paths['/0/public/OHLC'] == 1, 'up to date, no request'
+
+    last = store.last_time('XBTUSD', 60)
+    now[0] = last + 2 * HOUR + 1
+    assert store.update('XBTUSD', 60)[1] is None
+    assert server.paths['/0/public/OHLC'] == 2
+    times = store.bars('XBTUSD', 60)['time']
+    assert np.all(np.diff(times) == HOUR)
+
+    assert store.update('FOOUSD', 60)[1] == ['EQuery:Unknown asset pair']
+    assert store.update('XBTUSD', 7)[1].startswith('Unsupported interval')
+    server.shutdown()
+
+
+def check_metrics():
+    from risk import risk_metrics, align
+    from ohlc_store import OHLCStore
+
+    rng = np.random.default_rng(7)
+    n, pairs = 400, 6
+    store = OHLCStore(tempfile.mkdtemp(), fetch_ohlc=None)
+    start = 1_700_000_000 // HOUR * HOUR
+    names = [f'P{j}' for j in range(pairs)]
+    for j, name in enumerate(names):
+        # staggered listings, history from before the grid, bars off the grid and a few missing bars
+        rows = synthetic_bars(start + (j - 1) * 30 * HOUR + (j % 2) * 600, n - (j - 1) * 30, seed=j)
+        rows = rows[rng.random(len(rows)) > 0.05]
+        store.append(name, 60, rows)
+
+    grid, closes = align(store, names, 60, start, start + (n - 1) * HOUR)
+    for j, name in enumerate(names):
+        bars = store.bars(name, 60)
+        at = np.searchsorted(bars['time'], grid, side='right') - 1
+        assert np.array_equal(closes[:, j], np.where(at >= 0, bars['close'][at], np.nan), equal_nan=True), name
+    weights = rng.dirichlet(np.ones(pairs + 1))[:pairs]
+    window = 48
+    m = risk_metrics(closes, weights, 60, window, 0.95)
+
+    returns = closes[1:] / closes[:-1] - 1
+    annualize = np.sqrt(365 * 24)
+    for i in range(pairs):
+        ri = returns[:, i][np.isfinite(returns[:, i])]
+        assert np.isclose(m['volatility'][i], ri.std(ddof=1) * annualize)
+        for j in range(pairs):
+            both = np.isfinite(returns[:, i]) & np.isfinite(returns[:, j])
+            assert np.isclose(m['correlation'][i, j], np.corrcoef(returns[both, i], returns[both, j])[0, 1]), (i, j)
+
+        peak, worst = -np.inf, 0.0
+        for price in closes[:, i]:
+            if np.isfinite(price):
+                peak = max(peak, price)
+                worst = max(worst, 1 - price / peak)
+        assert np.isclose(m['max_drawdown'][i], worst)
+
+    # the portfolio series starts once every pair has a return
+    start = max(np.flatnonzero(np.isfinite(returns[:, j]))[0] for j in range(pairs))
+    assert m['portfolio_start'] == start > 0
+    portfolio = returns[start:] @ weights
+    assert np.isfinite(portfolio).all()
+    losses = np.sort(portfolio)
+    var = -np.quantile(portfolio, 0.05)
+    assert np.isclose(m['var'], var)
+    assert np.isclose(m['cvar'], -losses[losses <= -var].mean())
+    rolling = [portfolio[k - window:k].std(ddof=1) * annualize for k in range(window, len(portfolio) + 1)]
+    assert np.allclose(m['rolling_volatility'], rolling)
+    assert np.isclose(m['portfolio_volatility_window'], rolling[-1])
+    assert np.isclose(m['portfolio_volatility'], portfolio.std(ddof=1) * annualize)
+    value = np.cumprod(np.r_[1.0, 1 + portfolio])
+    assert np.isclose(m['portfolio_max_drawdown'], np.max(1 - value / np.maximum.accumulate(value)))
+
+
+def bench(pairs: int, years: float, repeat: int):
+    from risk import risk_metrics, align, rounded
+    from ohlc_store import OHLCStore
+
+    store = OHLCStore(tempfile.mkdtemp(), fetch_ohlc=None)
+    bars = int(years * 365 * 24)
+    end = 1_760_000_000 // HOUR * HOUR
+    names = [f'P{j}USD' for j in range(pairs)]
+
+    started = time.perf_counter()
+    for j, name in enumerate(names):
+        # a quarter of the pairs listed part way through
+        length = bars if j % 4 else bars // (2 + j % 3)
+        store.append(name, 60, synthetic_bars(end - (length - 1) * HOUR, length, seed=j))
+    print(f'store: {pairs} pairs x up to {bars} hourly bars written in {time.perf_counter() - started:.1f} s')
+
+    weights = np.full(pairs, 0.9 / pairs)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        grid, closes = align(store, names, 60, end - int(years * 365 * 86400), end)
+        aligned = time.perf_counter() - started
+        metrics = risk_metrics(closes, weights, 60, 30 * 24, 0.95)
+        computed = time.perf_counter() - started
+        payload = json.dumps({'correlation': rounded(metrics['correlation'], 4), 'volatility': rounded(metrics['volatility'])})
+        timings.append((aligned, computed, time.perf_counter() - started))
+
+    aligned, computed, total = min(timings, key=lambda t: t[2])
+    print(f'risk:  {closes.shape[0]} bars x {pairs} pairs  align {aligned * 1000:6.1f} ms  metrics {(computed - aligned) * 1000:6.1f} ms'
+          f'  + JSON {(total - computed) * 1000:6.1f} ms  = {total * 1000:6.1f} ms  ({len(payload) / 1e6:.1f} MB)')
+    print(f'       portfolio VaR95 {metrics["var"]:.4f}  CVaR95 {metrics["cvar"]:.4f}  max drawdown {metrics["portfolio_max_drawdown"]:.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=300)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    check_store()
+    check_updates()
+    check_metrics()
+    print('store, incremental updates and metrics match the reference computations')
+    bench(args.pairs, args.years, args.repeat)
@@ -0,0 +1,101 @@
+'''
+Sector classification: the previous nested-scan map_to_sector vs the
+compiled SectorClassifier, checked for identical output first.
+
+    python testing/bench_sectors.py --tokens 10000
+
+The corpus mixes the recorded CoinGecko categories with random category
+lists built from keyword fragments, so overlapping and multi-keyword
+categories (e.g. "GMCI 30 Index" containing "dex") are exercised.
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from RAG.sector_classifier import SectorClassifier
+
+
+def legacy_map_to_sector(tags, symbol):
+    SECTOR_MAP = {
+        "Layer 1": "Layer1",
+        "L1": "Layer1",
+        "Smart Contract Platform": "Layer1",
+        "Layer 2": "Layer2",
+        "L2": "Layer2",
+        "DeFi": "DeFi",
+        "Lending/Borrowing": "DeFi",
+        "DEX": "DeFi",
+        "Gaming": "Gaming",
+        "GameFi": "Gaming",
+        "NFT": "Gaming",
+        "Meme": "Memecoin",
+    }
+
+    if symbol.upper() in ["USDT", "USDC", "DAI", "BUSD", "TUSD"]:
+        return "Stablecoin"
+
+    for tag in tags:
+        for key, sector in SECTOR_MAP.items():
+            if key.lower() in tag.lower():
+                return sector
+    return "Noname"
+
+
+def corpus(n: int, seed: int = 5):
+    with open(os.path.join(ROOT, 'RAG', 'fixtures', 'coingecko.json')) as f:
+        recorded = [coin['categories'] for coin in json.load(f)['coins'].values()]
+
+    rng = random.Random(seed)
+    fragments = ['layer', ' 1', ' 2', 'l1', 'L2', 'DeFi', 'dex', 'Index', 'lending/borrowing', 'game', 'Fi', 'nft',
+                 'MEME', 'smart contract platform', 'Ecosystem', 'Solana', 'Portfolio', '(', ')', ' ', 'x']
+    fuzz = [''.join(rng.choice(fragments) for _ in range(rng.randint(1, 5))) for _ in range(500)]
+    # most real categories are ecosystems, funds and indexes that name no sector
+    neutral = [f'{name} {kind}' for name in ('Avalanche', 'Polygon', 'Base', 'Cosmos', 'Tron', 'Sui', 'Aptos', 'Arbitrum')
+               for kind in ('Ecosystem', 'Ventures Portfolio', 'Capital Portfolio', 'Holdings')] + [f'Project {i} Ecosystem' for i in range(300)]
+    pool = [cat for cats in recorded for cat in cats] + neutral
+    symbols = ['BTC', 'ETH', 'usdt', 'DAI', 'SOL', 'XYZ']
+
+    items = [(cats, 'ETH') for cats in recorded]
+    while len(items) < n:
+        cats = rng.sample(pool, rng.randint(0, 20))
+        if rng.random() < 0.2:
+            cats += rng.sample(fuzz, rng.randint(1, 3))
+        items.append((cats, rng.choice(symbols)))
+    return items
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', type=int, default=10_000)
+    args = parser.parse_args()
+
+    items = corpus(args.tokens)
+    tags, symbols = [t for t, _ in items], [s for _, s in items]
+
+    legacy_time, expected = timed(lambda: [legacy_map_to_sector(t, s) for t, s in items])
+
+    classifier = SectorClassifier.from_yaml()
+    cold_time, cold = timed(lambda: classifier.classify_many(tags, symbols))
+    warm_time, warm = timed(lambda: classifier.classify_many(tags, symbols))
+
+    mismatches = [(t, s, e, c) for (t, s), e, c in zip(items, expected, cold) if e != c]
+    assert not mismatches, mismatches[:5]
+    assert warm == expected
+
+    print(f'{len(items)} tokens, identical output to the previous map_to_sector')
+    print(f'nested scan        {legacy_time * 1000:8.2f} ms')
+    print(f'compiled, cold     {cold_time * 1000:8.2f} ms  ({legacy_time / cold_time:5.1f}x)')
+    print(f'compiled, memoized {warm_time * 1000:8.2f} ms  ({legacy_time / warm_time:5.1f}x)')
+    print(classifier.cache_info())
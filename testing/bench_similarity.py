@@ -0,0 +1,79 @@
+'''
+Exact vs IVF similarity index: build time, query latency and recall@k.
+
+    python testing/bench_similarity.py --size 100000 --dim 384 --k 10
+
+Vectors are drawn around random cluster centres, like token embeddings that
+group by sector and ecosystem. Recall@k is measured against ExactIndex.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from RAG.similarity_index import ExactIndex, IVFIndex, build_index, load_index
+
+
+def clustered(size: int, dim: int, clusters: int, noise: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return centres[rng.integers(0, clusters, size)] + noise * rng.standard_normal((size, dim)).astype(np.float32)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=3.0, help='spread around each cluster centre, higher is harder')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    vectors = clustered(args.size + args.queries, args.dim, args.clusters, args.noise)
+    base, queries = vectors[:args.size], vectors[args.size:]
+    ids = list(range(args.size))
+
+    build_exact, exact = timed(lambda: build_index(ids, base, kind='exact'))
+    build_ivf, ivf = timed(lambda: build_index(ids, base, kind='ivf'))
+    print(f'{args.size} x {args.dim}, {args.queries} queries, k={args.k}')
+    print(f'build   exact {build_exact:6.2f} s   ivf {build_ivf:6.2f} s ({len(ivf.centroids)} lists)')
+
+    exact_time, truth = timed(lambda: [[id for id, _ in exact.search(q, args.k)] for q in queries])
+    print(f'exact              {exact_time / args.queries * 1000:7.3f} ms/query  recall@{args.k} 1.000')
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        ivf_time, found = timed(lambda: [[id for id, _ in ivf.search(q, args.k)] for q in queries])
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(truth, found)])
+        print(f'ivf nprobe={nprobe:<4d}    {ivf_time / args.queries * 1000:7.3f} ms/query  recall@{args.k} {recall:.3f}')
+
+    # incremental updates and a save/load round trip keep answers identical
+    exact.remove(ids[:1000])
+    ivf.remove(ids[:1000])
+    exact.add(ids[:1000], base[:1000])
+    ivf.add(ids[:1000], base[:1000])
+
+    with tempfile.TemporaryDirectory() as directory:
+        for index in (exact, ivf):
+            path = os.path.join(directory, f'{index.kind}.npz')
+            index.save(path)
+            loaded = load_index(path)
+            assert type(loaded) is type(index) and len(loaded) == len(index)
+            for q in queries[:20]:
+                assert [id for id, _ in loaded.search(q, args.k)] == [id for id, _ in index.search(q, args.k)]
+
+    assert isinstance(exact, ExactIndex) and isinstance(ivf, IVFIndex)
+    print('add/remove and save/load round trip ok')
@@ -0,0 +1,66 @@
+'''
+Cold start time and peak RSS of a fresh process importing entities.Portfolio.
+
+    python testing/bench_startup.py --runs 3
+
+  lazy     import only, model untouched (compute_hhi / sector_allocation callers)
+  eager    import + get_model(), what every import used to cost
+  prewarm  import + prewarm_model(): time until the caller is unblocked,
+           then the background load is joined before RSS is read
+
+Each mode runs in its own interpreter so nothing is shared between them.
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import entities.Portfolio as P
+mode = sys.argv[1]
+if mode == "eager":
+    P.get_model()
+elif mode == "prewarm":
+    thread = P.prewarm_model()
+ready = time.perf_counter() - started
+if mode == "prewarm":
+    thread.join()
+loaded = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"ready": ready, "loaded": loaded, "rss_kb": rss}))
+'''
+
+
+def run(mode: str):
+    proc = subprocess.run([sys.executable, '-c', CHILD, mode], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode:
+        return None, proc.stderr.strip().splitlines()[-1]
+    return json.loads(proc.stdout.strip().splitlines()[-1]), None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', default=['lazy', 'eager', 'prewarm'])
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        results = []
+        for _ in range(args.runs):
+            result, error = run(mode)
+            if error:
+                print(f'{mode:8s} failed: {error}')
+                break
+            results.append(result)
+
+        if not results:
+            continue
+
+        best = min(results, key=lambda r: r['ready'])
+        print(f'{mode:8s} ready {best["ready"] * 1000:8.1f} ms  loaded {best["loaded"] * 1000:8.1f} ms  '
+              f'peak rss {max(r["rss_kb"] for r in results) / 1024:7.1f} MB')
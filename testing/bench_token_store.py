@@ -0,0 +1,74 @@
+'''
+Token snapshot store: network calls and wall time for a cold load, a warm
+load, a load after prices expire, and an offline warm start.
+
+    python testing/bench_token_store.py --coins 300 --latency 0.05
+
+The store runs on a fake clock so expiry is instant; the fake CoinGecko is
+stopped before the offline load to prove it needs no network.
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--coins', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    from RAG import fake_coingecko
+
+    server = fake_coingecko.serve(synthetic=args.coins, latency=args.latency)
+    os.environ.update(COINGECKO_API_URL=server.url, COINGECKO_CALLS_PER_MINUTE='60000', COINGECKO_CONCURRENCY='8')
+
+    from RAG.onchain_metrics import sync_tokens, load_portfolio
+    from RAG.token_store import TokenStore, MINUTE
+
+    ids = ['bitcoin', 'ethereum', 'tether'] + [f'coin-{i}' for i in range(args.coins)]
+    holdings = {'bitcoin': 0.015, 'tether': 1520.41, 'coin-1': 10.0}
+    clock = Clock()
+    store = TokenStore(os.path.join(tempfile.mkdtemp(), 'tokens.sqlite3'), clock=clock)
+
+    def stats():
+        with urllib.request.urlopen(server.url.replace('/api/v3', '/__stats')) as resp:
+            return json.load(resp)
+
+    def step(label, fn, online=True):
+        before = stats() if online else {}
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        after = stats() if online else {}
+        calls = {key: after[key] - before[key] for key in after} if online else 'server stopped'
+        print(f'{label:22s} {elapsed:7.3f} s  {calls}')
+        return result
+
+    cold = step('cold', lambda: sync_tokens(ids, store=store))
+    step('warm, fresh', lambda: sync_tokens(ids, store=store))
+
+    clock.now += 2 * MINUTE
+    warm = step('prices expired', lambda: sync_tokens(ids, store=store))
+
+    server.shutdown()
+    server.server_close()
+    portfolio = step('offline warm start', lambda: load_portfolio(holdings, offline=True, store=store), online=False)
+
+    assert [t.symbol for t in cold] == [t.symbol for t in warm]
+    assert all((a.sector, a.metadata) == (b.sector, b.metadata) for a, b in zip(cold, warm))
+    print(f'offline portfolio: {len(portfolio.tokens)} tokens, summary {portfolio.summary()}')
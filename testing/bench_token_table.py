@@ -0,0 +1,79 @@
+'''
+Memory per token and construction throughput: the previous plain dataclass
+Token, the slotted Token, and TokenTable.
+
+    python testing/bench_token_table.py --tokens 50000
+
+Memory is what tracemalloc still sees allocated once the loader records are
+dropped, so category strings only the vocabulary keeps count once.
+'''
+import argparse
+import dataclasses
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from entities.Token import Token
+from entities.TokenTable import TokenTable
+
+# the Token class as it was before slots, for comparison
+PlainToken = dataclasses.make_dataclass(
+    'PlainToken',
+    [(f.name, f.type, f) for f in dataclasses.fields(Token)],
+)
+
+CATEGORIES = [
+    'Smart Contract Platform', 'Layer 1 (L1)', 'Ethereum Ecosystem', 'Proof of Stake (PoS)', 'GMCI 30 Index',
+    'Coinbase 50 Index', 'Decentralized Finance (DeFi)', 'Meme', 'Solana Ecosystem', 'BNB Chain Ecosystem',
+] + [f'Category {i}' for i in range(400)]
+
+
+def records(n: int, seed: int = 11):
+    '''Field dicts as they come out of a loader, fresh strings each time like parsed JSON.'''
+    rng = random.Random(seed)
+    for i in range(n):
+        yield dict(
+            symbol=f'T{i}', name=f'Token {i}', price=rng.random() * 100, volume_24h=rng.random() * 1e9,
+            market_cap=rng.random() * 1e10, circulating_supply=rng.random() * 1e9, change_24h=rng.random(),
+            change_percent_24h=rng.random(), rank=i, holding_amount=0.0, weight=0.0,
+            sector=''.join(rng.choice(['Layer1', 'DeFi', 'Gaming', 'Memecoin'])), risk_level=''.join('Mid'),
+            metadata={
+                'categories': [''.join(c) for c in rng.sample(CATEGORIES, rng.randint(5, 25))],
+                'homepage': f'https://token-{i}.example', 'blockchain_site': None, 'genesis_date': None,
+            },
+        )
+
+
+def measure(label: str, build, n: int):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    data = list(records(n))
+    started = time.perf_counter()
+    result = build(data)
+    elapsed = time.perf_counter() - started
+    del data
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f'{label:14s} {size / n:8.0f} bytes/token  {n / elapsed:12,.0f} tokens/s')
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', type=int, default=50_000)
+    args = parser.parse_args()
+
+    measure('plain Token', lambda data: [PlainToken(**r) for r in data], args.tokens)
+    tokens = measure('slotted Token', lambda data: [Token(**r) for r in data], args.tokens)
+    table = measure('TokenTable', lambda data: TokenTable.from_tokens([Token(**r) for r in data]), args.tokens)
+
+    started = time.perf_counter()
+    assert table.to_tokens() == tokens
+    print(f'round trip     {args.tokens / (time.perf_counter() - started):12,.0f} tokens/s back to Token, equal to the input')
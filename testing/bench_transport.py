@@ -0,0 +1,104 @@
+'''
+Pooled transport vs one-connection-per-call urlopen, against the local fake Kraken.
+
+    python testing/bench_transport.py --rounds 50 --handshake-latency 0.03
+
+First checks the dropped-connection rules: an idle connection the server
+closed is replaced before sending, and an order whose response is lost is
+sent once and raised, never resent.
+'''
+import argparse
+import base64
+import http.client
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+os.environ.setdefault('KRAKEN_PUBLIC_KEY', 'bench')
+os.environ.setdefault('KRAKEN_PRIVATE_KEY', base64.b64encode(b'bench-secret').decode())
+# measures the transport, not Kraken's call counter
+os.environ.setdefault('KRAKEN_TIER', 'off')
+
+import fake_kraken
+import utils
+from transport import KrakenSession
+
+CALLS = [
+    ('POST', '/0/private/Balance', None),
+    ('POST', '/0/private/TradesHistory', None),
+    ('GET', '/0/public/Ticker', {'pair': 'XXBTZUSD,SOLUSD'}),
+]
+
+
+def urlopen_call(base: str, method: str, path: str, query):
+    url = base + path + ('?' + urllib.parse.urlencode(query) if query else '')
+    req = urllib.request.Request(method=method, url=url, data=b'{}', headers={'Content-Type': 'application/json'})
+    return urllib.request.urlopen(req).read()
+
+
+def check_dropped_connections():
+    '''A raw server: answers with keep-alive then closes idle sockets, or reads a request and hangs up.'''
+    listener = socket.create_server(('127.0.0.1', 0))
+    received = []
+    mode = {'hang_up': False}
+
+    def serve():
+        while True:
+            conn, _ = listener.accept()
+            request = conn.recv(65536)
+            received.append(request)
+            if not mode['hang_up']:
+                conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    url = f'http://127.0.0.1:{listener.getsockname()[1]}/0/private/AddOrder'
+    session = KrakenSession(backoff=0.001)
+    build = lambda: ({'Content-Length': '2'}, b'{}')
+
+    # the pooled connection is closed by the server after every response
+    for _ in range(3):
+        assert session.request('POST', url, build, retry_server_errors=False).status == 200
+        time.sleep(0.05)
+    assert len(received) == 3 and session.retries == 0
+
+    mode['hang_up'] = True
+    try:
+        session.request('POST', url, build, retry_server_errors=False)
+    except (OSError, http.client.HTTPException):
+        pass
+    else:
+        raise AssertionError('a lost order response must be raised')
+    assert len(received) == 4, 'the order was sent once'
+
+
+def run(label: str, call, rounds: int, server):
+    before = server.connections
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for method, path, query in CALLS:
+            call(method, path, query)
+    elapsed = time.perf_counter() - started
+    print(f'{label:10s} {rounds} portfolio rounds in {elapsed:.3f}s '
+          f'({elapsed / rounds * 1000:.1f} ms/round, {server.connections - before} connections)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--handshake-latency', type=float, default=0.03)
+    args = parser.parse_args()
+
+    check_dropped_connections()
+    print('dropped connections: idle ones replaced, a lost order response is not resent')
+
+    server = fake_kraken.serve(latency=args.latency, handshake_latency=args.handshake_latency)
+
+    run('urlopen', lambda m, p, q: urlopen_call(server.url, m, p, q), args.rounds, server)
+    run('pooled', lambda m, p, q: utils.request(m, p, query=q, environment=server.url).read(), args.rounds, server)
+    print(utils.session.stats())
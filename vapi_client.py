@@ -96,6 +96,62 @@ def cleanup_old_assistants(keep_count: int = 5) -> int:
         print(f"Cleanup failed: {e}")
         return 0
 
+def recommendation_job_tools(server_url: str) -> List[Dict]:
+    """
+    startRecommendation / getRecommendationResult tools. Jobs live in the
+    memory of one backend process, so server_url must be a long-lived
+    server (asgi.py or wsgi.py), not the serverless Vercel deployment
+    where the follow-up GET would land on another instance.
+    """
+    server_url = server_url.rstrip("/")
+    return [
+        {
+            "type": "apiRequest",
+            "function": { "name": "api_request_tool" },
+            "name": "startRecommendation",
+            "url": f"{server_url}/api/v1/recommendation/jobs",
+            "method": "POST",
+            "body": {
+                "type": "object",
+                "properties": {
+                "use_fresh": {
+                    "type": "boolean",
+                    "description": "Ignore cached recommendations"
+                },
+                "snapshot": {
+                    "type": "object",
+                    "description": "Snapshot returned by an earlier recommendation, reused while fresh",
+                    "properties": {
+                    "hash": { "type": "string", "description": "Deterministic snapshot hash" },
+                    "ttl_seconds": { "type": "number", "description": "Freshness window" }
+                    }
+                },
+                "interest": {
+                    "type": "string",
+                    "description": "Optional cryptocurrency the user is interested in"
+                }
+                }
+            }
+        },
+        {
+            "type": "apiRequest",
+            "function": { "name": "api_request_tool" },
+            "name": "getRecommendationResult",
+            "url": f"{server_url}/api/v1/recommendation/jobs/{{{{job_id}}}}",
+            "method": "GET",
+            "body": {
+                "type": "object",
+                "properties": {
+                "job_id": {
+                    "description": "job_id returned by startRecommendation",
+                    "type": "string"
+                }
+                },
+                "required": ["job_id"]
+            }
+        }
+    ]
+
 def create_voice_assistant(
     prompt: str,
     first_message: str = "Hello! How can I help you today?",
@@ -211,7 +267,7 @@ def create_voice_assistant(
                             }
                         },
                         "asof": { "type": "string", "description": "ISO timestamp" },
-                        "hash": { "type": "string", "description": "Deterministic snapshot hash" },
+                        "hash": { "type": "string", "description": "snapshot.hash returned by an earlier recommendation, answered from cache while fresh" },
                         "ttl_seconds": { "type": "number", "description": "Freshness window" }
                         }
                     },
@@ -298,6 +354,11 @@ def create_voice_assistant(
         # }
     }
     
+    # recommendation jobs only work against a long-lived server, not the Vercel deployment
+    server_url = os.getenv("POCKETBROKER_SERVER_URL")
+    if server_url:
+        assistant_body["model"]["tools"].extend(recommendation_job_tools(server_url))
+
     try:
         response = requests.post(
             "https://api.vapi.ai/assistant",
@@ -438,6 +499,8 @@ if __name__ == "__main__":
         - executeBuyOrder(pair, amount, ordertype): Execute crypto buy orders
         - executeSellOrder(pair, amount, ordertype): Execute crypto sell orders  
         - getRecommendation(): Get AI-powered market analysis and recommendations
+        - startRecommendation(): Start the same analysis in the background, returns a job_id right away
+        - getRecommendationResult(job_id): Check whether a started analysis is done and read it
         - getAssetInfo(pair): Get detailed information about specific crypto pairs
 
         MINIMUM TRADING AMOUNTS (Important - Always Check Before Trading):